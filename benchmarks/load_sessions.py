@@ -0,0 +1,341 @@
+"""
+Headless multi-session load harness for an ezmsg-panel Application.
+
+Starts a server (EEGSynth -> TimeSeriesPlot + SpectrumPlot, served by Application)
+on localhost in a subprocess, then opens N Bokeh client sessions over websockets,
+one process each, with no browser. Clients apply every patch they receive; slow
+clients sleep before applying each patch, so the server sees TCP backpressure
+exactly as it would from an overloaded browser. Bokeh has no patch
+acknowledgement, so "consuming" a patch is the only acknowledgement a client gives.
+
+    python benchmarks/load_sessions.py --sessions 1 5 10 20 --out load.json
+    python benchmarks/load_sessions.py --sessions 10 --slow-fraction 0.3 --slow-delay 0.5
+
+Reported per N (Linux only; server stats come from /proc):
+    server_cpu_percent       mean CPU of the server process tree while sessions are open
+    rss_start_mb/rss_end_mb  server RSS after sessions connect and at the end
+    rss_growth_mb_per_min    RSS slope over the measurement window
+    sessions                 per session: patches, bytes, lag behind real time and dropped samples
+                             (lag and dropped samples are measured on the streamed timeseries)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import multiprocessing
+import time
+import urllib.request
+
+from dataclasses import dataclass, field, asdict
+
+import numpy as np
+
+from typing import Any, Dict, List, Optional
+
+from plot_throughput import environment
+
+CDS_TIME_DIM = '__time__'
+PANELS = ['Timeseries', 'Spectrum']
+
+
+def serve(port: int, fs: float, n_ch: int, block: int) -> None:
+    import ezmsg.core as ez
+
+    from ezmsg.panel.application import Application, ApplicationSettings
+    from ezmsg.panel.spectrum import SpectrumPlot, SpectrumPlotSettings
+    from ezmsg.panel.timeseriesplot import TimeSeriesPlot, TimeSeriesPlotSettings
+    from ezmsg.sigproc.synth import EEGSynth, EEGSynthSettings
+
+    class LoadServer(ez.Collection):
+        APP = Application(ApplicationSettings(port = port, name = 'Load Harness'))
+        EEG = EEGSynth(EEGSynthSettings(fs = fs, n_time = block, n_ch = n_ch))
+        TIMESERIES = TimeSeriesPlot(TimeSeriesPlotSettings(time_axis = 'time'))
+        SPECTRUM = SpectrumPlot(SpectrumPlotSettings(time_axis = 'time'))
+
+        def configure(self) -> None:
+            self.APP.panels = {
+                'Timeseries': self.TIMESERIES.app,
+                'Spectrum': self.SPECTRUM.app,
+            }
+
+        def network(self) -> ez.NetworkDefinition:
+            return (
+                (self.EEG.OUTPUT_SIGNAL, self.TIMESERIES.INPUT_SIGNAL),
+                (self.EEG.OUTPUT_SIGNAL, self.SPECTRUM.INPUT_SIGNAL),
+            )
+
+    ez.run(SERVER = LoadServer())
+
+
+@dataclass
+class SessionStats:
+    panel: str
+    delay: float # sec slept before applying each patch
+    connected: bool = False
+    error: Optional[str] = None
+    patches: int = 0
+    nbytes: int = 0
+    errors: int = 0 # Patches the client could not apply
+    samples: int = 0
+    dropped: int = 0 # Samples missing from the streamed time axis
+    lag: float = 0.0 # sec behind the least-delayed patch, at the end of the run
+    max_lag: float = 0.0
+
+    _t_last: Optional[float] = field(default = None, repr = False)
+    _min_delay: float = field(default = float('inf'), repr = False)
+    _fs: Optional[float] = field(default = None, repr = False)
+
+    def on_time(self, t: 'np.ndarray') -> None:
+        if len(t) == 0:
+            return
+        if len(t) > 1:
+            self._fs = 1.0 / float(np.median(np.diff(t)))
+        if self._fs and self._t_last is not None:
+            gaps = np.diff(np.concatenate([[self._t_last], t])) * self._fs
+            self.dropped += int(np.sum(np.maximum(np.round(gaps) - 1, 0)))
+        self._t_last = float(t[-1])
+        self.samples += len(t)
+        # Sample times have an unknown origin; the least-delayed arrival so far sets it
+        delay = time.perf_counter() - self._t_last
+        self._min_delay = min(self._min_delay, delay)
+        self.lag = delay - self._min_delay
+        self.max_lag = max(self.max_lag, self.lag)
+
+    def report(self) -> Dict[str, Any]:
+        return { k: v for k, v in asdict(self).items() if not k.startswith('_') }
+
+
+def message_bytes(msg: Any) -> int:
+    nbytes = len(msg.header_json) + len(msg.metadata_json) + len(msg.content_json)
+    for buf in getattr(msg, 'buffers', []):
+        nbytes += len(buf.to_bytes()) if hasattr(buf, 'to_bytes') else len(buf)
+    return nbytes
+
+
+def run_client(url: str, stats: SessionStats, ready: Any, stop: Any, results: Any) -> None:
+    import panel.models # Registers panel's Bokeh models for deserialization
+
+    from bokeh.client import pull_session
+    from bokeh.events import DocumentReady
+    from bokeh.document.events import ColumnDataChangedEvent, ColumnsStreamedEvent
+    from tornado.ioloop import IOLoop
+
+    def merge_columns(doc: Any, event: ColumnDataChangedEvent) -> None:
+        # BokehJS merges changed columns into the source; the Python client replaces them all
+        event.model.set_from_json('data', { **event.model.data, **event.data }, setter = event.setter)
+
+    ColumnDataChangedEvent._handle_event = staticmethod(merge_columns)
+
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    loop = IOLoop()
+    try:
+        session = pull_session(url = url, io_loop = loop)
+    except Exception as e:
+        stats.error = repr(e)
+        ready.release()
+        results.put(stats.report())
+        return
+    stats.connected = True
+    ready.release()
+
+    handle_patch = session._handle_patch
+
+    def on_patch(msg: Any) -> None:
+        if stats.delay > 0:
+            time.sleep(stats.delay) # Blocks reads from the socket, like a busy browser
+        stats.patches += 1
+        stats.nbytes += message_bytes(msg)
+        try:
+            handle_patch(msg)
+        except Exception:
+            stats.errors += 1
+
+    def on_change(event: Any) -> None:
+        if isinstance(event, ColumnsStreamedEvent) and CDS_TIME_DIM in event.data:
+            stats.on_time(np.asarray(event.data[CDS_TIME_DIM], dtype = float))
+
+    session._handle_patch = on_patch
+    session.document.on_change(on_change)
+    session.document.callbacks.send_event(DocumentReady()) # As a browser would once rendered
+
+    def check_stop() -> None:
+        if stop.is_set():
+            session.close()
+        else:
+            loop.call_later(0.1, check_stop)
+
+    loop.call_later(0.1, check_stop)
+    session._loop_until_closed()
+    results.put(stats.report())
+
+
+def process_tree(pid: int) -> List[int]:
+    pids = [pid]
+    for task in os.listdir(f'/proc/{pid}/task'):
+        try:
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                for child in f.read().split():
+                    pids += process_tree(int(child))
+        except OSError:
+            pass
+    return pids
+
+
+def sample_server(pid: int) -> Dict[str, float]:
+    """ Total CPU seconds and RSS (MB) of a process tree """
+    ticks = os.sysconf('SC_CLK_TCK')
+    cpu, rss = 0.0, 0.0
+    for p in process_tree(pid):
+        try:
+            with open(f'/proc/{p}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / ticks # utime, stime
+            with open(f'/proc/{p}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss += int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    return dict(cpu = cpu, rss = rss)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(url: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('Server exited during startup')
+        try:
+            urllib.request.urlopen(url, timeout = 1.0)
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f'Server did not come up at {url}')
+
+
+def run_load(args: argparse.Namespace, n_sessions: int) -> Dict[str, Any]:
+    port = free_port()
+    base = f'http://localhost:{port}'
+    proc = subprocess.Popen([
+        sys.executable, __file__, '--serve', '--port', str(port),
+        '--fs', str(args.fs), '--channels', str(args.channels), '--block', str(args.block)
+    ], stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+
+    try:
+        wait_for_server(f'{base}/{args.panels[0]}', proc)
+
+        n_slow = int(round(n_sessions * args.slow_fraction))
+        stats = [
+            SessionStats(
+                panel = args.panels[idx % len(args.panels)],
+                delay = args.slow_delay if idx < n_slow else args.fast_delay
+            ) for idx in range(n_sessions)
+        ]
+        # Bokeh documents aren't safe to deserialize into from several threads
+        ctx = multiprocessing.get_context('spawn')
+        ready, stop, queue = ctx.Semaphore(0), ctx.Event(), ctx.Queue()
+        clients = [
+            ctx.Process(target = run_client, args = (f'{base}/{s.panel}', s, ready, stop, queue), daemon = True)
+            for s in stats
+        ]
+        for client in clients:
+            client.start()
+        for _ in clients:
+            ready.acquire(timeout = 60.0)
+        time.sleep(args.warmup)
+
+        samples = [sample_server(proc.pid)]
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.duration:
+            time.sleep(1.0)
+            samples.append(sample_server(proc.pid))
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        reports = [queue.get(timeout = 30.0 + args.slow_delay * 10) for _ in clients]
+        for client in clients:
+            client.join(timeout = 5.0)
+
+    finally:
+        proc.send_signal(signal.SIGINT) # Lets ezmsg shut units down cleanly
+        try:
+            proc.wait(timeout = 10.0)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    rss = np.array([s['rss'] for s in samples])
+    t = np.linspace(0, elapsed, len(rss))
+    slope = float(np.polyfit(t, rss, 1)[0]) * 60 if len(rss) > 1 else 0.0
+    lags = [r['lag'] for r in reports if r['samples']]
+
+    return dict(
+        n_sessions = n_sessions,
+        n_slow = n_slow,
+        n_connected = sum(r['connected'] for r in reports),
+        server_cpu_percent = 100 * (samples[-1]['cpu'] - samples[0]['cpu']) / elapsed,
+        rss_start_mb = float(rss[0]),
+        rss_end_mb = float(rss[-1]),
+        rss_growth_mb_per_min = slope,
+        lag_median = float(np.median(lags)) if lags else None,
+        lag_max = float(np.max(lags)) if lags else None,
+        dropped_total = sum(r['dropped'] for r in reports),
+        patch_errors = sum(r['errors'] for r in reports),
+        sessions = sorted(reports, key = lambda r: -r['delay']),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', nargs = '+', type = int, default = [1, 5, 10, 20])
+    parser.add_argument('--panels', nargs = '+', default = PANELS[:1], choices = PANELS,
+        help = 'apps sessions open, assigned round-robin')
+    parser.add_argument('--fs', type = float, default = 500.0)
+    parser.add_argument('--channels', type = int, default = 8)
+    parser.add_argument('--block', type = int, default = 50)
+    parser.add_argument('--duration', type = float, default = 20.0, help = 'sec measured per N')
+    parser.add_argument('--warmup', type = float, default = 3.0, help = 'sec after connecting before measuring')
+    parser.add_argument('--fast-delay', type = float, default = 0.0, help = 'sec per patch for normal clients')
+    parser.add_argument('--slow-delay', type = float, default = 0.5, help = 'sec per patch for slow clients')
+    parser.add_argument('--slow-fraction', type = float, default = 0.0, help = 'fraction of sessions that are slow')
+    parser.add_argument('--out', help = 'write JSON results here instead of stdout')
+    parser.add_argument('--serve', action = 'store_true', help = argparse.SUPPRESS)
+    parser.add_argument('--port', type = int, help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.fs, args.channels, args.block)
+        return
+
+    results = []
+    for n_sessions in args.sessions:
+        result = run_load(args, n_sessions)
+        results.append(result)
+        lag = result['lag_max']
+        print(f'N={n_sessions} ({result["n_slow"]} slow, {result["n_connected"]} connected): '
+            f'server {result["server_cpu_percent"]:.0f}% cpu, '
+            f'RSS {result["rss_start_mb"]:.0f} -> {result["rss_end_mb"]:.0f} MB '
+            f'({result["rss_growth_mb_per_min"]:+.1f} MB/min), '
+            f'max lag {"-" if lag is None else f"{lag:.2f} s"}, '
+            f'dropped {result["dropped_total"]} samples', file = sys.stderr)
+
+    config = { k: v for k, v in vars(args).items() if k not in ('serve', 'port', 'out') }
+    output = json.dumps(dict(environment = environment(), config = config, results = results), indent = 1)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
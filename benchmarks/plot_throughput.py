@@ -0,0 +1,359 @@
+"""
+End-to-end throughput benchmark for the ezmsg-panel plotting pipeline.
+
+Each plot is driven with synthetic AxisArray input and rendered into in-process
+Bokeh documents (one per simulated session; no browser or server). Periodic
+callbacks are run on a simulated clock so results don't depend on timer jitter.
+Every case runs in its own subprocess so peak RSS is per case.
+
+    python benchmarks/plot_throughput.py --out results.json
+    python benchmarks/plot_throughput.py --plots scrolling --fs 1000 --channels 8 64
+    python benchmarks/plot_throughput.py --compare baseline.json results.json
+
+Reported per case:
+    cpu_per_signal_sec      server CPU seconds spent per second of signal
+    bytes_per_session_sec   serialized document patch bytes per session per second of signal
+    callback_latency_ms     p50/p95/p99/max wall time of one periodic callback
+    peak_rss_mb             peak resident set size of the case's process
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from importlib.metadata import version
+
+import numpy as np
+import panel
+
+from bokeh.document import Document
+from bokeh.document.events import DocumentPatchedEvent
+from bokeh.server.callbacks import NextTickCallback, PeriodicCallback
+from bokeh.protocol import Protocol
+from panel.io.state import set_curdoc
+
+from ezmsg.util.messages.axisarray import AxisArray
+
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+PLOTS = ['scrolling', 'lineplot', 'timeseries', 'spectrum', 'spectrogram']
+
+
+@dataclass
+class Case:
+    plot: str
+    fs: float
+    n_ch: int
+    block: int
+    sessions: int
+    duration: float = 10.0 # sec of signal
+
+
+class Pipeline:
+    """ A plot unit plus whatever processing its collection does before the plot """
+
+    plot: Any
+    view: Callable[[], panel.viewable.Viewable]
+    process: Callable[[AxisArray], Optional[AxisArray]]
+    tasks: List[Callable[[], Any]]
+
+    def __init__(self, name: str) -> None:
+        self.tasks = []
+        self.process = lambda msg: msg
+
+        if name == 'scrolling':
+            from ezmsg.panel.scrollinglineplot import ScrollingLinePlot, ScrollingLinePlotSettings
+            self.plot = ScrollingLinePlot(ScrollingLinePlotSettings(time_axis = 'time'))
+            self.view = self.plot.plot
+            self.tasks = [self.plot.format_frames]
+
+        elif name == 'lineplot':
+            from ezmsg.panel.lineplot import LinePlot, LinePlotSettings
+            self.plot = LinePlot(LinePlotSettings(x_axis = 'time'))
+            self.view = self.plot.plot
+            self.tasks = [self.plot.update_data]
+
+        elif name == 'timeseries':
+            from ezmsg.panel.timeseriesplot import TimeSeriesPlot, TimeSeriesPlotSettings
+            from ezmsg.sigproc.butterworthfilter import butter
+            collection = TimeSeriesPlot(TimeSeriesPlotSettings(time_axis = 'time'))
+            collection.configure()
+            self.plot = collection.PLOT
+            self.view = self.plot.plot
+            self.tasks = [self.plot.format_frames]
+            # The control defaults to no filter; benchmark a typical bandpass instead
+            self.process = butter(axis = 'time', order = 4, cuton = 1.0, cutoff = 30.0).send
+
+        elif name in ('spectrum', 'spectrogram'):
+            from ezmsg.panel.spectrum import SpectrumPlot, SpectrumPlotSettings
+            from ezmsg.panel.spectrogram import SpectrogramPlot, SpectrogramPlotSettings
+            from ezmsg.sigproc.window import windowing
+            from ezmsg.sigproc.spectrum import spectrum
+            if name == 'spectrum':
+                collection = SpectrumPlot(SpectrumPlotSettings(time_axis = 'time'))
+            else:
+                collection = SpectrogramPlot(SpectrogramPlotSettings(time_axis = 'time'))
+            collection.configure()
+            win = collection.WINDOW.SETTINGS
+            spec = collection.SPECTRUM.SETTINGS
+            window_gen = windowing(axis = win.axis, window_dur = win.window_dur, window_shift = win.window_shift)
+            spectrum_gen = spectrum(axis = spec.axis, out_axis = spec.out_axis,
+                window = spec.window, transform = spec.transform, output = spec.output)
+
+            def process(msg: AxisArray) -> Optional[AxisArray]:
+                windowed = window_gen.send(msg)
+                if windowed.data.shape[windowed.get_axis_idx('win')] == 0:
+                    return None
+                return spectrum_gen.send(windowed)
+
+            self.plot = collection.PLOT
+            self.view = self.plot.plot
+            self.tasks = [self.plot.update_data] if name == 'spectrum' else []
+            self.process = process
+
+        else:
+            raise ValueError(f'Unknown plot {name}')
+
+        self.plot._instantiate_state()
+        self.plot.initialize()
+
+
+class TrackingExecutor(ThreadPoolExecutor):
+    """ Default executor that knows what's in flight, so the benchmark can wait for offloaded work """
+
+    pending: Set[Future]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.pending = set()
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        future = super().submit(fn, *args, **kwargs)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    async def settle(self) -> None:
+        """ Run unit tasks until none of them is waiting on work they handed to the executor """
+        while True:
+            # A task resumes a couple of loop iterations after its work finishes
+            for _ in range(3):
+                await asyncio.sleep(0)
+            if not self.pending:
+                return
+            await asyncio.wait([asyncio.wrap_future(future) for future in list(self.pending)])
+
+
+class Session:
+    """ Stand-in for a browser session: a Document whose periodic callbacks we run ourselves """
+
+    doc: Document
+    callbacks: List[Tuple[Callable[[], Any], int]]
+    events: List[Any]
+    nbytes: int
+
+    def __init__(self, view: Callable[[], panel.viewable.Viewable]) -> None:
+        self.doc = Document()
+        self.callbacks = []
+        self.events = []
+        self.nbytes = 0
+
+        def capture(callback: Callable[[], Any], period: int = 500, **kwargs: Any) -> None:
+            self.callbacks.append((callback, period))
+
+        add_periodic_callback = panel.state.add_periodic_callback
+        panel.state.add_periodic_callback = capture
+        try:
+            with set_curdoc(self.doc):
+                self.doc.add_root(view().get_root(self.doc))
+        finally:
+            panel.state.add_periodic_callback = add_periodic_callback
+
+        # e.g. FrameScheduler's, added to the document directly
+        self.callbacks += [
+            (cb.callback, cb.period) for cb in self.doc.session_callbacks if isinstance(cb, PeriodicCallback)
+        ]
+        # Only patches go to the browser; not e.g. SessionCallbackAdded
+        self.doc.on_change(lambda event: isinstance(event, DocumentPatchedEvent) and self.events.append(event))
+
+    async def run(self, t: float, latencies: List[float]) -> None:
+        """ Run callbacks due at simulated time t (sec), then serialize resulting changes """
+        for callback, period in self.callbacks:
+            if int(t * 1000) % period:
+                continue
+            start = time.perf_counter()
+            with set_curdoc(self.doc):
+                result = callback()
+                if asyncio.iscoroutine(result):
+                    await result
+                # Next tick callbacks it scheduled, e.g. FrameScheduler's flush, count towards it
+                for cb in [cb for cb in self.doc.session_callbacks if isinstance(cb, NextTickCallback)]:
+                    self.doc.remove_next_tick_callback(cb)
+                    cb.callback()
+            latencies.append(time.perf_counter() - start)
+
+        if self.events:
+            msg = Protocol().create('PATCH-DOC', self.events)
+            self.nbytes += len(msg.header_json) + len(msg.content_json)
+            self.nbytes += sum(len(buf.to_bytes()) for buf in msg.buffers)
+            self.events.clear()
+
+    def destroy(self) -> None:
+        for callback in list(self.doc.session_destroyed_callbacks):
+            callback(None)
+
+
+async def run_case(case: Case) -> Dict[str, Any]:
+    executor = TrackingExecutor()
+    asyncio.get_running_loop().set_default_executor(executor)
+    pipeline = Pipeline(case.plot)
+    tasks = [asyncio.create_task(task()) for task in pipeline.tasks]
+    sessions = [Session(pipeline.view) for _ in range(case.sessions)]
+
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((int(case.fs * 2), case.n_ch)) # Reused to keep generation out of the numbers
+    n_blocks = int(case.duration * case.fs / case.block)
+    tick = 0.005 # sec; resolution of the simulated clock
+    latencies: List[float] = []
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    t_next = 0.0
+    for block_idx in range(n_blocks):
+        t = block_idx * case.block / case.fs
+        start = (block_idx * case.block) % (len(data) - case.block)
+        msg = AxisArray(
+            data[start:start + case.block],
+            dims = ['time', 'ch'],
+            axes = { 'time': AxisArray.Axis.TimeAxis(fs = case.fs, offset = t) }
+        )
+        out = pipeline.process(msg)
+        if out is not None:
+            await pipeline.plot.on_signal(out)
+        await executor.settle() # Let unit tasks run, including what they run on worker threads
+
+        t_end = (block_idx + 1) * case.block / case.fs
+        while t_next < t_end:
+            for session in sessions:
+                await session.run(t_next, latencies)
+            t_next = round(t_next + tick, 6)
+
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    for session in sessions:
+        session.destroy()
+    for task in tasks:
+        task.cancel()
+
+    lat_ms = np.array(latencies) * 1e3 if latencies else np.zeros(1)
+    return dict(
+        case = asdict(case),
+        cpu_per_signal_sec = cpu / case.duration,
+        wall_per_signal_sec = wall / case.duration,
+        bytes_per_session_sec = sum(s.nbytes for s in sessions) / case.sessions / case.duration,
+        n_callbacks = len(latencies),
+        callback_latency_ms = {
+            f'p{q}': float(np.percentile(lat_ms, q)) for q in (50, 95, 99)
+        } | { 'max': float(lat_ms.max()) },
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, # KiB on Linux
+    )
+
+
+def environment() -> Dict[str, Any]:
+    env = dict(
+        python = platform.python_version(),
+        platform = platform.platform(),
+        machine = platform.machine(),
+        time = time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    )
+    for pkg in ('ezmsg-panel', 'ezmsg', 'ezmsg-sigproc', 'panel', 'bokeh', 'numpy'):
+        try:
+            env[pkg] = version(pkg)
+        except Exception:
+            env[pkg] = None
+    return env
+
+
+def key(result: Dict[str, Any]) -> Tuple:
+    case = result['case']
+    return (case['plot'], case['fs'], case['n_ch'], case['block'], case['sessions'])
+
+
+def compare(baseline_path: str, results_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = { key(r): r for r in json.load(f)['results'] }
+    with open(results_path) as f:
+        results = json.load(f)['results']
+
+    print(f'{"plot":>10} {"fs":>7} {"ch":>4} {"block":>5} {"sess":>4}  {"cpu":>7} {"bytes":>7} {"p95":>7}')
+    for result in results:
+        base = baseline.get(key(result))
+        if base is None:
+            continue
+        def ratio(get: Callable[[Dict[str, Any]], float]) -> str:
+            return f'{get(result) / get(base):6.2f}x' if get(base) else '      -'
+        print(f'{key(result)[0]:>10} {key(result)[1]:>7g} {key(result)[2]:>4} {key(result)[3]:>5} {key(result)[4]:>4}',
+            ratio(lambda r: r['cpu_per_signal_sec']),
+            ratio(lambda r: r['bytes_per_session_sec']),
+            ratio(lambda r: r['callback_latency_ms']['p95']))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--plots', nargs = '+', default = PLOTS, choices = PLOTS)
+    parser.add_argument('--fs', nargs = '+', type = float, default = [500.0, 2000.0])
+    parser.add_argument('--channels', nargs = '+', type = int, default = [8, 64])
+    parser.add_argument('--blocks', nargs = '+', type = int, default = [10, 100])
+    parser.add_argument('--sessions', nargs = '+', type = int, default = [1, 4])
+    parser.add_argument('--duration', type = float, default = 10.0, help = 'sec of signal per case')
+    parser.add_argument('--out', help = 'write JSON results here instead of stdout')
+    parser.add_argument('--compare', nargs = 2, metavar = ('BASELINE', 'RESULTS'),
+        help = 'print ratios of RESULTS to BASELINE and exit')
+    parser.add_argument('--case', help = argparse.SUPPRESS) # Run one JSON-encoded case in this process
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.case:
+        print(json.dumps(asyncio.run(run_case(Case(**json.loads(args.case))))))
+        return
+
+    results = []
+    grid = itertools.product(args.plots, args.fs, args.channels, args.blocks, args.sessions)
+    for plot, fs, n_ch, block, sessions in grid:
+        case = Case(plot, fs, n_ch, block, sessions, args.duration)
+        proc = subprocess.run(
+            [sys.executable, __file__, '--case', json.dumps(asdict(case))],
+            capture_output = True, text = True
+        )
+        if proc.returncode != 0:
+            print(f'{case} failed:\n{proc.stderr}', file = sys.stderr)
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f'{plot:>10} fs={fs:g} ch={n_ch} block={block} sessions={sessions}: '
+            f'{result["cpu_per_signal_sec"]:.3f} cpu-s/s, '
+            f'{result["bytes_per_session_sec"] / 1e3:.1f} kB/session/s, '
+            f'p95 {result["callback_latency_ms"]["p95"]:.2f} ms', file = sys.stderr)
+
+    output = json.dumps(dict(environment = environment(), results = results), indent = 1)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,19 @@
+import re
+import time
+
 from dataclasses import field
+from functools import partial
 
 import panel
 import ezmsg.core as ez
 
-from typing import TYPE_CHECKING, Mapping, Union, Callable, Optional, Dict, Any
+from bokeh.settings import settings as bokeh_settings
+from tornado.httputil import HTTPHeaders, HTTPServerRequest
+from tornado.web import GZipContentEncoding
+
+from .profiling import PROFILER
+
+from typing import TYPE_CHECKING, Mapping, Union, Callable, Optional, Dict, Any, List, Tuple
 
 if TYPE_CHECKING:
     from panel.template.base import BaseTemplate
@@ -12,29 +22,121 @@ if TYPE_CHECKING:
     TViewable = Union[Viewable, Viewer, BaseTemplate]
     TViewableOrFunc = Union[TViewable, Callable[[], TViewable]]
 
+# <link>/<script> tags pointing off-server, e.g. template web fonts
+EXTERNAL_RESOURCE = re.compile(rb'<(?:link|script)\b[^>]*\b(?:href|src)="(?:https?:)?//[^"]*"[^>]*>(?:\s*</script>)?')
+
 class ApplicationSettings(ez.Settings):
     port: Optional[ int ] = None # None => disable server, 0 => choose open port
     name: str = 'ezmsg Panel'
     serve_kwargs: Dict[ str, Any ] = field( default_factory = dict )
 
+    # Serve every BokehJS/Panel/template resource from this server (no CDN or web fonts),
+    # gzipped once per process and cached by browsers so reloads don't refetch them.
+    offline: bool = False
+    cache_max_age: int = 7 * 24 * 3600 # sec; static resources without a version in their URL
+
+
+class ResourceTransform( GZipContentEncoding ):
+    """
+    gzip, with static resources compressed once and reused for every later request
+    (keyed by Etag, which changes with the file), and a Cache-Control header on static
+    resources that don't already have one. Optionally strips external resources from pages.
+    """
+
+    _compressed: Dict[ str, bytes ] = {}
+
+    def __init__( self, request: HTTPServerRequest, cache_max_age: int, strip_external: bool = False ) -> None:
+        super().__init__( request )
+        self._static = '/static/' in request.path
+        self._cache_max_age = cache_max_age
+        self._strip_external = strip_external
+        self._etag: Optional[ str ] = None
+        self._parts: List[ bytes ] = []
+        self._cached = False
+        if self._static:
+            self.GZIP_LEVEL = 9 # Paid once per file
+
+    def transform_first_chunk(
+        self,
+        status_code: int,
+        headers: HTTPHeaders,
+        chunk: bytes,
+        finishing: bool
+    ) -> Tuple[ int, HTTPHeaders, bytes ]:
+        if self._strip_external and finishing and headers.get( 'Content-Type', '' ).startswith( 'text/html' ):
+            chunk = EXTERNAL_RESOURCE.sub( b'', chunk )
+            if 'Content-Length' in headers:
+                headers[ 'Content-Length' ] = str( len( chunk ) )
+
+        if not self._static or status_code != 200:
+            return super().transform_first_chunk( status_code, headers, chunk, finishing )
+
+        if 'Cache-Control' not in headers:
+            headers[ 'Cache-Control' ] = f'public, max-age={self._cache_max_age}'
+
+        etag = headers.get( 'Etag' )
+        cached = self._compressed.get( etag ) if self._gzipping and etag is not None else None
+        if cached is not None:
+            headers.add( 'Vary', 'Accept-Encoding' )
+            headers[ 'Content-Encoding' ] = 'gzip'
+            headers[ 'Content-Length' ] = str( len( cached ) )
+            self._cached = True
+            return status_code, headers, cached
+
+        self._etag = etag
+        return super().transform_first_chunk( status_code, headers, chunk, finishing )
+
+    def transform_chunk( self, chunk: bytes, finishing: bool ) -> bytes:
+        if self._cached:
+            return b'' # Already sent in full
+        chunk = super().transform_chunk( chunk, finishing )
+        if self._gzipping and self._etag is not None:
+            self._parts.append( chunk )
+            if finishing:
+                self._compressed[ self._etag ] = b''.join( self._parts )
+        return chunk
+
 
 class Application( ez.Unit ):
     SETTINGS = ApplicationSettings
 
     panels: Mapping[ str, 'TViewableOrFunc' ]
 
+    def timed( self, name: str, view: 'TViewableOrFunc' ) -> Callable[ [], 'TViewable' ]:
+        """ Wraps a panel to record time from page request to the browser finishing its first render """
+        def create() -> 'TViewable':
+            start = time.perf_counter()
+
+            def on_load() -> None:
+                dur = time.perf_counter() - start
+                PROFILER.record( f'Application.first_render.{name}', dur )
+                ez.logger.info( f'{name}: first render {dur:.2f} s after page request' )
+
+            panel.state.onload( on_load )
+            return view() if callable( view ) else view
+        return create
+
     @ez.task
     async def serve( self ) -> None:
         if self.SETTINGS.port is not None:
             if hasattr( self, 'panels' ):
-                panel.serve( 
-                    self.panels,
+                serve_kwargs = dict( self.SETTINGS.serve_kwargs )
+                if self.SETTINGS.offline:
+                    bokeh_settings.resources = 'server'
+                    serve_kwargs.setdefault( 'transforms', [ partial(
+                        ResourceTransform,
+                        cache_max_age = self.SETTINGS.cache_max_age,
+                        strip_external = True
+                    ) ] )
+
+                panel.serve(
+                    { name: self.timed( name, view ) for name, view in self.panels.items() },
                     port = self.SETTINGS.port,
                     title = self.SETTINGS.name,
                     websocket_origin = '*',
-                    **self.SETTINGS.serve_kwargs
+                    **serve_kwargs
                 )
             else:
                 ez.logger.warning( "Panel application has no panels set. " + \
                     "Did you forget to configure the panels attribute?"
-                )
\ No newline at end of file
+                )
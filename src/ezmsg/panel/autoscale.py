@@ -0,0 +1,75 @@
+import enum
+
+import numpy as np
+import numpy.typing as npt
+
+from typing import Optional
+
+LANE_FILL = 0.8 # Fraction of a channel's lane its normalized trace spans
+RMS_SPAN = 6.0 # RMS mode fits +/- 3 RMS to the lane
+PERCENTILES = (1.0, 99.0) # PERCENTILE mode fits this range to the lane
+
+
+class AutoScale(enum.Enum):
+    OFF = enum.auto()
+    RMS = enum.auto() # Mean and RMS about it; fast, but spikes widen the lane
+    PERCENTILE = enum.auto() # Robust to spikes and artifacts; costs a partial sort per chunk
+
+
+class ChannelScaler:
+    """
+    Running per-channel center and spread of a signal, for normalizing each channel to a lane
+    of height 1. Each chunk's statistics are blended in with an exponential moving average of
+    time constant tau, so scales follow the signal without jumping on every chunk.
+    """
+
+    mode: AutoScale
+    tau: float
+    center: Optional[npt.NDArray]
+    spread: Optional[npt.NDArray]
+
+    _mean_sq: Optional[npt.NDArray] # RMS mode
+
+    def __init__(self, mode: AutoScale = AutoScale.RMS, tau: float = 2.0) -> None:
+        self.mode = mode
+        self.tau = tau
+        self.reset()
+
+    def reset(self) -> None:
+        self.center = None
+        self.spread = None
+        self._mean_sq = None
+
+    def update(self, data: npt.NDArray, dt: float) -> None:
+        """ Blend in a chunk of data, (n_time, n_ch), spanning dt sec """
+        if self.mode == AutoScale.OFF or data.shape[0] == 0:
+            return
+
+        if self.center is not None and self.center.shape != data.shape[1:]:
+            self.reset() # Channels changed
+
+        alpha = 1.0 if self.center is None else -np.expm1(-dt / max(self.tau, 1e-9))
+
+        if self.mode == AutoScale.RMS:
+            mean, mean_sq = data.mean(axis = 0), np.square(data).mean(axis = 0)
+            if self.center is None or self._mean_sq is None:
+                self.center, self._mean_sq = mean, mean_sq
+            else:
+                self.center += alpha * (mean - self.center)
+                self._mean_sq += alpha * (mean_sq - self._mean_sq)
+            self.spread = RMS_SPAN * np.sqrt(np.maximum(self._mean_sq - np.square(self.center), 0.0))
+
+        else:
+            lo, hi = np.percentile(data, PERCENTILES, axis = 0)
+            center, spread = (lo + hi) / 2.0, hi - lo
+            if self.center is None or self.spread is None:
+                self.center, self.spread = center, spread
+            else:
+                self.center += alpha * (center - self.center)
+                self.spread += alpha * (spread - self.spread)
+
+    def scale(self, n_ch: int) -> Optional[npt.NDArray]:
+        """ Per-channel gain fitting each channel to its lane; None if not known for n_ch channels """
+        if self.center is None or self.spread is None or len(self.spread) != n_ch:
+            return None
+        return LANE_FILL / np.where(self.spread > 0.0, self.spread, 1.0)
@@ -0,0 +1,251 @@
+import json
+
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+import ezmsg.core as ez
+
+from ezmsg.util.messages.axisarray import AxisArray
+
+from .batchwriter import Compression
+
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+# File layout:
+#   MAGIC | uint32 header length | JSON header (padded to DATA_ALIGN) | data
+# Data is every recorded AxisArray laid end to end along the time axis (moved
+# to the front), so the whole recording can be mapped as one contiguous array.
+# Each message is a chunk; the chunk index lives in a hidden sidecar file.
+# Compressed recordings are decompressed into memory instead of being mapped.
+
+MAGIC = b'EZAXARR1'
+DATA_ALIGN = 64
+
+INDEX_DTYPE = np.dtype([
+    ('ts', '<f8'), # wall-clock time the chunk was recorded
+    ('offset', '<f8'), # time axis offset of the chunk
+    ('start', '<i8'), # first row of the chunk in data
+    ('length', '<i8'), # number of rows in the chunk
+])
+
+
+def index_path(path: Path) -> Path:
+    return path.parent / f'.{path.name}.idx'
+
+
+def _axis_dict(axis: AxisArray.Axis) -> Dict[str, Any]:
+    return dict(unit = axis.unit, gain = axis.gain, offset = axis.offset)
+
+
+def encode_header(msg: AxisArray, time_axis: str) -> Dict[str, Any]:
+    time_idx = msg.get_axis_idx(time_axis)
+    sample_shape = msg.data.shape[:time_idx] + msg.data.shape[time_idx + 1:]
+    ch_names = getattr(msg, 'ch_names', None)
+    return dict(
+        dtype = msg.data.dtype.str,
+        dims = list(msg.dims),
+        time_axis = time_axis,
+        sample_shape = list(sample_shape),
+        axes = { name: _axis_dict(axis) for name, axis in msg.axes.items() },
+        key = msg.key,
+        ch_names = None if ch_names is None else list(ch_names),
+    )
+
+
+class AxisArrayFileWriter:
+    """ Writes a single-structure AxisArray stream as contiguous typed rows """
+
+    time_axis: Optional[str]
+    header: Optional[Dict[str, Any]]
+    n_rows: int
+
+    _data_f: BinaryIO
+    _index_f: BinaryIO
+    _warned: bool
+
+    def __init__(self, data_f: BinaryIO, index_f: BinaryIO, time_axis: Optional[str] = None) -> None:
+        self.time_axis = time_axis
+        self.header = None
+        self.n_rows = 0
+        self._warned = False
+        self._data_f = data_f
+        self._index_f = index_f
+
+    @property
+    def path(self) -> str:
+        return getattr(self._data_f, 'path', getattr(self._data_f, 'name', ''))
+
+    @property
+    def depth(self) -> int:
+        return getattr(self._data_f, 'depth', 0) + getattr(self._index_f, 'depth', 0)
+
+    @property
+    def lag(self) -> float:
+        return max(getattr(self._data_f, 'lag', 0.0), getattr(self._index_f, 'lag', 0.0))
+
+    @property
+    def nbytes(self) -> int:
+        return getattr(self._data_f, 'bytes_queued', 0)
+
+    def _write_header(self, msg: AxisArray) -> None:
+        time_axis = self.time_axis
+        if time_axis is None:
+            time_axis = 'time' if 'time' in msg.dims else msg.dims[0]
+        self.header = encode_header(msg, time_axis)
+        header = json.dumps(self.header).encode('utf-8')
+        pad = -(len(MAGIC) + 4 + len(header)) % DATA_ALIGN
+        header += b' ' * pad
+        self._data_f.write(MAGIC)
+        self._data_f.write(len(header).to_bytes(4, 'little'))
+        self._data_f.write(header)
+
+    def _compatible(self, msg: AxisArray) -> bool:
+        assert self.header is not None
+        time_axis = self.header['time_axis']
+        if list(msg.dims) != self.header['dims'] or msg.data.dtype.str != self.header['dtype']:
+            return False
+        time_idx = msg.get_axis_idx(time_axis)
+        sample_shape = msg.data.shape[:time_idx] + msg.data.shape[time_idx + 1:]
+        return list(sample_shape) == self.header['sample_shape']
+
+    def write(self, msg: Any, ts: float, sid: Optional[int] = None) -> None:
+        # sid is unused; multi-stream recordings are TEXT only
+        if not isinstance(msg, AxisArray) or not msg.dims:
+            if not self._warned:
+                ez.logger.warning(f'{self.path}: only AxisArray messages can be recorded; dropping {type(msg)}')
+                self._warned = True
+            return
+
+        if self.header is None:
+            self._write_header(msg)
+        elif not self._compatible(msg):
+            if not self._warned:
+                ez.logger.warning(f'{self.path}: AxisArray structure changed mid-recording; dropping message')
+                self._warned = True
+            return
+
+        assert self.header is not None
+        time_axis = self.header['time_axis']
+        time_idx = msg.get_axis_idx(time_axis)
+        rows = np.ascontiguousarray(np.moveaxis(msg.data, time_idx, 0))
+        axis = msg.axes.get(time_axis)
+        offset = axis.offset if axis is not None else 0.0
+
+        entry = np.array([(ts, offset, self.n_rows, rows.shape[0])], dtype = INDEX_DTYPE)
+        self._data_f.write(rows.tobytes()) # Copy; msg.data may be reused before the writer thread gets to it
+        self._index_f.write(entry.tobytes())
+        self._data_f.flush()
+        self._index_f.flush()
+        self.n_rows += rows.shape[0]
+
+    def close(self) -> None:
+        self._data_f.close()
+        self._index_f.close()
+
+
+class AxisArrayFileReader:
+    """ Random access to a recording written by AxisArrayFileWriter via np.memmap """
+
+    path: Path
+    header: Dict[str, Any]
+    index: npt.NDArray
+    data: npt.NDArray
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.header = dict()
+        self.index = np.zeros(0, dtype = INDEX_DTYPE)
+        self.data = np.zeros(0)
+
+        compression = Compression.from_path(path)
+        with compression.open(path, 'rb') as f:
+            magic = f.read(len(MAGIC))
+            if magic == b'': # Nothing was recorded
+                return
+            if magic != MAGIC:
+                raise ValueError(f'{path} is not an AxisArray recording')
+            header_len = int.from_bytes(f.read(4), 'little')
+            self.header = json.loads(f.read(header_len).decode('utf-8'))
+            data_offset = f.tell()
+            buf = f.read() if compression != Compression.NONE else None
+
+        idx_path = index_path(path)
+        if idx_path.exists():
+            self.index = np.fromfile(idx_path, dtype = INDEX_DTYPE)
+
+        dtype = np.dtype(self.header['dtype'])
+        sample_shape = tuple(self.header['sample_shape'])
+        row_bytes = dtype.itemsize * int(np.prod(sample_shape))
+
+        # Trailing chunks that were indexed but not fully written are ignored
+        data_bytes = len(buf) if buf is not None else (path.stat().st_size - data_offset)
+        data_rows = data_bytes // max(row_bytes, 1)
+        ends = self.index['start'] + self.index['length']
+        self.index = self.index[ends <= data_rows]
+        n_rows = int(ends[len(self.index) - 1]) if len(self.index) else 0
+
+        if n_rows and buf is not None:
+            self.data = np.frombuffer(buf, dtype = dtype, 
+                count = n_rows * int(np.prod(sample_shape))).reshape((n_rows,) + sample_shape)
+        elif n_rows:
+            self.data = np.memmap(path, dtype = dtype, mode = 'r',
+                offset = data_offset, shape = (n_rows,) + sample_shape)
+        else:
+            self.data = np.zeros((0,) + sample_shape, dtype = dtype)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def timestamps(self) -> npt.NDArray:
+        return self.index['ts']
+
+    @property
+    def time_axis(self) -> Optional[str]:
+        return self.header.get('time_axis')
+
+    @property
+    def fs(self) -> Optional[float]:
+        axis = self.header.get('axes', {}).get(self.time_axis)
+        return None if axis is None else 1.0 / axis['gain']
+
+    @property
+    def ch_names(self) -> Optional[List[str]]:
+        return self.header.get('ch_names')
+
+    def __getitem__(self, idx: int) -> AxisArray:
+        _, offset, start, length = self.index[idx]
+        rows = np.asarray(self.data[start:start + length])
+        dims: List[str] = self.header['dims']
+        time_axis: str = self.header['time_axis']
+        axes = {
+            name: AxisArray.Axis(**axis)
+            for name, axis in self.header['axes'].items()
+        }
+        if time_axis in axes:
+            axes[time_axis].offset = float(offset)
+        msg = AxisArray(
+            np.moveaxis(rows, 0, dims.index(time_axis)),
+            dims = dims,
+            axes = axes,
+            key = self.header.get('key', '')
+        )
+        if self.ch_names is not None:
+            setattr(msg, 'ch_names', self.ch_names)
+        return msg
+
+    def iter_from(self, start: int) -> Iterator[Tuple[float, AxisArray]]:
+        for idx in range(start, len(self)):
+            yield float(self.index['ts'][idx]), self[idx]
+
+    def __iter__(self) -> Iterator[Tuple[float, AxisArray]]:
+        return self.iter_from(0)
+
+    def read_chunk(self, start: int, n: int) -> Tuple[None, List[Tuple[float, AxisArray]], int]:
+        # Messages are rebuilt from the map as they're read; there's nothing left to decode
+        chunk = [(float(self.index['ts'][idx]), self[idx]) for idx in range(start, min(start + n, len(self)))]
+        return None, chunk, len(chunk)
+
+    def close(self) -> None:
+        pass
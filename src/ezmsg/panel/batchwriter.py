@@ -0,0 +1,183 @@
+import bz2
+import enum
+import gzip
+import lzma
+import queue
+import threading
+import time
+
+from pathlib import Path
+
+from typing import IO, Callable, Optional, Tuple
+
+
+class Compression(enum.Enum):
+    NONE = ''
+    GZIP = 'gz'
+    BZ2 = 'bz2'
+    LZMA = 'xz'
+
+    @property
+    def suffix(self) -> str:
+        return f'.{self.value}' if self.value else ''
+
+    @property
+    def compress(self) -> Optional[Callable[[bytes], bytes]]:
+        # Each batch becomes an independent stream/member; concatenations of these
+        # are valid files for the matching stdlib module (gzip.open, bz2.open, lzma.open)
+        return {
+            Compression.GZIP: lambda b: gzip.compress(b, compresslevel = 6),
+            Compression.BZ2: bz2.compress,
+            Compression.LZMA: lzma.compress,
+        }.get(self)
+
+    @classmethod
+    def from_path(cls, path: Path) -> 'Compression':
+        for comp in cls:
+            if comp.value and path.suffix == comp.suffix:
+                return comp
+        return cls.NONE
+
+    def open(self, path: Path, mode: str = 'rb') -> IO:
+        opener = {
+            Compression.GZIP: gzip.open,
+            Compression.BZ2: bz2.open,
+            Compression.LZMA: lzma.open,
+        }.get(self, open)
+        return opener(path, mode)
+
+
+_CLOSE = None
+
+
+class BatchWriter:
+    """
+    File-like sink that hands writes to a background thread through a bounded queue.
+    The thread coalesces writes into batches, flushed when a batch reaches batch_bytes
+    or is batch_interval seconds old, and optionally compresses each batch.
+    write() only blocks if the queue is full, i.e. the disk is far behind.
+    """
+
+    path: Path
+    batch_bytes: int
+    batch_interval: float
+    compression: Compression
+
+    bytes_queued: int # Uncompressed
+    bytes_written: int
+
+    _queue: 'queue.Queue[Optional[Tuple[float, bytes]]]'
+    _thread: threading.Thread
+    _lock: threading.Lock
+    _pending: int
+    _oldest_pending: float
+    _error: Optional[BaseException]
+
+    def __init__(
+        self,
+        path: Path,
+        batch_bytes: int = 1 << 20,
+        batch_interval: float = 0.5,
+        max_queue: int = 4096,
+        compression: Compression = Compression.NONE,
+    ) -> None:
+        self.path = path
+        self.batch_bytes = batch_bytes
+        self.batch_interval = batch_interval
+        self.compression = compression
+        self.bytes_queued = 0
+        self.bytes_written = 0
+
+        self._queue = queue.Queue(maxsize = max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._oldest_pending = 0.0
+        self._error = None
+
+        f = open(path, 'wb') # Open here so errors surface to the caller
+        self._thread = threading.Thread(target = self._run, args = (f,), daemon = True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        """ Number of writes queued or batched but not yet on disk """
+        return self._pending
+
+    @property
+    def lag(self) -> float:
+        """ Age in seconds of the oldest write not yet on disk """
+        with self._lock:
+            return (time.time() - self._oldest_pending) if self._pending else 0.0
+
+    def _check(self) -> None:
+        if self._error is not None:
+            raise IOError(f'Background writer for {self.path} failed') from self._error
+
+    def write(self, data: bytes) -> None:
+        self._check()
+        now = time.time()
+        with self._lock:
+            if self._pending == 0:
+                self._oldest_pending = now
+            self._pending += 1
+        self.bytes_queued += len(data)
+        while True:
+            try:
+                self._queue.put((now, data), timeout = 1.0)
+                break
+            except queue.Full:
+                self._check()
+
+    def flush(self) -> None:
+        pass # Batches are flushed by the writer thread
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+
+    def _run(self, f: IO[bytes]) -> None:
+        compress = self.compression.compress
+        batch = bytearray()
+        n_batched = 0
+        batch_t0 = 0.0
+        closing = False
+
+        with f:
+            while not closing:
+                timeout = None
+                if n_batched:
+                    timeout = max(batch_t0 + self.batch_interval - time.time(), 0.0)
+
+                try:
+                    item = self._queue.get(timeout = timeout)
+                except queue.Empty:
+                    item = ()
+
+                if item is _CLOSE:
+                    closing = True
+                elif item:
+                    t, data = item
+                    if not n_batched:
+                        batch_t0 = t
+                    batch += data
+                    n_batched += 1
+
+                if n_batched and (closing or len(batch) >= self.batch_bytes
+                    or (time.time() - batch_t0) >= self.batch_interval):
+                    try:
+                        out = bytes(batch) if compress is None else compress(bytes(batch))
+                        f.write(out)
+                        f.flush()
+                        self.bytes_written += len(out)
+                    except BaseException as e:
+                        self._error = e
+                        raise
+                    finally:
+                        batch.clear()
+                        with self._queue.mutex:
+                            head = self._queue.queue[0] if self._queue.queue else None
+                        with self._lock:
+                            self._pending -= n_batched
+                            self._oldest_pending = head[0] if head else time.time()
+                        n_batched = 0
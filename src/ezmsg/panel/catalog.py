@@ -0,0 +1,251 @@
+import json
+import sqlite3
+import threading
+import time
+
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+
+import panel
+import pandas as pd
+import ezmsg.core as ez
+
+from param.parameterized import Event
+
+from ezmsg.util.messages.axisarray import AxisArray
+
+from .recording import RecordingFormat, HEADER_TYPES, TaggedMessage, is_recording, open_reader, recording_size
+
+from typing import Any, Iterator, List, Optional, Tuple
+
+CATALOG_FNAME = '.catalog.sqlite'
+
+@dataclass
+class RecordingInfo:
+    path: Path
+    format: str = RecordingFormat.TEXT.name
+    size: int = 0 # bytes
+    mtime: float = 0.0
+    start: Optional[float] = None # Timestamp of first message
+    duration: float = 0.0 # sec
+    n_msgs: int = 0
+    channels: List[str] = field(default_factory = list)
+    fs: Optional[float] = None
+
+    def observe(self, msg: Any, ts: float) -> None:
+        """ Accumulate statistics for a message written to this recording """
+        if self.start is None:
+            self.start = ts
+            self.channels, self.fs = describe_message(msg)
+        self.duration = ts - self.start
+        self.n_msgs += 1
+
+    def stat(self) -> 'RecordingInfo':
+        self.size, self.mtime = recording_size(self.path), self.path.stat().st_mtime
+        return self
+
+
+def describe_message(msg: Any) -> Tuple[List[str], Optional[float]]:
+    """ Channel names and sampling rate for an AxisArray; empty for other messages """
+    if not isinstance(msg, AxisArray) or msg.data.ndim == 0:
+        return [], None
+    time_axis = 'time' if 'time' in msg.dims else msg.dims[0]
+    ch_names = getattr(msg, 'ch_names', None)
+    if ch_names is None:
+        n_ch = int(msg.data.size // max(msg.data.shape[msg.get_axis_idx(time_axis)], 1))
+        ch_names = [f'ch_{i}' for i in range(n_ch)]
+    axis = msg.axes.get(time_axis)
+    fs = (1.0 / axis.gain) if axis is not None and axis.gain else None
+    return list(ch_names), fs
+
+
+def scan_recording(path: Path) -> RecordingInfo:
+    """ Compute RecordingInfo by reading a recording; used for files not catalogued at stop time """
+    info = RecordingInfo(path, format = RecordingFormat.from_path(path).name)
+    for ts, obj in open_reader(path):
+        if isinstance(obj, HEADER_TYPES):
+            continue
+        if isinstance(obj, TaggedMessage):
+            obj = obj.msg
+        info.observe(obj, ts if ts is not None else 0.0)
+    return info.stat()
+
+
+class RecordingCatalog:
+    """
+    Persistent index of recordings under data_dir, stored in sqlite next to them.
+    Paths are stored relative to data_dir.
+    """
+
+    data_dir: Path
+    _db: sqlite3.Connection
+    _lock: threading.RLock
+
+    def __init__(self, data_dir: Path) -> None:
+        self.data_dir = data_dir
+        self._lock = threading.RLock() # refresh() usually runs in an executor
+        self._db = sqlite3.connect(data_dir / CATALOG_FNAME, check_same_thread = False)
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS recordings ('
+                'path TEXT PRIMARY KEY, format TEXT, size INTEGER, mtime REAL, '
+                'start REAL, duration REAL, n_msgs INTEGER, channels TEXT, fs REAL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS by_start ON recordings (start)')
+
+    def _key(self, path: Path) -> str:
+        path = Path(path)
+        return str(path.relative_to(self.data_dir) if path.is_absolute() else path)
+
+    def add(self, info: RecordingInfo) -> None:
+        row = asdict(info)
+        row['path'] = self._key(info.path)
+        row['channels'] = json.dumps(info.channels)
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO recordings VALUES '
+                '(:path, :format, :size, :mtime, :start, :duration, :n_msgs, :channels, :fs)',
+                row
+            )
+
+    def remove(self, path: Path) -> None:
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM recordings WHERE path = ?', (self._key(path),))
+
+    def _recordings(self) -> Iterator[Path]:
+        for path in self.data_dir.rglob('*'):
+            if is_recording(path) and not any(p.startswith('.') for p in path.relative_to(self.data_dir).parts):
+                yield path
+
+    def refresh(self, settle: float = 0.0) -> int:
+        """
+        Incrementally sync with data_dir; only new or modified files are read. Files modified in the
+        last settle sec are assumed to still be recording and are left for a later refresh.
+        Returns # of changes
+        """
+        with self._lock:
+            known = {
+                path: (size, mtime) for path, size, mtime
+                in self._db.execute('SELECT path, size, mtime FROM recordings')
+            }
+        changes = 0
+        for path in self._recordings():
+            key = self._key(path)
+            mtime = path.stat().st_mtime
+            if known.pop(key, None) == (recording_size(path), mtime) or mtime > time.time() - settle:
+                continue
+            try:
+                self.add(scan_recording(path))
+            except Exception as e:
+                ez.logger.warning(f'Could not catalog {path}: {e}')
+                continue
+            changes += 1
+        for key in known:
+            self.remove(Path(key))
+        return changes + len(known)
+
+    def search(self, text: str = '', offset: int = 0, limit: int = 50) -> Tuple[List[RecordingInfo], int]:
+        """ Newest-first page of recordings whose path or channels contain text, and total # of matches """
+        where, args = '', []
+        if text:
+            where = "WHERE path LIKE ? ESCAPE '\\' OR channels LIKE ? ESCAPE '\\'"
+            pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            args = [pattern, pattern]
+        with self._lock:
+            total = self._db.execute(f'SELECT COUNT(*) FROM recordings {where}', args).fetchone()[0]
+            rows = self._db.execute(
+                f'SELECT * FROM recordings {where} ORDER BY start DESC, path DESC LIMIT ? OFFSET ?',
+                args + [limit, offset]
+            ).fetchall()
+        infos = [
+            RecordingInfo(
+                path = self.data_dir / path, format = fmt, size = size, mtime = mtime, start = start,
+                duration = duration, n_msgs = n_msgs, channels = json.loads(channels), fs = fs
+            ) for path, fmt, size, mtime, start, duration, n_msgs, channels, fs in rows
+        ]
+        return infos, total
+
+
+class CatalogBrowser:
+    """ Searchable, paginated table of a RecordingCatalog; replaces FileSelector in the GUIs """
+
+    catalog: RecordingCatalog
+    page_size: int
+
+    search: panel.widgets.TextInput
+    table: panel.widgets.Tabulator
+    prev_button: panel.widgets.Button
+    next_button: panel.widgets.Button
+    page_info: panel.widgets.StaticText
+
+    _page: int
+    _total: int
+    _infos: List[RecordingInfo]
+
+    def __init__(self, catalog: RecordingCatalog, page_size: int = 20) -> None:
+        self.catalog = catalog
+        self.page_size = page_size
+        self._page = 0
+        self._total = 0
+        self._infos = []
+
+        self.search = panel.widgets.TextInput(name = 'Search', placeholder = 'Name or channel')
+        self.table = panel.widgets.Tabulator(
+            self._frame(),
+            show_index = False,
+            disabled = True,
+            selectable = 'checkbox',
+            sizing_mode = 'stretch_width'
+        )
+        self.prev_button = panel.widgets.Button(name = '◀', width = 50)
+        self.next_button = panel.widgets.Button(name = '▶', width = 50)
+        self.page_info = panel.widgets.StaticText(value = '-')
+
+        def on_search(*events: Event) -> None:
+            self._page = 0
+            self.update()
+
+        def on_page(delta: int) -> None:
+            n_pages = max((self._total - 1) // self.page_size + 1, 1)
+            self._page = min(max(self._page + delta, 0), n_pages - 1)
+            self.update()
+
+        self.search.param.watch(on_search, 'value')
+        self.prev_button.on_click(lambda _: on_page(-1))
+        self.next_button.on_click(lambda _: on_page(1))
+
+    def _frame(self) -> pd.DataFrame:
+        return pd.DataFrame([
+            dict(
+                name = str(info.path.relative_to(self.catalog.data_dir)),
+                started = pd.to_datetime(info.start, unit = 's') if info.start else None,
+                duration = round(info.duration, 1),
+                msgs = info.n_msgs,
+                MB = round(info.size / 1e6, 2),
+                channels = len(info.channels),
+                fs = info.fs,
+            ) for info in self._infos
+        ], columns = ['name', 'started', 'duration', 'msgs', 'MB', 'channels', 'fs'])
+
+    def update(self) -> None:
+        self._infos, self._total = self.catalog.search(
+            self.search.value,
+            offset = self._page * self.page_size,
+            limit = self.page_size
+        )
+        self.table.value = self._frame()
+        self.table.selection = []
+        n_pages = max((self._total - 1) // self.page_size + 1, 1)
+        self.page_info.value = f'Page {self._page + 1}/{n_pages} ({self._total} recordings)'
+
+    @property
+    def selected(self) -> List[Path]:
+        return [self._infos[idx].path for idx in self.table.selection if idx < len(self._infos)]
+
+    def panel(self) -> panel.viewable.Viewable:
+        return panel.Column(
+            self.search,
+            self.table,
+            panel.Row(self.prev_button, self.page_info, self.next_button),
+            sizing_mode = 'stretch_width'
+        )
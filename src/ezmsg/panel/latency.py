@@ -0,0 +1,159 @@
+import time
+
+from collections import deque
+
+import panel
+import pandas as pd
+
+from bokeh.models import ColumnDataSource, CustomJS
+
+from ezmsg.util.messages.axisarray import AxisArray
+
+from .profiling import Histogram
+from .scheduler import FrameScheduler
+
+from typing import Any, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+# Display latency is split into stages, each with its own histogram:
+#   ingest   acquisition (message timestamp) to queued for display; shared by every session
+#   send     queued to sent to the browser
+#   render   sent to painted by the browser
+
+# Message timestamps further behind than this (or ahead of now) aren't wall-clock
+# times, e.g. a replay or a synthetic clock, so they aren't counted as ingest latency
+MAX_INGEST_LAG = 60.0 # sec
+
+# With render latency on, the server tags each update it sends to a source with a
+# sequence number; the browser echoes it back, negated, once the update has been painted
+ACK_JS = """
+const seq = source.tags[0]
+if (typeof seq !== 'number' || seq <= 0)
+    return
+// requestAnimationFrame runs before the next paint, so a nested one runs after it
+requestAnimationFrame(() => requestAnimationFrame(() => { source.tags = [-seq] }))
+"""
+
+
+def message_time(msg: AxisArray, axis_name: Optional[str] = None) -> Optional[float]:
+    """ Timestamp of the newest sample in msg, from its time axis offset """
+    if axis_name is None:
+        axis_name = 'time' if 'time' in msg.dims else None
+    if axis_name is None or axis_name not in msg.dims:
+        return None
+    axis = msg.get_axis(axis_name)
+    n_time = msg.data.shape[msg.get_axis_idx(axis_name)]
+    return axis.offset + max(n_time - 1, 0) * axis.gain
+
+
+class SessionLatency:
+    """ Send and (optionally) render latency of the updates one session's source was sent """
+
+    histograms: Dict[str, Histogram]
+    seq: int
+    _sent: Deque[Tuple[int, float]] # (seq, time sent) awaiting acknowledgement
+
+    def __init__(self, render: bool = False) -> None:
+        self.histograms = { stage: Histogram() for stage in (('send', 'render') if render else ('send', )) }
+        self.seq = 0
+        self._sent = deque(maxlen = 1024) # Bounded in case a browser stops acknowledging
+
+    def sent(self, queued: Iterable[float]) -> int:
+        """ Record an update sent now, holding data queued at these times; returns its sequence number """
+        now = time.time()
+        for queued_t in queued:
+            self.histograms['send'].record(max(now - queued_t, 0.0))
+        self.seq += 1
+        if 'render' in self.histograms:
+            self._sent.append((self.seq, now))
+        return self.seq
+
+    def acknowledged(self, seq: int) -> None:
+        now = time.time()
+        # Updates coalesced into one paint are all acknowledged by the newest
+        while self._sent and self._sent[0][0] <= seq:
+            _, sent_t = self._sent.popleft()
+            self.histograms['render'].record(now - sent_t)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return { stage: hist.summary() for stage, hist in self.histograms.items() }
+
+
+def session_id() -> str:
+    doc = panel.state.curdoc
+    context = getattr(doc, 'session_context', None)
+    return context.id if context is not None else str(id(doc))
+
+
+class LatencyMonitor:
+    """
+    Display latency of one plot: ingest latency of its input, and send latency per session.
+    Render latency costs a round trip from the browser per update, so it's only measured if asked for.
+    """
+
+    ingest: Histogram
+    sessions: Dict[str, SessionLatency]
+    render: bool
+
+    def __init__(self, render: bool = False) -> None:
+        self.ingest = Histogram()
+        self.sessions = dict()
+        self.render = render
+
+    def ingested(self, msg_t: Optional[float], now: Optional[float] = None) -> None:
+        if msg_t is None:
+            return
+        lag = (time.time() if now is None else now) - msg_t
+        if 0.0 <= lag <= MAX_INGEST_LAG:
+            self.ingest.record(lag)
+
+    def track(self, source: ColumnDataSource) -> Callable[[Iterable[float]], None]:
+        """
+        Call from a session; returns sent(queued), to be called after each update to source
+        with the times the data it holds was queued for display
+        """
+        sid = session_id()
+        latency = self.sessions[sid] = SessionLatency(self.render)
+
+        def on_destroyed(_: Any) -> None:
+            self.sessions.pop(sid, None)
+
+        def sent(queued: Iterable[float]) -> None:
+            seq = latency.sent(queued)
+            if self.render:
+                source.tags = [seq]
+
+        def on_ack(attr: str, old: Any, new: Any) -> None:
+            if new and isinstance(new[0], (int, float)) and new[0] < 0:
+                latency.acknowledged(-int(new[0]))
+
+        panel.state.on_session_destroyed(on_destroyed)
+        if self.render:
+            source.js_on_change('tags', CustomJS(args = dict(source = source), code = ACK_JS))
+            source.on_change('tags', on_ack)
+        return sent
+
+    def summary(self) -> Dict[str, Any]:
+        """ Percentiles (sec) of ingest latency and of each session's send/render latency """
+        return dict(
+            ingest = self.ingest.summary(),
+            sessions = { session_id: latency.summary() for session_id, latency in self.sessions.items() },
+        )
+
+    def view(self, period: int = 1000) -> panel.viewable.Viewable:
+        """ This session's latency percentiles, refreshed every period ms; call from a session """
+        sid = session_id()
+        table = panel.pane.DataFrame(sizing_mode = 'stretch_width')
+        due = [time.time() + period / 1000]
+
+        def update() -> None:
+            due[0] = time.time() + period / 1000
+            latency = self.sessions.get(sid)
+            hists = dict(ingest = self.ingest, **(latency.histograms if latency is not None else {}))
+            table.object = pd.DataFrame({
+                stage: { q: round(hist.percentile(q) * 1e3, 1) for q in (50, 95, 99) }
+                for stage, hist in hists.items()
+            }).T.rename(columns = lambda q: f'p{q} (ms)')
+
+        update()
+        FrameScheduler.current().register(lambda: time.time() >= due[0], update)
+        return table
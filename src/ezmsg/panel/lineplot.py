@@ -1,4 +1,5 @@
 import asyncio
+import time
 
 from functools import partial
 
@@ -16,8 +17,13 @@ from bokeh.models.renderers import GlyphRenderer
 from param.parameterized import Event
 
 from .util import AxisScale
+from .profiling import instrument, timer
+from .latency import LatencyMonitor, message_time, session_id
+from .autoscale import AutoScale, ChannelScaler
+from .scheduler import FrameScheduler
+from .memory import MEMORY, MemoryUsage, nbytes
 
-from typing import Dict, Optional, List
+from typing import Any, Dict, Optional, List, Tuple
 
 CDS_X_DIM = '__x__'
 
@@ -28,18 +34,30 @@ class LinePlotSettings(ez.Settings):
     y_axis_scale: AxisScale = AxisScale.LINEAR
     y_axis_label: Optional[str] = None
     x_axis_label: Optional[str] = None
+    autoscale: AutoScale = AutoScale.OFF # Normalize each channel to fit its lane
+    autoscale_tau: float = 2.0 # sec; time constant of the running channel statistics
+    render_latency: bool = False # Have browsers acknowledge each painted update; see LatencyMonitor
 
 
 class LinePlotState( ez.State ):
     x_data: npt.NDArray
     cds_data: Dict[str, npt.NDArray]
+    data_version: int = 0 # Incremented whenever x_data/cds_data change
+    data_time: float = 0.0 # When x_data/cds_data were queued for display
+    latency: LatencyMonitor
+    scaler: ChannelScaler
+    last_update: Optional[float] = None
+    # Session id and source of each open plot, for memory accounting
+    sources: Dict[int, Tuple[str, ColumnDataSource]]
 
     # Visualization controls
     channelize: panel.widgets.Checkbox
     gain: panel.widgets.FloatInput
+    autoscale: panel.widgets.Select
 
     update_ev: asyncio.Event
     cur_signal: Optional[AxisArray]
+    new_signal: bool = False # cur_signal hasn't been blended into the scaler's statistics yet
 
 
 class LinePlot( ez.Unit ):
@@ -56,15 +74,30 @@ class LinePlot( ez.Unit ):
         self.STATE.update_ev = asyncio.Event()
         self.STATE.update_ev.clear()
         self.STATE.cur_signal = None
+        self.STATE.latency = LatencyMonitor(self.SETTINGS.render_latency)
+        self.STATE.sources = dict()
+        MEMORY.register(self)
 
         self.STATE.channelize = panel.widgets.Checkbox(name = 'Channelize', value = True)
         self.STATE.gain = panel.widgets.FloatInput(name = 'Gain', value = 1.0)
+        self.STATE.autoscale = panel.widgets.Select(
+            name = 'Auto-Scale',
+            options = { mode.name: mode for mode in AutoScale },
+            value = self.SETTINGS.autoscale
+        )
+        self.STATE.scaler = ChannelScaler(self.SETTINGS.autoscale, self.SETTINGS.autoscale_tau)
 
         def on_vis_control(*events: Event) -> None:
             self.STATE.update_ev.set()
 
+        def on_autoscale(*events: Event) -> None:
+            self.STATE.scaler.mode = self.STATE.autoscale.value
+            self.STATE.scaler.reset()
+            self.STATE.update_ev.set()
+
         self.STATE.channelize.param.watch(on_vis_control, 'value')
         self.STATE.gain.param.watch(on_vis_control, 'value')
+        self.STATE.autoscale.param.watch(on_autoscale, 'value')
 
     
     def plot( self ) -> panel.viewable.Viewable:
@@ -94,13 +127,24 @@ class LinePlot( ez.Unit ):
         )
 
         lines = dict()
+        shown = [ -1 ] # data_version this session's cds holds
+        sent = self.STATE.latency.track( cds )
+        self.STATE.sources[id(cds)] = (session_id(), cds)
+
+        def release() -> None:
+            self.STATE.sources.pop(id(cds), None)
 
-        @panel.io.with_lock
+        panel.state.on_session_destroyed(lambda _: release())
+
+        @instrument
         def _update( 
             fig: figure,
             cds: ColumnDataSource, 
             lines: Dict[ str, GlyphRenderer ]
         ) -> None:
+            # Data queued before this session opened doesn't count towards its send latency
+            queued = [self.STATE.data_time] if shown[0] >= 0 else []
+            shown[0] = self.STATE.data_version
 
             cds_data = {**self.STATE.cds_data, **{CDS_X_DIM: self.STATE.x_data}}
 
@@ -118,19 +162,43 @@ class LinePlot( ez.Unit ):
                 )
 
             cds.data = cds_data
+            sent(queued)
     
-        cb = panel.state.add_periodic_callback( 
-            partial(_update, fig, cds, lines), 
-            period = 50 
+        # Skip re-diffing unchanged data; every session shares the same arrays
+        FrameScheduler.current().register(
+            lambda: shown[0] != self.STATE.data_version,
+            partial(_update, fig, cds, lines),
+            model = fig,
+            release = release
         )
 
         return panel.pane.Bokeh( fig )
 
+    def memory(self) -> MemoryUsage:
+        """ Bytes held in shared buffers and by each session's sources; see ezmsg.panel.memory """
+        sessions: Dict[str, int] = {}
+        for sid, cds in self.STATE.sources.values():
+            sessions[sid] = sessions.get(sid, 0) + nbytes(cds.data)
+        return dict(
+            buffers = dict(
+                cur_signal = nbytes(self.STATE.cur_signal),
+                cds_data = nbytes(self.STATE.cds_data) + nbytes(self.STATE.x_data),
+            ),
+            sessions = sessions,
+        )
+
+    def latency(self) -> Dict[str, Any]:
+        """ Display latency percentiles; see LatencyMonitor.summary """
+        return self.STATE.latency.summary()
+
     @property
     def controls(self) -> List[panel.viewable.Viewable]:
         return [
             self.STATE.channelize,
             self.STATE.gain,
+            self.STATE.autoscale,
+            '__Display Latency__',
+            self.STATE.latency.view(),
         ]
 
     def panel(self) -> panel.viewable.Viewable:
@@ -143,12 +211,17 @@ class LinePlot( ez.Unit ):
         )
     
     @ez.subscriber(INPUT_SIGNAL)
+    @instrument
     async def on_signal(self, msg: Optional[AxisArray]) -> None:
+        if msg is not None:
+            self.STATE.latency.ingested(message_time(msg))
         self.STATE.cur_signal = msg
+        self.STATE.new_signal = True
         self.STATE.update_ev.set()
 
     @ez.task
     async def update_data(self) -> None:
+        loop = asyncio.get_running_loop()
 
         while True:
             await self.STATE.update_ev.wait()
@@ -159,26 +232,64 @@ class LinePlot( ez.Unit ):
             if msg is None: # clear the plot
                 self.STATE.x_data = np.arange(0)
                 self.STATE.cds_data = dict()
+                self.STATE.data_version += 1
+                self.STATE.data_time = time.time()
                 continue
 
             axis_name = self.SETTINGS.x_axis
             if axis_name is None:
                 axis_name = msg.dims[0]
-            axis = msg.get_axis(axis_name)
 
             with msg.view2d(axis_name) as view:
-
-                ch_names = getattr(msg, 'ch_names', None)
-                if ch_names is None:
-                    ch_names = [f'ch_{i}' for i in range(view.shape[1])]
-
-                self.STATE.x_data = (np.arange(view.shape[0]) * axis.gain) + axis.offset
-                vis_view = (view * self.STATE.gain.value)
-
-                if self.STATE.channelize.value:
-                    vis_view += np.arange(len(ch_names)) 
-
-                self.STATE.cds_data = {
-                    ch_name: vis_view[:, ch_idx] 
-                    for ch_idx, ch_name in enumerate(ch_names)
-                }
\ No newline at end of file
+                if self.STATE.new_signal:
+                    # Only new data counts towards the statistics, not a redraw for the view controls.
+                    # They blend over wall time, as there's no time axis along x
+                    self.STATE.new_signal = False
+                    now = time.time()
+                    dt = 0.0 if self.STATE.last_update is None else now - self.STATE.last_update
+                    self.STATE.last_update = now
+                    self.STATE.scaler.update(view, dt)
+                gains, offsets = self.levels(view.shape[1])
+
+            # NumPy releases the GIL, so formatting on a worker thread keeps the event loop free
+            self.STATE.x_data, self.STATE.cds_data = await loop.run_in_executor(
+                None, self.format, msg, axis_name, gains, offsets
+            )
+            self.STATE.data_version += 1
+            self.STATE.data_time = time.time()
+
+    def levels(self, n_ch: int) -> Tuple[npt.NDArray, npt.NDArray]:
+        """ Display gain and offset of each of n_ch channels, from the view controls """
+        offsets = np.arange(n_ch) if self.STATE.channelize.value else np.zeros(n_ch)
+        gains = np.full(n_ch, self.STATE.gain.value)
+        scale = self.STATE.scaler.scale(n_ch)
+        if scale is not None and self.STATE.scaler.center is not None:
+            gains = gains * scale
+            offsets = offsets - self.STATE.scaler.center * gains
+        return gains, offsets
+
+    def format(
+        self, 
+        msg: AxisArray, 
+        axis_name: str,
+        gains: npt.NDArray, 
+        offsets: npt.NDArray
+    ) -> Tuple[npt.NDArray, Dict[str, npt.NDArray]]:
+        """ x values and per-channel display data for msg; pure NumPy, so it can run on a worker thread """
+        axis = msg.get_axis(axis_name)
+
+        with timer('LinePlot.format'), msg.view2d(axis_name) as view:
+
+            ch_names = getattr(msg, 'ch_names', None)
+            if ch_names is None:
+                ch_names = [f'ch_{i}' for i in range(view.shape[1])]
+
+            x_data = (np.arange(view.shape[0]) * axis.gain) + axis.offset
+            vis_view = (view * gains) + offsets
+
+            # Contiguous per channel, so Bokeh can serialize without copying
+            channels = np.ascontiguousarray(vis_view.T)
+            return x_data, {
+                ch_name: channels[ch_idx] 
+                for ch_idx, ch_name in enumerate(ch_names)
+            }
@@ -0,0 +1,83 @@
+import sys
+import weakref
+
+from collections import deque
+
+import panel
+import numpy as np
+import pandas as pd
+
+from ezmsg.util.messages.axisarray import AxisArray
+
+from typing import Any, Callable, Dict, Protocol
+
+# Memory a unit holds, in bytes of array data:
+#   buffers   shared by every session, by name; e.g. history not yet rolled out, the latest message
+#   sessions  per session id; e.g. that session's ColumnDataSources, which Bokeh keeps server-side
+MemoryUsage = Dict[str, Dict[str, int]]
+
+
+def nbytes(obj: Any) -> int:
+    """ Bytes of array data held by obj, following dicts, sequences and AxisArrays """
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, AxisArray):
+        return nbytes(obj.data)
+    if isinstance(obj, dict):
+        return sum(nbytes(v) for v in obj.values())
+    if isinstance(obj, list) and len(obj) and isinstance(obj[0], (int, float, np.generic)):
+        # Boxed scalars, e.g. a ColumnDataSource column that was never streamed into
+        return sys.getsizeof(obj) + len(obj) * sys.getsizeof(obj[0])
+    if isinstance(obj, (list, tuple, deque)):
+        return sum(nbytes(v) for v in obj)
+    return 0
+
+
+def total(usage: MemoryUsage) -> int:
+    return sum(sum(kind.values()) for kind in usage.values())
+
+
+class Accountable(Protocol):
+    address: str
+
+    def memory(self) -> MemoryUsage: ...
+
+
+class MemoryRegistry:
+    """ Per-process registry of units that account for the memory they hold """
+
+    units: 'weakref.WeakSet[Accountable]'
+
+    def __init__(self) -> None:
+        self.units = weakref.WeakSet()
+
+    def register(self, unit: Accountable) -> None:
+        self.units.add(unit)
+
+    def summary(self) -> Dict[str, MemoryUsage]:
+        return { unit.address: unit.memory() for unit in sorted(self.units, key = lambda unit: unit.address) }
+
+
+MEMORY = MemoryRegistry()
+
+
+def view(period: int = 1000) -> panel.viewable.Viewable:
+    """ Diagnostics page: memory held by each unit in the process serving it, per buffer and session """
+    table = panel.pane.DataFrame(sizing_mode = 'stretch_width')
+    status = panel.pane.Markdown()
+
+    def update() -> None:
+        summary = MEMORY.summary()
+        rows = [
+            dict(unit = address, kind = kind, name = name, mb = round(n / 2 ** 20, 3))
+            for address, usage in summary.items()
+            for kind, held in usage.items()
+            for name, n in held.items()
+        ]
+        table.object = pd.DataFrame(rows, columns = ['unit', 'kind', 'name', 'mb'])
+        status.object = f'**{sum(total(usage) for usage in summary.values()) / 2 ** 20:.1f} MB** ' + \
+            f'held by {len(summary)} units'
+
+    update()
+    panel.state.add_periodic_callback(update, period = period)
+    return panel.Column(status, table, sizing_mode = 'stretch_width')
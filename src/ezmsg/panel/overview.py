@@ -0,0 +1,85 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+
+from ezmsg.util.messages.axisarray import AxisArray
+
+from .catalog import describe_message
+from .recording import TaggedMessage, open_reader, recording_size
+
+from typing import List, Optional
+
+OVERVIEW_BINS = 1000
+
+
+@dataclass
+class Overview:
+    """ Per-channel min/max of a recording over n_bins equal spans of recorded time """
+    path: Path
+    t: npt.NDArray # (n_bins,) sec from first record to the start of each bin
+    mins: npt.NDArray # (n_bins, n_ch); NaN where a bin holds no data
+    maxs: npt.NDArray
+    ch_names: List[str] = field(default_factory = list)
+
+
+def overview_path(path: Path) -> Path:
+    return path.parent / f'.{path.name}.overview.npz'
+
+
+def compute_overview(path: Path, n_bins: int = OVERVIEW_BINS) -> Overview:
+    reader = open_reader(path)
+    timestamps = reader.timestamps
+    known = timestamps[np.isfinite(timestamps)]
+    t0 = float(known[0]) if len(known) else 0.0
+    bin_dur = max((float(known[-1]) - t0) if len(known) else 0.0, 1e-9) / n_bins
+
+    mins: Optional[npt.NDArray] = None
+    maxs: Optional[npt.NDArray] = None
+    ch_names: List[str] = []
+    for ts, msg in reader:
+        if isinstance(msg, TaggedMessage):
+            msg = msg.msg
+        if ts is None or not isinstance(msg, AxisArray) or msg.data.ndim == 0:
+            continue
+        time_axis = 'time' if 'time' in msg.dims else msg.dims[0]
+        with msg.view2d(time_axis) as view:
+            if view.shape[0] == 0:
+                continue
+            lo, hi = view.min(axis = 0), view.max(axis = 0)
+        if mins is None or maxs is None:
+            ch_names, _ = describe_message(msg)
+            mins = np.full((n_bins, len(lo)), np.nan)
+            maxs = np.full((n_bins, len(hi)), np.nan)
+        if len(lo) != mins.shape[1]:
+            continue # Channel count changed mid-recording
+        b = min(max(int((ts - t0) / bin_dur), 0), n_bins - 1)
+        mins[b] = np.fmin(mins[b], lo)
+        maxs[b] = np.fmax(maxs[b], hi)
+
+    if mins is None or maxs is None:
+        mins = maxs = np.zeros((n_bins, 0))
+    return Overview(path, np.arange(n_bins) * bin_dur, mins, maxs, ch_names)
+
+
+def load_overview(path: Path, n_bins: int = OVERVIEW_BINS) -> Overview:
+    """ Overview of a recording, computed once and cached next to it until the recording changes """
+    cache_path = overview_path(path)
+    key = np.array([recording_size(path), path.stat().st_mtime, n_bins])
+    try:
+        with np.load(cache_path) as cache:
+            if not np.array_equal(cache['key'], key):
+                raise ValueError('stale overview')
+            return Overview(path, cache['t'], cache['mins'], cache['maxs'], [str(ch) for ch in cache['ch_names']])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    overview = compute_overview(path, n_bins)
+    try:
+        with open(cache_path, 'wb') as f:
+            np.savez(f, key = key, t = overview.t, mins = overview.mins, maxs = overview.maxs,
+                ch_names = np.array(overview.ch_names, dtype = str))
+    except OSError:
+        pass # Read-only data_dir
+    return overview
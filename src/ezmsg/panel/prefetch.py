@@ -0,0 +1,159 @@
+import asyncio
+import heapq
+
+from concurrent.futures import Executor
+
+import ezmsg.core as ez
+
+from .recording import Record, RecordingReader, merge_key
+
+from typing import Any, List, Optional, Tuple
+
+
+class Prefetcher:
+    """
+    Reads and decodes records ahead of the playback cursor. Chunks of chunk_size records
+    are read on a thread and decoded on executor (e.g. a process pool), several at once;
+    at most max_chunks chunks are buffered or in flight. get() only hands off decoded records.
+    """
+
+    reader: RecordingReader
+    chunk_size: int
+    max_chunks: int
+    buffered: int # Decoded records not yet handed off
+
+    _executor: Optional[Executor]
+    _chunks: 'asyncio.Queue[Optional[asyncio.Future[List[Record]]]]'
+    _ready: List[Record]
+    _ready_idx: int
+    _reading: Optional['asyncio.Future[Any]']
+    _task: 'asyncio.Task[None]'
+    _ended: bool
+
+    def __init__(
+        self,
+        reader: RecordingReader,
+        start: int = 0,
+        executor: Optional[Executor] = None,
+        chunk_size: int = 256,
+        max_chunks: int = 8
+    ) -> None:
+        self.reader = reader
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.buffered = 0
+        self._executor = executor
+        self._chunks = asyncio.Queue(maxsize = max_chunks)
+        self._ready = []
+        self._ready_idx = 0
+        self._reading = None
+        self._ended = False
+        self._task = asyncio.create_task(self._fill(start))
+
+    @property
+    def fill(self) -> float:
+        """ Fraction of the buffer holding decoded records """
+        return min(self.buffered / (self.chunk_size * self.max_chunks), 1.0)
+
+    def _on_decoded(self, fut: 'asyncio.Future[List[Record]]') -> None:
+        if not fut.cancelled() and fut.exception() is None:
+            self.buffered += len(fut.result())
+
+    async def _fill(self, start: int) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                self._reading = loop.run_in_executor(None, self.reader.read_chunk, start, self.chunk_size)
+                # Shielded so close() can still wait for the read after cancelling this task
+                decode, payload, n = await asyncio.shield(self._reading)
+                self._reading = None
+                if n == 0:
+                    break
+                start += n
+
+                if decode is None:
+                    decoded: 'asyncio.Future[List[Record]]' = loop.create_future()
+                    decoded.set_result(payload)
+                else:
+                    decoded = loop.run_in_executor(self._executor, decode, payload)
+                decoded.add_done_callback(self._on_decoded)
+                await self._chunks.put(decoded)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            ez.logger.warning(f'Could not read {getattr(self.reader, "path", "recording")}: {e}')
+        await self._chunks.put(None)
+
+    async def get(self) -> Optional[Record]:
+        """ Next record, or None at the end of the recording """
+        while self._ready_idx >= len(self._ready):
+            if self._ended:
+                return None
+            decoded = await self._chunks.get()
+            if decoded is None:
+                self._ended = True
+                return None
+            try:
+                self._ready, self._ready_idx = await decoded, 0
+            except Exception as e:
+                ez.logger.warning(f'Could not decode records: {e}')
+                self._ready, self._ready_idx = [], 0
+        self._ready_idx += 1
+        self.buffered -= 1
+        return self._ready[self._ready_idx - 1]
+
+    async def close(self) -> None:
+        """ Stop reading ahead; waits for an in-progress read so the reader can be reused """
+        self._task.cancel()
+        reading = self._reading
+        if reading is not None:
+            try:
+                await reading
+            except Exception:
+                pass
+        while not self._chunks.empty():
+            decoded = self._chunks.get_nowait()
+            if decoded is not None:
+                decoded.cancel()
+
+
+class MergedPrefetcher:
+    """
+    Prefetcher over a MergedReader: k-way heap merge of one Prefetcher per recording.
+    Each of those buffers up to its own max_chunks, so keep that small; the heap itself
+    only holds the next record of each recording.
+    """
+
+    prefetchers: List[Prefetcher]
+
+    _heap: List[Tuple[float, int, Record]]
+    _primed: bool
+
+    def __init__(self, prefetchers: List[Prefetcher]) -> None:
+        self.prefetchers = prefetchers
+        self._heap = []
+        self._primed = False
+
+    @property
+    def fill(self) -> float:
+        return min(p.fill for p in self.prefetchers) if self.prefetchers else 0.0
+
+    async def _push(self, src: int) -> None:
+        record = await self.prefetchers[src].get()
+        if record is not None:
+            heapq.heappush(self._heap, (merge_key(record[0]), src, record))
+
+    async def get(self) -> Optional[Record]:
+        if not self._primed:
+            for src in range(len(self.prefetchers)):
+                await self._push(src)
+            self._primed = True
+        if not self._heap:
+            return None
+        _, src, record = heapq.heappop(self._heap)
+        await self._push(src)
+        return record
+
+    async def close(self) -> None:
+        for prefetcher in self.prefetchers:
+            await prefetcher.close()
@@ -0,0 +1,238 @@
+import asyncio
+import cProfile
+import functools
+import inspect
+import io
+import json
+import multiprocessing.util
+import os
+import pstats
+import time
+
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import panel
+import pandas as pd
+
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, TypeVar
+
+# Instrumentation is opt-in and decided at import time; when off, instrument()
+# returns functions unchanged and timer() a shared no-op context, so there's no overhead.
+#   EZMSG_PANEL_PROFILE=1              record wall time histograms in every process
+#   EZMSG_PANEL_PROFILE_DUMP=<dir>     also write profile-<pid>.json there on exit
+ENABLED = os.environ.get('EZMSG_PANEL_PROFILE', '') not in ('', '0')
+DUMP_DIR = os.environ.get('EZMSG_PANEL_PROFILE_DUMP')
+
+N_BUCKETS = 48 # Bucket k counts calls taking [2**(k-1), 2**k) ns; the last is open-ended
+
+F = TypeVar('F', bound = Callable[..., Any])
+
+
+class Histogram:
+    """ Call count and log2-bucketed wall time; recording is O(1) """
+
+    count: int
+    total: float
+    max: float
+    buckets: List[int]
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * N_BUCKETS
+
+    def record(self, dur: float) -> None:
+        self.count += 1
+        self.total += dur
+        if dur > self.max:
+            self.max = dur
+        self.buckets[min(int(dur * 1e9).bit_length(), N_BUCKETS - 1)] += 1
+
+    def percentile(self, q: float) -> float:
+        """ Upper edge (sec) of the bucket holding the q-th percentile; within 2x of the true value """
+        if self.count == 0:
+            return 0.0
+        target = self.count * q / 100.0
+        seen = 0
+        for k, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return min((2 ** k) * 1e-9, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return dict(
+            count = self.count,
+            total = self.total,
+            mean = self.total / self.count if self.count else 0.0,
+            p50 = self.percentile(50),
+            p95 = self.percentile(95),
+            p99 = self.percentile(99),
+            max = self.max,
+        )
+
+
+class Profiler:
+    """ Per-process registry of histograms, plus an on-demand cProfile window """
+
+    histograms: Dict[str, Histogram]
+    started: float
+    last_profile: Optional[str]
+    sampling: bool
+
+    def __init__(self) -> None:
+        self.reset()
+        self.last_profile = None
+        self.sampling = False
+
+    def reset(self) -> None:
+        self.histograms = dict()
+        self.started = time.time()
+
+    def record(self, name: str, dur: float) -> None:
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram()
+        hist.record(dur)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return { name: hist.summary() for name, hist in sorted(self.histograms.items()) }
+
+    async def sample(self, duration: float = 5.0, n_lines: int = 40) -> str:
+        """ cProfile this thread (i.e. the event loop) for duration sec; returns the top n_lines by cumulative time """
+        if self.sampling:
+            raise RuntimeError('A profile is already being sampled')
+        self.sampling = True
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            prof.disable()
+            self.sampling = False
+        out = io.StringIO()
+        pstats.Stats(prof, stream = out).sort_stats('cumulative').print_stats(n_lines)
+        self.last_profile = out.getvalue()
+        return self.last_profile
+
+    def dump(self, path: Path) -> None:
+        with open(path, 'w') as f:
+            json.dump(dict(
+                pid = os.getpid(),
+                started = self.started,
+                dumped = time.time(),
+                histograms = self.summary(),
+                last_profile = self.last_profile,
+            ), f, indent = 1)
+
+
+PROFILER = Profiler()
+
+
+def _name(func: Callable[..., Any]) -> str:
+    return func.__qualname__.replace('<locals>.', '')
+
+
+def instrument(func: Optional[F] = None, *, name: Optional[str] = None) -> Any:
+    """
+    Record wall time and call count of func (sync or async) under name,
+    which defaults to its qualified name. Stack below ez.subscriber/ez.task.
+    """
+    def decorator(func: F) -> F:
+        if not ENABLED:
+            return func
+        key = name if name is not None else _name(func)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    PROFILER.record(key, time.perf_counter() - start)
+            return async_wrapper # type: ignore
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                PROFILER.record(key, time.perf_counter() - start)
+        return wrapper # type: ignore
+
+    return decorator if func is None else decorator(func)
+
+
+@contextmanager
+def _timed(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PROFILER.record(name, time.perf_counter() - start)
+
+
+_NULL = nullcontext()
+
+
+def timer(name: str) -> ContextManager[None]:
+    """ Time a block, e.g. one iteration of a long-running task """
+    return _timed(name) if ENABLED else _NULL
+
+
+def view(period: int = 1000) -> panel.viewable.Viewable:
+    """ Diagnostics page for this process: histogram table, reset, and an on-demand cProfile window """
+    table = panel.pane.DataFrame(sizing_mode = 'stretch_width')
+    duration = panel.widgets.FloatInput(name = 'cProfile Duration (sec)', value = 5.0, start = 0.1)
+    sample_button = panel.widgets.Button(name = 'Sample cProfile', button_type = 'primary')
+    reset_button = panel.widgets.Button(name = 'Reset Histograms')
+    output = panel.pane.Str(PROFILER.last_profile or '', sizing_mode = 'stretch_width')
+    status = panel.pane.Markdown('' if ENABLED else
+        '**Instrumentation is off**; set `EZMSG_PANEL_PROFILE=1` before starting the system.')
+
+    def update() -> None:
+        summary = PROFILER.summary()
+        frame = pd.DataFrame.from_dict(summary, orient = 'index')
+        if len(frame):
+            for col in ('total', 'mean', 'p50', 'p95', 'p99', 'max'):
+                frame[col] = frame[col] * 1e3 # ms
+        table.object = frame
+
+    async def on_sample(_: Any) -> None:
+        sample_button.disabled = True
+        try:
+            output.object = await PROFILER.sample(duration.value)
+        except RuntimeError as e:
+            output.object = str(e)
+        finally:
+            sample_button.disabled = False
+
+    def on_reset(_: Any) -> None:
+        PROFILER.reset()
+        update()
+
+    sample_button.on_click(on_sample)
+    reset_button.on_click(on_reset)
+    update()
+    panel.state.add_periodic_callback(update, period = period)
+
+    return panel.Column(
+        status,
+        panel.Row(duration, sample_button, reset_button),
+        '__Wall time (ms)__',
+        table,
+        output,
+        sizing_mode = 'stretch_width',
+    )
+
+
+if ENABLED and DUMP_DIR is not None:
+    def _dump_on_exit() -> None:
+        PROFILER.dump(Path(DUMP_DIR) / f'profile-{os.getpid()}.json')
+
+    # Unlike atexit, this also runs when ezmsg's unit processes exit
+    multiprocessing.util.Finalize(None, _dump_on_exit, exitpriority = 0)
@@ -0,0 +1,101 @@
+import time
+
+import numpy as np
+
+from ezmsg.util.messages.axisarray import AxisArray
+
+from typing import Any, List, Optional, Tuple
+
+
+def message_size(msg: Any, axis: Optional[str] = None) -> Tuple[int, int]:
+    """ Returns (n_samples, n_bytes) for a message; unknown types count as one sample """
+    if isinstance(msg, AxisArray):
+        if not msg.dims:
+            return 1, msg.data.nbytes
+        if axis is None:
+            axis = 'time' if 'time' in msg.dims else msg.dims[0]
+        return msg.data.shape[msg.get_axis_idx(axis)], msg.data.nbytes
+    elif isinstance(msg, np.ndarray):
+        return (msg.shape[0] if msg.ndim else 1), msg.nbytes
+    elif isinstance(msg, (bytes, bytearray, memoryview)):
+        return 1, len(msg)
+    return 1, 0
+
+
+class RateMeter:
+    """
+    Message/sample/byte rate over a sliding window.
+    Counts are accumulated into a fixed ring of time buckets with running totals,
+    so update and readout are O(1) regardless of message rate. Rates are over the
+    time the buckets actually span, including the partly filled current one.
+    """
+
+    window: float
+    n_buckets: int
+
+    _bucket_dur: float
+    _cur_bucket: int
+    _start: float
+    _msgs: List[int]
+    _samples: List[int]
+    _bytes: List[int]
+    _totals: List[int]
+
+    def __init__(self, window: float = 2.0, n_buckets: int = 20) -> None:
+        self.window = window
+        self.n_buckets = n_buckets
+        self._bucket_dur = window / n_buckets
+        self.reset()
+
+    def reset(self, now: Optional[float] = None) -> None:
+        self._start = time.time() if now is None else now
+        self._cur_bucket = int(self._start / self._bucket_dur)
+        self._msgs = [0] * self.n_buckets
+        self._samples = [0] * self.n_buckets
+        self._bytes = [0] * self.n_buckets
+        self._totals = [0, 0, 0]
+
+    def _advance(self, now: Optional[float]) -> int:
+        bucket = int((time.time() if now is None else now) / self._bucket_dur)
+        n_expired = min(bucket - self._cur_bucket, self.n_buckets)
+        for step in range(1, n_expired + 1):
+            idx = (self._cur_bucket + step) % self.n_buckets
+            self._totals[0] -= self._msgs[idx]
+            self._totals[1] -= self._samples[idx]
+            self._totals[2] -= self._bytes[idx]
+            self._msgs[idx] = self._samples[idx] = self._bytes[idx] = 0
+        self._cur_bucket = max(bucket, self._cur_bucket)
+        return self._cur_bucket % self.n_buckets
+
+    def update(self, n_samples: int = 1, n_bytes: int = 0, n_msgs: int = 1, now: Optional[float] = None) -> None:
+        idx = self._advance(now)
+        self._msgs[idx] += n_msgs
+        self._samples[idx] += n_samples
+        self._bytes[idx] += n_bytes
+        self._totals[0] += n_msgs
+        self._totals[1] += n_samples
+        self._totals[2] += n_bytes
+
+    def update_msg(self, msg: Any, axis: Optional[str] = None, now: Optional[float] = None) -> None:
+        n_samples, n_bytes = message_size(msg, axis)
+        self.update(n_samples, n_bytes, now = now)
+
+    def _span(self, now: float) -> float:
+        """ Seconds covered by the buckets: the full expired ones plus the current one so far """
+        partial = now - self._cur_bucket * self._bucket_dur
+        return min(now - self._start, (self.n_buckets - 1) * self._bucket_dur + partial)
+
+    def _rate(self, total: int, now: Optional[float]) -> float:
+        now = time.time() if now is None else now
+        self._advance(now)
+        span = self._span(now)
+        return self._totals[total] / span if span > 0 else 0.0
+
+    def msg_rate(self, now: Optional[float] = None) -> float:
+        return self._rate(0, now)
+
+    def sample_rate(self, now: Optional[float] = None) -> float:
+        return self._rate(1, now)
+
+    def byte_rate(self, now: Optional[float] = None) -> float:
+        return self._rate(2, now)
@@ -1,38 +1,80 @@
 import asyncio
+import sys
 import time
 
+from collections import deque
+from dataclasses import dataclass, field, replace
 from pathlib import Path
 
 import panel
+import pandas as pd
 import ezmsg.core as ez
 
 from param.parameterized import Event
 
-from ezmsg.util.messagelogger import MessageLogger
+from .ratemeter import RateMeter, message_size
+from .profiling import instrument
+from .memory import MEMORY, MemoryUsage
+from .catalog import RecordingCatalog, CatalogBrowser, RecordingInfo
+from .batchwriter import Compression
+from .recording import RecordingFormat, RecordingWriter, TaggedMessage, open_writer, recording_suffix, MANIFEST_SUFFIX
 
-from typing import AsyncGenerator, Any, List, Tuple, Optional
+from typing import AsyncGenerator, Any, Deque, Dict, Iterator, List, Tuple, Type, Optional
 
 class RecorderSettings(ez.Settings):
     data_dir: Path
     name: str = 'Message Recorder'
     msg_rate_window = 2.0 # sec
+    catalog_refresh: float = 10.0 # sec; how often to pick up recordings made elsewhere
+    format: RecordingFormat = RecordingFormat.TEXT
+    time_axis: Optional[str] = None # AXISARRAY format only; if not specified, 'time' or dim 0 is used.
+
+    # Background writer
+    compression: Compression = Compression.NONE
+    batch_bytes: int = 1 << 20 # Write out a batch once it reaches this size...
+    batch_interval: float = 0.5 # sec; ...or once it is this old
+    max_queue: int = 4096 # Messages; recording blocks the logger if the disk falls this far behind
+    status_interval: float = 0.5 # sec
+
+    # Pre-trigger buffer; recent messages are written to the start of each new recording
+    pretrigger_dur: float = 0.0 # sec; 0.0 disables the buffer
+    pretrigger_bytes: int = 64 << 20 # Hard cap on buffered payload size
+
+    # Segment rotation; if either is set, recordings are a manifest plus segment files
+    rotate_mb: Optional[float] = None # Start a new segment after this much (uncompressed) data...
+    rotate_min: Optional[float] = None # ...or after this many minutes
+
+    @property
+    def rotating(self) -> bool:
+        return self.rotate_mb is not None or self.rotate_min is not None
+
+
+@dataclass
+class WriterStatus:
+    depth: int = 0 # Messages waiting on the background writer
+    lag: float = 0.0 # sec; age of the oldest message not yet on disk
 
 class RecorderGUIState(ez.State):
 
     # Diagnostic Widgets
     message_rate: panel.widgets.Number
+    sample_rate: panel.widgets.Number
+    byte_rate: panel.widgets.Number
 
     # Recording Controls
-    file_selector: panel.widgets.FileSelector
+    catalog: RecordingCatalog
+    browser: CatalogBrowser
     rec_dir: panel.widgets.TextInput
     rec_name: panel.widgets.TextInput
     rec_button: panel.widgets.Button
     stop_button: panel.widgets.Button
     rec_file: panel.widgets.StaticText
     rec_msgs: panel.widgets.Number
+    writer_depth: panel.widgets.Number
+    writer_lag: panel.widgets.Number
 
     # Support
-    msg_times: List[float]
+    rate_meter: RateMeter
     cur_rec: Optional[Path] = None
     start_queue: 'asyncio.Queue[Path]'
     stop_queue: 'asyncio.Queue[Path]'
@@ -49,6 +91,8 @@ class RecorderGUI( ez.Unit ):
     INPUT_START = ez.InputStream(Path)
     OUTPUT_STOP = ez.OutputStream(Path)
     INPUT_STOP = ez.InputStream(Path)
+    INPUT_WRITER_STATUS = ez.InputStream(WriterStatus)
+    INPUT_RECORDING_INFO = ez.InputStream(RecordingInfo)
 
     def initialize( self ) -> None:
 
@@ -56,7 +100,8 @@ class RecorderGUI( ez.Unit ):
         self.STATE.stop_queue = asyncio.Queue()
 
         self.SETTINGS.data_dir.mkdir(parents = True, exist_ok = True)
-        self.STATE.file_selector = panel.widgets.FileSelector(self.SETTINGS.data_dir)
+        self.STATE.catalog = RecordingCatalog(self.SETTINGS.data_dir)
+        self.STATE.browser = CatalogBrowser(self.STATE.catalog)
 
         self.STATE.rec_dir = panel.widgets.TextInput(name = 'Recording Subdirectory')
         self.STATE.rec_name = panel.widgets.TextInput(name = 'Recording Name')
@@ -70,7 +115,9 @@ class RecorderGUI( ez.Unit ):
             rec_path = rec_path / rec_dir if rec_dir else rec_path
             out_fname = time.strftime('%Y%m%dT%H%M%S')
             out_fname = f'{rec_name}_{out_fname}' if rec_name else out_fname
-            rec_path = rec_path / f'{out_fname}.txt'
+            suffix = recording_suffix(self.SETTINGS.format, self.SETTINGS.compression)
+            suffix = MANIFEST_SUFFIX if self.SETTINGS.rotating else suffix
+            rec_path = rec_path / f'{out_fname}{suffix}'
             self.STATE.start_queue.put_nowait(rec_path)
 
         self.STATE.rec_button.on_click(start_rec)
@@ -94,21 +141,49 @@ class RecorderGUI( ez.Unit ):
             **number_kwargs
         )
 
+        self.STATE.sample_rate = panel.widgets.Number(
+            name = 'Incoming Sample Rate', 
+            format = '{value} Hz', 
+            **number_kwargs
+        )
+
+        self.STATE.byte_rate = panel.widgets.Number(
+            name = 'Incoming Data Rate', 
+            format = '{value} kB/s', 
+            **number_kwargs
+        )
+
         self.STATE.rec_msgs = panel.widgets.Number(
             format = '{value} msgs', 
             value = 0, 
             **number_kwargs
         )
 
-        self.STATE.msg_times = list()
+        self.STATE.writer_depth = panel.widgets.Number(
+            name = 'Writer Queue',
+            format = '{value} msgs', 
+            value = 0, 
+            **number_kwargs
+        )
+
+        self.STATE.writer_lag = panel.widgets.Number(
+            name = 'Writer Lag',
+            format = '{value} sec', 
+            value = 0, 
+            **number_kwargs
+        )
+
+        self.STATE.rate_meter = RateMeter(self.SETTINGS.msg_rate_window)
     
 
     def panel( self ) -> panel.viewable.Viewable:
 
         return panel.Row(
-            self.STATE.file_selector,
+            self.STATE.browser.panel(),
             panel.Column( 
                 self.STATE.message_rate,
+                self.STATE.sample_rate,
+                self.STATE.byte_rate,
                 self.STATE.rec_dir,
                 self.STATE.rec_name,
                 panel.Row(
@@ -117,6 +192,8 @@ class RecorderGUI( ez.Unit ):
                 ),
                 self.STATE.rec_file,
                 self.STATE.rec_msgs,
+                self.STATE.writer_depth,
+                self.STATE.writer_lag,
             )
         )
 
@@ -145,42 +222,215 @@ class RecorderGUI( ez.Unit ):
         self.STATE.rec_button.disabled = False
         self.STATE.cur_rec = None
         self.STATE.rec_file.loading = False
-        self.STATE.file_selector._refresh()
 
+    @ez.subscriber(INPUT_RECORDING_INFO)
+    async def on_recording_info(self, msg: RecordingInfo) -> None:
+        self.STATE.catalog.add(msg)
+        self.STATE.browser.update()
+
+    @ez.task
+    async def refresh_catalog(self) -> None:
+        # Pick up recordings made elsewhere; only new/changed files are read
+        loop = asyncio.get_running_loop()
+        self.STATE.browser.update()
+        while True:
+            if await loop.run_in_executor(None, self.STATE.catalog.refresh, self.SETTINGS.catalog_refresh):
+                self.STATE.browser.update()
+            await asyncio.sleep(self.SETTINGS.catalog_refresh)
+
+
+    @ez.subscriber(INPUT_WRITER_STATUS)
+    async def on_writer_status(self, msg: WriterStatus) -> None:
+        self.STATE.writer_depth.value = msg.depth
+        self.STATE.writer_lag.value = round(msg.lag, 2)
+
+    def update_rates(self) -> None:
+        meter = self.STATE.rate_meter
+        self.STATE.message_rate.value = round(meter.msg_rate(), 2)
+        self.STATE.sample_rate.value = round(meter.sample_rate(), 2)
+        self.STATE.byte_rate.value = round(meter.byte_rate() / 1e3, 2)
+        self.STATE.rec_msgs.value = self.STATE.n_msgs
 
     @ez.task
     async def update_display(self) -> None:
-        t_window = self.SETTINGS.msg_rate_window
         while True:
             await asyncio.sleep(1.0)
-            cur_time = time.time()
-            self.STATE.msg_times = [ 
-                t for t in self.STATE.msg_times 
-                if (cur_time - t) < t_window
-            ]
-            self.STATE.message_rate.value = len(self.STATE.msg_times) / t_window
-            self.STATE.rec_msgs.value = self.STATE.n_msgs
+            self.update_rates()
 
 
     @ez.subscriber(INPUT_MESSAGE)
+    @instrument
     async def on_signal(self, msg: Any) -> None:
-        now = time.time()
-        self.STATE.msg_times.append(now)
+        self.STATE.rate_meter.update_msg(msg)
 
         if self.STATE.cur_rec is not None:
             self.STATE.n_msgs += 1
 
 
+class PretriggerBuffer:
+    """ Bounded ring of (ts, msg, sid) holding at most max_dur seconds and max_bytes of payload """
+
+    max_dur: float
+    max_bytes: int
+    nbytes: int
+    _ring: Deque[Tuple[float, Any, int, Optional[int]]]
+
+    def __init__(self, max_dur: float, max_bytes: int) -> None:
+        self.max_dur = max_dur
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._ring = deque()
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+    def append(self, msg: Any, ts: float, sid: Optional[int] = None) -> None:
+        n_bytes = message_size(msg)[1] or sys.getsizeof(msg)
+        # Subscribers here aren't zero_copy, so msg is already ours; messages are never mutated
+        self._ring.append((ts, msg, n_bytes, sid))
+        self.nbytes += n_bytes
+        while self._ring and (self.nbytes > self.max_bytes or self._ring[0][0] < ts - self.max_dur):
+            self.nbytes -= self._ring.popleft()[2]
+
+    def __iter__(self) -> Iterator[Tuple[float, Any, Optional[int]]]:
+        for ts, msg, _, sid in self._ring:
+            yield ts, msg, sid
+
+
+class RecordingLoggerState(ez.State):
+    writers: Dict[Path, RecordingWriter] = field(default_factory = dict)
+    infos: Dict[Path, RecordingInfo] = field(default_factory = dict)
+    pretrigger: Optional[PretriggerBuffer] = None
+
+
+class RecordingLogger(ez.Unit):
+    """ Drop-in replacement for MessageLogger that can write any RecordingFormat """
+
+    SETTINGS = RecorderSettings
+    STATE = RecordingLoggerState
+
+    INPUT_START = ez.InputStream(Path)
+    INPUT_STOP = ez.InputStream(Path)
+    INPUT_MESSAGE = ez.InputStream(Any)
+
+    OUTPUT_START = ez.OutputStream(Path)
+    OUTPUT_STOP = ez.OutputStream(Path)
+    OUTPUT_WRITER_STATUS = ez.OutputStream(WriterStatus)
+    OUTPUT_RECORDING_INFO = ez.OutputStream(RecordingInfo)
+
+    def initialize(self) -> None:
+        if self.SETTINGS.pretrigger_dur > 0.0:
+            self.STATE.pretrigger = PretriggerBuffer(
+                self.SETTINGS.pretrigger_dur,
+                self.SETTINGS.pretrigger_bytes
+            )
+        MEMORY.register(self)
+
+    def memory(self) -> MemoryUsage:
+        """ Bytes held in the pretrigger buffer; see ezmsg.panel.memory """
+        pretrigger = self.STATE.pretrigger
+        return dict(buffers = dict(pretrigger = 0 if pretrigger is None else pretrigger.nbytes), sessions = {})
+
+    @property
+    def stream_names(self) -> Optional[List[str]]:
+        """ Stream names, for recordings that tag each record with a stream ID """
+        return None
+
+    def open_file(self, filepath: Path) -> Optional[Path]:
+        if filepath in self.STATE.writers:
+            return None
+        self.STATE.writers[filepath] = open_writer(
+            filepath, 
+            self.SETTINGS.format, 
+            time_axis = self.SETTINGS.time_axis,
+            compression = self.SETTINGS.compression,
+            batch_bytes = self.SETTINGS.batch_bytes,
+            batch_interval = self.SETTINGS.batch_interval,
+            max_queue = self.SETTINGS.max_queue,
+            rotate_bytes = None if self.SETTINGS.rotate_mb is None else int(self.SETTINGS.rotate_mb * 1e6),
+            rotate_sec = None if self.SETTINGS.rotate_min is None else self.SETTINGS.rotate_min * 60.0,
+            streams = self.stream_names,
+        )
+        self.STATE.infos[filepath] = RecordingInfo(filepath, format = self.SETTINGS.format.name)
+
+        if self.STATE.pretrigger is not None:
+            writer, info = self.STATE.writers[filepath], self.STATE.infos[filepath]
+            for ts, msg, sid in self.STATE.pretrigger:
+                writer.write(msg, ts, sid)
+                info.observe(msg, ts)
+
+        return filepath
+
+    async def close_file(self, filepath: Path) -> Optional[Path]:
+        writer = self.STATE.writers.pop(filepath, None)
+        if writer is None:
+            return None
+        # Closing waits for the writer thread to drain
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, writer.close)
+        return filepath
+
+    @ez.subscriber(INPUT_START)
+    @ez.publisher(OUTPUT_START)
+    async def start_file(self, msg: Path) -> AsyncGenerator:
+        out = self.open_file(msg)
+        if out is not None:
+            yield self.OUTPUT_START, out
+
+    @ez.subscriber(INPUT_STOP)
+    @ez.publisher(OUTPUT_STOP)
+    @ez.publisher(OUTPUT_RECORDING_INFO)
+    async def stop_file(self, msg: Path) -> AsyncGenerator:
+        out = await self.close_file(msg)
+        if out is not None:
+            # Recording metadata is computed once here rather than by rescanning the file
+            info = self.STATE.infos.pop(out)
+            yield self.OUTPUT_RECORDING_INFO, info.stat()
+            yield self.OUTPUT_STOP, out
+
+    @ez.publisher(OUTPUT_WRITER_STATUS)
+    async def pub_writer_status(self) -> AsyncGenerator:
+        last = WriterStatus()
+        while True:
+            await asyncio.sleep(self.SETTINGS.status_interval)
+            writers = list(self.STATE.writers.values())
+            status = WriterStatus(
+                depth = sum(w.depth for w in writers),
+                lag = max((w.lag for w in writers), default = 0.0)
+            )
+            if writers or status != last:
+                yield self.OUTPUT_WRITER_STATUS, status
+            last = status
+
+    def write(self, msg: Any, sid: Optional[int] = None) -> None:
+        ts = time.time()
+        for writer in self.STATE.writers.values():
+            writer.write(msg, ts, sid)
+        for info in self.STATE.infos.values():
+            info.observe(msg, ts)
+        if self.STATE.pretrigger is not None:
+            self.STATE.pretrigger.append(msg, ts, sid)
+
+    @ez.subscriber(INPUT_MESSAGE)
+    async def on_message(self, msg: Any) -> None:
+        self.write(msg)
+
+    async def shutdown(self) -> None:
+        for filepath in list(self.STATE.writers):
+            await self.close_file(filepath)
+
+
 class Recorder(ez.Collection):
     SETTINGS = RecorderSettings
 
     INPUT_MESSAGE = ez.InputStream(Any)
 
     GUI = RecorderGUI()
-    LOGGER = MessageLogger()
+    LOGGER = RecordingLogger()
 
     def configure(self) -> None:
         self.GUI.apply_settings(self.SETTINGS)
+        self.LOGGER.apply_settings(self.SETTINGS)
 
     def network(self) -> ez.NetworkDefinition:
         return (
@@ -190,7 +440,156 @@ class Recorder(ez.Collection):
             (self.GUI.OUTPUT_START, self.LOGGER.INPUT_START),
             (self.LOGGER.OUTPUT_START, self.GUI.INPUT_START),
             (self.GUI.OUTPUT_STOP, self.LOGGER.INPUT_STOP),
-            (self.LOGGER.OUTPUT_STOP, self.GUI.INPUT_STOP)
+            (self.LOGGER.OUTPUT_STOP, self.GUI.INPUT_STOP),
+            (self.LOGGER.OUTPUT_WRITER_STATUS, self.GUI.INPUT_WRITER_STATUS),
+            (self.LOGGER.OUTPUT_RECORDING_INFO, self.GUI.INPUT_RECORDING_INFO),
+        )
+    
+    def process_components(self) -> Tuple[ez.Component, ...]:
+        return (self.LOGGER, )
+
+    def panel(self) -> panel.viewable.Viewable:
+        return self.GUI.panel()
+
+
+class MultiRecorderSettings(RecorderSettings):
+    streams: Tuple[str, ...] = () # Filled in by MultiRecorder from its INPUT_* streams
+
+
+class StreamTaggerSettings(ez.Settings):
+    sid: int
+
+
+class StreamTagger(ez.Unit):
+    SETTINGS = StreamTaggerSettings
+
+    INPUT_MESSAGE = ez.InputStream(Any)
+    OUTPUT_TAGGED = ez.OutputStream(TaggedMessage)
+
+    @ez.subscriber(INPUT_MESSAGE)
+    @ez.publisher(OUTPUT_TAGGED)
+    async def on_message(self, msg: Any) -> AsyncGenerator:
+        yield self.OUTPUT_TAGGED, TaggedMessage(self.SETTINGS.sid, msg)
+
+
+class MultiRecorderGUIState(RecorderGUIState):
+    stream_meters: List[RateMeter]
+    stream_rates: panel.pane.DataFrame
+
+
+class MultiRecorderGUI(RecorderGUI):
+    SETTINGS = MultiRecorderSettings
+    STATE = MultiRecorderGUIState
+
+    INPUT_TAGGED = ez.InputStream(TaggedMessage)
+
+    def initialize(self) -> None:
+        super().initialize()
+        self.STATE.stream_meters = [
+            RateMeter(self.SETTINGS.msg_rate_window) 
+            for _ in self.SETTINGS.streams
+        ]
+        self.STATE.stream_rates = panel.pane.DataFrame(sizing_mode = 'stretch_width')
+
+    def panel(self) -> panel.viewable.Viewable:
+        return panel.Column(
+            super().panel(),
+            '__Stream Rates__',
+            self.STATE.stream_rates,
+        )
+
+    def update_rates(self) -> None:
+        super().update_rates()
+        self.STATE.stream_rates.object = pd.DataFrame({
+            'Messages (Hz)': [round(m.msg_rate(), 2) for m in self.STATE.stream_meters],
+            'Samples (Hz)': [round(m.sample_rate(), 2) for m in self.STATE.stream_meters],
+            'Data (kB/s)': [round(m.byte_rate() / 1e3, 2) for m in self.STATE.stream_meters],
+        }, index = list(self.SETTINGS.streams))
+
+    @ez.subscriber(INPUT_TAGGED)
+    @instrument
+    async def on_tagged(self, msg: TaggedMessage) -> None:
+        self.STATE.rate_meter.update_msg(msg.msg)
+        self.STATE.stream_meters[msg.sid].update_msg(msg.msg)
+
+        if self.STATE.cur_rec is not None:
+            self.STATE.n_msgs += 1
+
+
+class MultiStreamLogger(RecordingLogger):
+    """ Writes several streams into one TEXT recording; records carry their stream ID """
+
+    SETTINGS = MultiRecorderSettings
+
+    INPUT_TAGGED = ez.InputStream(TaggedMessage)
+
+    @property
+    def stream_names(self) -> Optional[List[str]]:
+        return list(self.SETTINGS.streams)
+
+    @ez.subscriber(INPUT_TAGGED)
+    async def on_tagged(self, msg: TaggedMessage) -> None:
+        self.write(msg.msg, msg.sid)
+
+
+class MultiRecorder(ez.Collection):
+    """
+    Records several named streams into one file through one writer process.
+    Each stream has an input, INPUT_<NAME>, and a StreamTagger, TAG_<NAME>; build
+    such a collection with multi_recorder rather than subclassing this directly.
+    """
+
+    SETTINGS = MultiRecorderSettings
+
+    GUI = MultiRecorderGUI()
+    LOGGER = MultiStreamLogger()
+
+    @property
+    def inputs(self) -> List[str]:
+        return [
+            stream_name for stream_name, stream in self.streams.items()
+            if isinstance(stream, ez.InputStream) and stream_name.startswith('INPUT_')
+        ]
+
+    @property
+    def taggers(self) -> List[StreamTagger]:
+        return [self.components[f'TAG_{stream_name[len("INPUT_"):]}'] for stream_name in self.inputs]
+
+    @property
+    def stream_names(self) -> Tuple[str, ...]:
+        return tuple(stream_name[len('INPUT_'):].lower() for stream_name in self.inputs)
+
+    def configure(self) -> None:
+        if self.SETTINGS.format != RecordingFormat.TEXT:
+            ez.logger.warning(f'{self.address}: multi-stream recordings use {RecordingFormat.TEXT}')
+        settings = replace(
+            self.SETTINGS, 
+            streams = self.stream_names, 
+            format = RecordingFormat.TEXT
+        )
+        self.GUI.apply_settings(settings)
+        self.LOGGER.apply_settings(settings)
+
+    def network(self) -> ez.NetworkDefinition:
+        inputs = [
+            (self.streams[stream_name], tagger.INPUT_MESSAGE) 
+            for stream_name, tagger in zip(self.inputs, self.taggers)
+        ]
+        tagged = [
+            (tagger.OUTPUT_TAGGED, unit.INPUT_TAGGED)
+            for tagger in self.taggers
+            for unit in (self.GUI, self.LOGGER)
+        ]
+        return (
+            *inputs,
+            *tagged,
+
+            (self.GUI.OUTPUT_START, self.LOGGER.INPUT_START),
+            (self.LOGGER.OUTPUT_START, self.GUI.INPUT_START),
+            (self.GUI.OUTPUT_STOP, self.LOGGER.INPUT_STOP),
+            (self.LOGGER.OUTPUT_STOP, self.GUI.INPUT_STOP),
+            (self.LOGGER.OUTPUT_WRITER_STATUS, self.GUI.INPUT_WRITER_STATUS),
+            (self.LOGGER.OUTPUT_RECORDING_INFO, self.GUI.INPUT_RECORDING_INFO),
         )
     
     def process_components(self) -> Tuple[ez.Component, ...]:
@@ -199,3 +598,18 @@ class Recorder(ez.Collection):
     def panel(self) -> panel.viewable.Viewable:
         return self.GUI.panel()
 
+
+def multi_recorder(name: str, **streams: Any) -> Type[MultiRecorder]:
+    """
+    A MultiRecorder recording each keyword's stream of messages of the given type.
+    Stream IDs follow argument order:
+
+        EEGRecorder = multi_recorder('EEGRecorder', eeg = AxisArray, markers = str)
+
+    EEGRecorder.INPUT_EEG records the stream named 'eeg'.
+    """
+    fields: Dict[str, Any] = {}
+    for sid, (stream_name, msg_type) in enumerate(streams.items()):
+        fields[f'INPUT_{stream_name.upper()}'] = ez.InputStream(msg_type)
+        fields[f'TAG_{stream_name.upper()}'] = StreamTagger(StreamTaggerSettings(sid))
+    return type(name, (MultiRecorder, ), fields)
@@ -0,0 +1,575 @@
+import enum
+import functools
+import heapq
+import itertools
+import json
+import os
+import re
+import threading
+import time
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+import ezmsg.core as ez
+
+from ezmsg.util.messagecodec import MessageEncoder, MessageDecoder, LogStart
+
+from .axisarrayfile import AxisArrayFileWriter, AxisArrayFileReader, index_path
+from .batchwriter import BatchWriter, Compression
+
+from typing import IO, Any, BinaryIO, Callable, Dict, FrozenSet, Iterator, List, Optional, Protocol, Tuple
+
+
+MANIFEST_SUFFIX = '.manifest'
+SEGMENTS_SUFFIX = '.segments'
+
+class RecordingFormat(enum.Enum):
+    TEXT = 'txt' # MessageLogger-compatible JSON lines; records any message type
+    AXISARRAY = 'axarr' # Binary columnar AxisArray stream; see axisarrayfile
+
+    @property
+    def suffix(self) -> str:
+        return f'.{self.value}'
+
+    @classmethod
+    def from_path(cls, path: Path) -> 'RecordingFormat':
+        if path.suffix == MANIFEST_SUFFIX:
+            return cls[read_manifest(path)['format']]
+        if Compression.from_path(path) != Compression.NONE:
+            path = path.with_suffix('')
+        for fmt in cls:
+            if path.suffix == fmt.suffix:
+                return fmt
+        return cls.TEXT
+
+
+def is_recording(path: Path) -> bool:
+    if not path.is_file() or path.name.startswith('.'):
+        return False
+    if path.suffix == MANIFEST_SUFFIX:
+        return True
+    if path.parent.suffix == SEGMENTS_SUFFIX: # Part of a segmented recording
+        return False
+    if Compression.from_path(path) != Compression.NONE:
+        path = path.with_suffix('')
+    return any(path.suffix == fmt.suffix for fmt in RecordingFormat)
+
+
+def recording_suffix(format: RecordingFormat, compression: Compression = Compression.NONE) -> str:
+    return format.suffix + compression.suffix
+
+
+def read_manifest(path: Path) -> Dict[str, Any]:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def recording_paths(path: Path) -> List[Path]:
+    """ Data files making up a recording; segments for a manifest, otherwise the file itself """
+    if path.suffix == MANIFEST_SUFFIX:
+        return [path.parent / seg['path'] for seg in read_manifest(path)['segments']]
+    return [path]
+
+
+def recording_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in recording_paths(path) if p.exists())
+
+
+@dataclass
+class StreamTable:
+    """ Header record of a multi-stream recording; stream ID i is names[i] """
+    names: List[str]
+
+
+# Records that describe the recording rather than carry a message
+HEADER_TYPES = (LogStart, StreamTable)
+
+
+@dataclass
+class TaggedMessage:
+    """ A message from one stream of a multi-stream recording """
+    sid: int # Index into the StreamTable
+    msg: Any # None if the reader skipped this stream without decoding it
+
+
+class RecordingWriter(Protocol):
+    def write(self, msg: Any, ts: float, sid: Optional[int] = None) -> None: ...
+    def close(self) -> None: ...
+
+    @property
+    def depth(self) -> int: ...
+
+    @property
+    def lag(self) -> float: ...
+
+    @property
+    def nbytes(self) -> int: ...
+
+
+Record = Tuple[Optional[float], Any]
+
+# A run of records as read from disk: (decode, payload, # of records).
+# decode(payload) yields the records; it is a picklable module-level function
+# so it can run in a process pool. decode is None if payload is already decoded.
+RawChunk = Tuple[Optional[Callable[[Any], List[Record]]], Any, int]
+
+
+class RecordingReader(Protocol):
+    def __len__(self) -> int: ...
+    def __iter__(self) -> Iterator[Record]: ...
+
+    @property
+    def timestamps(self) -> npt.NDArray: ... # Per record; NaN where unknown
+
+    def iter_from(self, start: int) -> Iterator[Record]: ...
+    def read_chunk(self, start: int, n: int) -> RawChunk: ... # Up to n records; 0 at the end
+    def close(self) -> None: ...
+
+
+def encode_record(msg: Any, ts: float, sid: Optional[int] = None) -> str:
+    if sid is None:
+        return json.dumps({'ts': ts, 'obj': msg}, cls = MessageEncoder)
+    # Stream ID goes right after ts so readers can pick it out of the line prefix
+    return json.dumps({'ts': ts, 'sid': sid, 'obj': msg}, cls = MessageEncoder)
+
+
+class TextLogWriter:
+
+    _f: BinaryIO
+    _streams: Optional[List[str]]
+    _started: bool
+
+    def __init__(self, f: BinaryIO, streams: Optional[List[str]] = None) -> None:
+        self._f = f
+        self._streams = streams
+        self._started = False
+
+    def _start(self, ts: float) -> None:
+        # Stamped with the first record's time, which can predate opening (e.g. pre-trigger data),
+        # so timestamps never decrease through the file
+        self._started = True
+        self._write(LogStart(), ts)
+        if self._streams is not None:
+            self._write(StreamTable(list(self._streams)), ts)
+
+    @property
+    def depth(self) -> int:
+        return getattr(self._f, 'depth', 0)
+
+    @property
+    def lag(self) -> float:
+        return getattr(self._f, 'lag', 0.0)
+
+    @property
+    def nbytes(self) -> int:
+        return getattr(self._f, 'bytes_queued', 0)
+
+    def _write(self, msg: Any, ts: float, sid: Optional[int] = None) -> None:
+        self._f.write(f'{encode_record(msg, ts, sid)}\n'.encode('utf-8'))
+        self._f.flush()
+
+    def write(self, msg: Any, ts: float, sid: Optional[int] = None) -> None:
+        if not self._started:
+            self._start(ts)
+        self._write(msg, ts, sid)
+
+    def close(self) -> None:
+        if not self._started:
+            self._start(time.time())
+        self._f.close()
+
+
+TS_PREFIX = re.compile(rb'\{"ts": ([-+.eE0-9]+|null)(?:, "sid": (\d+))?')
+
+
+def text_index_path(path: Path) -> Path:
+    return path.parent / f'.{path.name}.index.npz'
+
+
+def build_text_index(path: Path) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    """
+    Byte offset, timestamp and stream ID (-1 if untagged) of every line;
+    these come from the record prefix, not a JSON decode
+    """
+    offsets: List[int] = []
+    timestamps: List[float] = []
+    sids: List[int] = []
+    pos = 0
+    with Compression.from_path(path).open(path, 'rb') as f:
+        for line in f:
+            offsets.append(pos)
+            pos += len(line)
+            match = TS_PREFIX.match(line)
+            ts = match.group(1) if match else b'null'
+            timestamps.append(float('nan') if ts == b'null' else float(ts))
+            sids.append(int(match.group(2)) if match and match.group(2) is not None else -1)
+    return (
+        np.array(offsets, dtype = np.int64), 
+        np.array(timestamps, dtype = np.float64), 
+        np.array(sids, dtype = np.int32)
+    )
+
+
+def decode_line(line: bytes, include: Optional[FrozenSet[int]] = None) -> Record:
+    """
+    Decodes one record; tagged messages come back as TaggedMessage.
+    Streams not in include are skipped by their prefix and never JSON-decoded.
+    Raises json.JSONDecodeError.
+    """
+    if include is not None:
+        match = TS_PREFIX.match(line)
+        if match is not None and match.group(2) is not None and int(match.group(2)) not in include:
+            ts = match.group(1)
+            return (None if ts == b'null' else float(ts)), TaggedMessage(int(match.group(2)), None)
+    record = json.loads(line, cls = MessageDecoder)
+    if 'sid' in record:
+        return record.get('ts'), TaggedMessage(record['sid'], record['obj'])
+    return record.get('ts'), record['obj']
+
+
+def decode_lines(lines: List[bytes], include: Optional[FrozenSet[int]] = None) -> List[Record]:
+    records: List[Record] = []
+    for line in lines:
+        try:
+            records.append(decode_line(line, include))
+        except json.JSONDecodeError:
+            ez.logger.warning(f'Could not decode recorded line: {line[:80]!r}')
+    return records
+
+
+class TextLogReader:
+    """
+    Random access to a JSON-lines recording through a line offset index.
+    The index is cached next to the recording and rebuilt when the file changes.
+    Seeking is O(1) for uncompressed files; compressed files decompress up to the target.
+    """
+
+    path: Path
+    offsets: npt.NDArray
+    sids: npt.NDArray # Stream ID per record; -1 if untagged
+    include: Optional[FrozenSet[int]] # Stream IDs to decode; None decodes all. See select_streams
+    _timestamps: npt.NDArray
+    _chunk_f: Optional[IO[bytes]] # Kept open between read_chunk calls
+    _chunk_next: int # Record _chunk_f is positioned at
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.include = None
+        self._chunk_f = None
+        self._chunk_next = 0
+        st = path.stat()
+        cache_path = text_index_path(path)
+        try:
+            with np.load(cache_path) as cache:
+                if (int(cache['size']), float(cache['mtime'])) != (st.st_size, st.st_mtime):
+                    raise ValueError('stale index')
+                self.offsets, self._timestamps, self.sids = cache['offsets'], cache['timestamps'], cache['sids']
+        except (OSError, ValueError, KeyError):
+            self.offsets, self._timestamps, self.sids = build_text_index(path)
+            try:
+                with open(cache_path, 'wb') as f:
+                    np.savez(f, offsets = self.offsets, timestamps = self._timestamps, sids = self.sids,
+                        size = st.st_size, mtime = st.st_mtime)
+            except OSError:
+                pass # Read-only data_dir; index will be rebuilt next time
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def timestamps(self) -> npt.NDArray:
+        return self._timestamps
+
+    def iter_from(self, start: int) -> Iterator[Tuple[Optional[float], Any]]:
+        if start >= len(self):
+            return
+        with Compression.from_path(self.path).open(self.path, 'rb') as f:
+            f.seek(int(self.offsets[start]))
+            for line_idx, line in enumerate(f, start):
+                try:
+                    yield decode_line(line, self.include)
+                except json.JSONDecodeError:
+                    ez.logger.warning(f'Could not load line {line_idx} from {self.path}')
+
+    def __iter__(self) -> Iterator[Tuple[Optional[float], Any]]:
+        return self.iter_from(0)
+
+    def read_chunk(self, start: int, n: int) -> RawChunk:
+        n = max(min(n, len(self) - start), 0)
+        if n == 0:
+            return None, [], 0
+        if self._chunk_f is None:
+            self._chunk_f = Compression.from_path(self.path).open(self.path, 'rb')
+        if start != self._chunk_next: # Avoid seeks when reading sequentially; they're slow when compressed
+            self._chunk_f.seek(int(self.offsets[start]))
+        lines = [self._chunk_f.readline() for _ in range(n)]
+        self._chunk_next = start + n
+        if self.include is not None:
+            return functools.partial(decode_lines, include = self.include), lines, n
+        return decode_lines, lines, n
+
+    def close(self) -> None:
+        if self._chunk_f is not None:
+            self._chunk_f.close()
+            self._chunk_f = None
+
+
+class RotatingWriter:
+    """
+    Splits a recording into segment files under <stem>.segments/, rolling over to a new
+    segment once the current one holds rotate_bytes or spans rotate_sec. Rollover happens
+    between two writes, so no message is dropped. A JSON manifest ties the segments together.
+    """
+
+    path: Path
+    format: RecordingFormat
+    rotate_bytes: Optional[int]
+    rotate_sec: Optional[float]
+
+    _open_segment: Callable[[Path], RecordingWriter]
+    _suffix: str
+    _segments: List[Dict[str, Any]]
+    _writer: RecordingWriter
+    _closers: List[threading.Thread]
+
+    def __init__(
+        self,
+        path: Path,
+        format: RecordingFormat,
+        open_segment: Callable[[Path], RecordingWriter],
+        suffix: str,
+        rotate_bytes: Optional[int] = None,
+        rotate_sec: Optional[float] = None
+    ) -> None:
+        self.path = path
+        self.format = format
+        self.rotate_bytes = rotate_bytes
+        self.rotate_sec = rotate_sec
+        self._open_segment = open_segment
+        self._suffix = suffix
+        self._segments = []
+        self._closers = []
+        self._writer = self._next_segment()
+
+    @property
+    def segment_dir(self) -> Path:
+        return self.path.with_suffix(SEGMENTS_SUFFIX)
+
+    @property
+    def depth(self) -> int:
+        return self._writer.depth
+
+    @property
+    def lag(self) -> float:
+        return self._writer.lag
+
+    @property
+    def nbytes(self) -> int:
+        return sum(seg['nbytes'] for seg in self._segments[:-1]) + self._writer.nbytes
+
+    def _next_segment(self) -> RecordingWriter:
+        seg_path = self.segment_dir / f'{len(self._segments):04d}{self._suffix}'
+        writer = self._open_segment(seg_path)
+        self._segments.append(dict(
+            path = str(seg_path.relative_to(self.path.parent)),
+            start = None, end = None, n_msgs = 0, nbytes = 0
+        ))
+        self._write_manifest()
+        return writer
+
+    def _write_manifest(self) -> None:
+        tmp_path = self.path.parent / f'.{self.path.name}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(format = self.format.name, segments = self._segments), f, indent = 1)
+        os.replace(tmp_path, self.path)
+
+    def _should_rotate(self, ts: float) -> bool:
+        seg = self._segments[-1]
+        if seg['n_msgs'] == 0:
+            return False
+        if self.rotate_bytes is not None and self._writer.nbytes >= self.rotate_bytes:
+            return True
+        return self.rotate_sec is not None and (ts - seg['start']) >= self.rotate_sec
+
+    def write(self, msg: Any, ts: float, sid: Optional[int] = None) -> None:
+        if self._should_rotate(ts):
+            self._segments[-1]['nbytes'] = self._writer.nbytes
+            # Closing drains the segment's writer thread; don't wait on it here
+            closer = threading.Thread(target = self._writer.close, daemon = True)
+            closer.start()
+            self._closers.append(closer)
+            self._writer = self._next_segment()
+
+        self._writer.write(msg, ts, sid)
+        seg = self._segments[-1]
+        seg['start'] = ts if seg['start'] is None else seg['start']
+        seg['end'] = ts
+        seg['n_msgs'] += 1
+
+    def close(self) -> None:
+        self._segments[-1]['nbytes'] = self._writer.nbytes
+        self._writer.close()
+        for closer in self._closers:
+            closer.join()
+        self._write_manifest()
+
+
+class SegmentedReader:
+
+    path: Path
+    readers: List['RecordingReader']
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.readers = [open_reader(seg_path) for seg_path in recording_paths(path)]
+
+    def __len__(self) -> int:
+        return sum(len(reader) for reader in self.readers)
+
+    @property
+    def timestamps(self) -> npt.NDArray:
+        return np.concatenate([reader.timestamps for reader in self.readers] + [np.zeros(0)])
+
+    def iter_from(self, start: int) -> Iterator[Tuple[Optional[float], Any]]:
+        for reader in self.readers:
+            if start < len(reader):
+                yield from reader.iter_from(start)
+            start = max(start - len(reader), 0)
+
+    def __iter__(self) -> Iterator[Tuple[Optional[float], Any]]:
+        return self.iter_from(0)
+
+    def read_chunk(self, start: int, n: int) -> RawChunk:
+        # Chunks never span segments
+        for reader in self.readers:
+            if start < len(reader):
+                return reader.read_chunk(start, n)
+            start -= len(reader)
+        return None, [], 0
+
+    def close(self) -> None:
+        for reader in self.readers:
+            reader.close()
+
+
+def merge_key(ts: Optional[float]) -> float:
+    return -np.inf if ts is None or np.isnan(ts) else ts
+
+
+class MergedReader:
+    """
+    Several recordings interleaved by timestamp, as one recording.
+    Ties go to the reader listed first. Records are streamed through a k-way heap merge,
+    so only one record per reader is held in memory.
+    """
+
+    readers: List['RecordingReader']
+
+    def __init__(self, readers: List['RecordingReader']) -> None:
+        self.readers = readers
+
+    def __len__(self) -> int:
+        return sum(len(reader) for reader in self.readers)
+
+    def _merge(self) -> Tuple[npt.NDArray, npt.NDArray]:
+        # Timestamps in merged order, and the reader index of each of those records
+        ts = np.concatenate([reader.timestamps for reader in self.readers] + [np.zeros(0)])
+        owner = np.repeat(np.arange(len(self.readers)), [len(reader) for reader in self.readers])
+        order = np.argsort(np.where(np.isnan(ts), -np.inf, ts), kind = 'stable')
+        return ts[order], owner[order]
+
+    @property
+    def timestamps(self) -> npt.NDArray:
+        return self._merge()[0]
+
+    def starts(self, start: int) -> List[int]:
+        """ Position within each reader of merged record start """
+        counts = np.bincount(self._merge()[1][:start], minlength = len(self.readers))
+        return [int(count) for count in counts]
+
+    def iter_from(self, start: int) -> Iterator[Record]:
+        iters = [reader.iter_from(s) for reader, s in zip(self.readers, self.starts(start))]
+        return heapq.merge(*iters, key = lambda record: merge_key(record[0]))
+
+    def __iter__(self) -> Iterator[Record]:
+        return self.iter_from(0)
+
+    def read_chunk(self, start: int, n: int) -> RawChunk:
+        # Prefetching merges per-reader prefetchers instead; see prefetch.MergedPrefetcher
+        chunk = list(itertools.islice(self.iter_from(start), n))
+        return None, chunk, len(chunk)
+
+    def close(self) -> None:
+        for reader in self.readers:
+            reader.close()
+
+
+def open_writer(
+    path: Path, 
+    format: RecordingFormat, 
+    time_axis: Optional[str] = None,
+    compression: Compression = Compression.NONE,
+    batch_bytes: int = 1 << 20,
+    batch_interval: float = 0.5,
+    max_queue: int = 4096,
+    rotate_bytes: Optional[int] = None,
+    rotate_sec: Optional[float] = None,
+    streams: Optional[List[str]] = None,
+) -> RecordingWriter:
+    """
+    Recording writes are batched and written by background threads.
+    If streams are named, records are tagged with a stream ID; see StreamTable.
+    """
+    if streams is not None and format != RecordingFormat.TEXT:
+        raise ValueError(f'Multi-stream recordings must use {RecordingFormat.TEXT}')
+    path.parent.mkdir(parents = True, exist_ok = True)
+
+    if path.suffix == MANIFEST_SUFFIX:
+        def open_segment(seg_path: Path) -> RecordingWriter:
+            return open_writer(seg_path, format, time_axis, compression, 
+                batch_bytes, batch_interval, max_queue, streams = streams)
+        suffix = recording_suffix(format, compression)
+        return RotatingWriter(path, format, open_segment, suffix, rotate_bytes, rotate_sec)
+
+    data_f = BatchWriter(path, batch_bytes, batch_interval, max_queue, compression)
+    if format == RecordingFormat.AXISARRAY:
+        index_f = BatchWriter(index_path(path), batch_bytes, batch_interval, max_queue)
+        return AxisArrayFileWriter(data_f, index_f, time_axis = time_axis)
+    return TextLogWriter(data_f, streams)
+
+
+def read_stream_table(reader: RecordingReader) -> Optional[StreamTable]:
+    """ Stream names of a multi-stream recording; merged recordings are assumed to share them """
+    for _, obj in itertools.islice(reader.iter_from(0), 2 * len(getattr(reader, 'readers', [reader]))):
+        if isinstance(obj, StreamTable):
+            return obj
+    return None
+
+
+def select_streams(reader: RecordingReader, include: Optional[FrozenSet[int]]) -> None:
+    """
+    Decode only these stream IDs; other streams' records are read as TaggedMessage(sid, None).
+    Only text recordings can be multi-stream.
+    """
+    for sub_reader in getattr(reader, 'readers', [reader]):
+        if isinstance(sub_reader, TextLogReader):
+            sub_reader.include = include
+        elif hasattr(sub_reader, 'readers'):
+            select_streams(sub_reader, include)
+
+
+def open_reader(path: Path) -> RecordingReader:
+    if path.suffix == MANIFEST_SUFFIX:
+        return SegmentedReader(path)
+    if RecordingFormat.from_path(path) == RecordingFormat.AXISARRAY:
+        return AxisArrayFileReader(path)
+    return TextLogReader(path)
+
+
+def open_merged(paths: List[Path]) -> RecordingReader:
+    if len(paths) == 1:
+        return open_reader(paths[0])
+    return MergedReader([open_reader(path) for path in paths])
@@ -1,44 +1,118 @@
 import asyncio
+import functools
+import multiprocessing
 import typing
 import time
 
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from dataclasses import dataclass, field, replace
 from pathlib import Path
 
+import numpy as np
+
 import panel
 import ezmsg.core as ez
 
+from bokeh.plotting import figure
+from bokeh.models import ColumnDataSource, Span
+from bokeh.models.renderers import GlyphRenderer
+
 from param.parameterized import Event
 
-from ezmsg.util.messagereplay import MessageReplay, ReplayStatusMessage, FileReplayMessage
+from ezmsg.util.messagereplay import ReplayStatusMessage, FileReplayMessage
+
+from .ratemeter import RateMeter
+from .profiling import instrument
+from .catalog import RecordingCatalog, CatalogBrowser
+from .overview import Overview, load_overview
+from .prefetch import MergedPrefetcher, Prefetcher
+from .recording import MergedReader, RecordingReader, TaggedMessage, HEADER_TYPES, open_merged, read_stream_table, select_streams
 
 class ReplaySettings(ez.Settings):
     data_dir: Path
     name: str = 'Message Replay'
     msg_rate_window = 2.0 # sec
+    catalog_refresh: float = 10.0 # sec; how often to pick up new recordings
+    decode_workers: int = 0 # Decode on a thread; > 0 decodes in a pool of this many processes
+    prefetch_chunk: int = 256 # Records per decode job
+    prefetch_chunks: int = 8 # Max chunks buffered ahead of playback; merged replay buffers 1 per recording
+
+    # Multi-stream recordings with stream outputs (see multi_replay): streams without an
+    # output are skipped rather than decoded and sent to OUTPUT_MESSAGE
+    skip_unrouted: bool = True
+
+    # Paced replay (see ReplayRequest.paced): at most credit_window published messages may go
+    # unacknowledged on INPUT_ACK. Keep it below any leaky queue's size downstream so nothing is dropped.
+    credit_window: int = 8
+    credit_timeout: float = 2.0 # sec; with no acknowledgement this long, replay stops waiting until the next one
+
+
+# Messages due within this long of now are emitted without sleeping, so a
+# burst of messages costs one sleep instead of one (jittery) sleep each.
+DEADLINE_SLACK = 0.005 # sec
+
+SPEEDS = [0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0]
+
+
+@dataclass
+class ReplayRequest(FileReplayMessage):
+    start: int = 0 # Record index to start replaying from
+    speed: float = 1.0 # Multiplier on recorded timing; only used when rate == 0.0
+    merge: typing.List[Path] = field(default_factory = list) # Replayed interleaved with filename by timestamp
+    paced: bool = False # Throttle to the consumer's acknowledgements; combines with rate
+
+
+@dataclass
+class ReplayStatus(ReplayStatusMessage):
+    elapsed: float = 0.0 # sec into the recording at idx
+    duration: float = 0.0 # sec
+    buffer: float = 0.0 # Fill fraction of the decode buffer
+
+
+BAR_COLOR_PLAYING = '#0072b5'
+BAR_COLOR_DONE = '#28a745'
+
+
+def _fmt_time(sec: float) -> str:
+    return f'{int(sec // 60):02d}:{sec % 60:04.1f}'
+
 
 class ReplayGUIState(ez.State):
 
     # Diagnostic Widgets
     message_rate: panel.widgets.Number
+    buffer_fill: panel.widgets.Number
     
 
     # Playback Controls
-    file_selector: panel.widgets.FileSelector
+    catalog: RecordingCatalog
+    browser: CatalogBrowser
+    refresh_button: panel.widgets.Button
     enqueue_button: panel.widgets.Button
     pause_toggle: panel.widgets.Toggle
     stop_button: panel.widgets.Button
     playback_file: panel.widgets.StaticText
-    playback: panel.indicators.Progress
+    playback: panel.widgets.IntSlider
 
     rapid: panel.widgets.Checkbox
+    paced: panel.widgets.Checkbox
     rate: panel.widgets.FloatInput
+    speed: panel.widgets.Select
+    merge: panel.widgets.Checkbox
 
     # Support
-    file_queue: 'asyncio.Queue[Path]'
+    file_queue: 'asyncio.Queue[ReplayRequest]'
+    last_request: typing.Optional[ReplayRequest] = None
     stop_queue: 'asyncio.Queue[bool]'
     pause_queue: 'asyncio.Queue[bool]'
-    msg_times: typing.List[float]
+    seek_queue: 'asyncio.Queue[int]'
+    rate_meter: RateMeter
     replay_status: typing.Optional[ReplayStatusMessage] = None
+    refresh_queue: 'asyncio.Queue[bool]'
+    overview_queue: 'asyncio.Queue[Path]'
+    overview_path: typing.Optional[Path] = None # Most recently requested
+    overview: typing.Optional[Overview] = None
 
 class ReplayGUI( ez.Unit ):
 
@@ -50,14 +124,17 @@ class ReplayGUI( ez.Unit ):
 
     OUTPUT_STOP = ez.OutputStream(bool)
     OUTPUT_PAUSE = ez.OutputStream(bool)
+    OUTPUT_SEEK = ez.OutputStream(int)
 
     def initialize( self ) -> None:
 
         self.STATE.file_queue = asyncio.Queue()
         self.STATE.stop_queue = asyncio.Queue()
         self.STATE.pause_queue = asyncio.Queue()
+        self.STATE.seek_queue = asyncio.Queue()
 
         self.STATE.rapid = panel.widgets.Checkbox(name = 'Rapid', value = True)
+        self.STATE.paced = panel.widgets.Checkbox(name = 'Pace to consumer', value = False)
         self.STATE.rate = panel.widgets.FloatInput(
             name = 'Playback Rate (Hz, 0.0 = "as recorded")', 
             value = 0.0,
@@ -65,17 +142,48 @@ class ReplayGUI( ez.Unit ):
             disabled = True
         )
 
+        self.STATE.speed = panel.widgets.Select(
+            name = 'Speed (as recorded)',
+            options = { f'{speed:g}×': speed for speed in SPEEDS },
+            value = 1.0,
+            disabled = True
+        )
+
         self.STATE.rapid.link(self.STATE.rate, value = 'disabled')
+        self.STATE.rapid.link(self.STATE.speed, value = 'disabled')
 
         self.SETTINGS.data_dir.mkdir(parents = True, exist_ok = True)
-        self.STATE.file_selector = panel.widgets.FileSelector(self.SETTINGS.data_dir)
+        self.STATE.catalog = RecordingCatalog(self.SETTINGS.data_dir)
+        self.STATE.browser = CatalogBrowser(self.STATE.catalog)
+        self.STATE.refresh_queue = asyncio.Queue()
+        self.STATE.refresh_queue.put_nowait(True)
+        self.STATE.refresh_button = panel.widgets.Button(name = 'Refresh', width = 100)
+
+        def refresh(*events: Event) -> None:
+            self.STATE.refresh_queue.put_nowait(True)
+
+        self.STATE.refresh_button.on_click(refresh)
+
+        self.STATE.overview_queue = asyncio.Queue()
+
+        def on_select(*events: Event) -> None:
+            if self.STATE.browser.selected:
+                self.show_overview(self.STATE.browser.selected[0])
+
+        self.STATE.browser.table.param.watch(on_select, 'selection')
+
         self.STATE.enqueue_button = panel.widgets.Button(name = 'Replay Selected', width = 200)
 
+        self.STATE.merge = panel.widgets.Checkbox(name = 'Merge selected by timestamp', value = False)
+
         def enqueue(*events: Event) -> None:
-            for fpath in self.STATE.file_selector.value:
-                rate = None if self.STATE.rapid.value else self.STATE.rate.value
-                msg = FileReplayMessage(filename = Path(fpath), rate = rate)
+            selected = [Path(fpath) for fpath in self.STATE.browser.selected]
+            if self.STATE.merge.value and selected:
+                msg = replace(self.request(selected[0]), merge = selected[1:])
                 self.STATE.file_queue.put_nowait(msg)
+            else:
+                for fpath in selected:
+                    self.STATE.file_queue.put_nowait(self.request(fpath))
 
         self.STATE.enqueue_button.on_click(enqueue)
 
@@ -99,13 +207,33 @@ class ReplayGUI( ez.Unit ):
             value = '-' 
         )
         
-        self.STATE.playback = panel.indicators.Progress(
-            value = 100, 
-            max = 100, 
-            bar_color = 'success', 
+        self.STATE.playback = panel.widgets.IntSlider(
+            name = 'Position',
+            start = 0,
+            end = 1,
+            value = 0,
+            bar_color = BAR_COLOR_DONE, 
             sizing_mode = 'stretch_width'
         )
 
+        # value_throttled only changes on user interaction, not when update_display moves the slider
+        def seek(*events: Event) -> None:
+            status = self.STATE.replay_status
+            if status is None:
+                return
+            idx = self.STATE.playback.value_throttled
+            if status.done: # Replay has moved on; start the file again from the new position
+                last = self.STATE.last_request
+                if last is not None and last.filename == status.filename:
+                    msg = replace(last, start = idx)
+                else:
+                    msg = self.request(status.filename, start = idx)
+                self.STATE.file_queue.put_nowait(msg)
+            else:
+                self.STATE.seek_queue.put_nowait(idx)
+
+        self.STATE.playback.param.watch(seek, 'value_throttled')
+
         number_kwargs = dict(title_size = '12pt', font_size = '18pt')
 
         self.STATE.message_rate = panel.widgets.Number(
@@ -114,16 +242,95 @@ class ReplayGUI( ez.Unit ):
             **number_kwargs
         )
 
-        self.STATE.msg_times = list()
+        self.STATE.buffer_fill = panel.widgets.Number(
+            name = 'Decode Buffer',
+            format = '{value}%',
+            **number_kwargs
+        )
+
+        self.STATE.rate_meter = RateMeter(self.SETTINGS.msg_rate_window)
+
+    def show_overview(self, path: Path) -> None:
+        if path != self.STATE.overview_path:
+            self.STATE.overview_path = path
+            self.STATE.overview_queue.put_nowait(path)
+
+    def request(self, filename: Path, start: int = 0) -> ReplayRequest:
+        rate = None if self.STATE.rapid.value else self.STATE.rate.value
+        return ReplayRequest(filename, rate = rate, start = start, 
+            speed = self.STATE.speed.value, paced = self.STATE.paced.value)
     
 
+    def overview_plot(self) -> panel.viewable.Viewable:
+        fig = figure(
+            height = 200,
+            sizing_mode = 'stretch_width',
+            title = 'Overview',
+            x_axis_label = 'Time (sec)',
+            toolbar_location = None,
+            output_backend = 'webgl',
+        )
+        fig.yaxis.visible = False
+        position = Span(location = 0, dimension = 'height', line_color = 'red', visible = False)
+        fig.add_layout(position)
+
+        cds = ColumnDataSource()
+        bands: typing.List[GlyphRenderer] = []
+        shown: typing.List[typing.Optional[Overview]] = [None]
+
+        @panel.io.with_lock
+        @instrument
+        def _update() -> None:
+            overview = self.STATE.overview
+            if overview is not shown[0] and overview is not None:
+                for band in bands:
+                    fig.renderers.remove(band)
+                bands.clear()
+
+                # Channels stacked top to bottom, each scaled to its own range
+                data = dict(t = overview.t)
+                n_ch = len(overview.ch_names)
+                with np.errstate(all = 'ignore'):
+                    lo = np.nanmin(overview.mins, axis = 0)
+                    span = np.nanmax(overview.maxs, axis = 0) - lo
+                    scale = 0.9 / np.where(span > 0, span, 1.0)
+                for ch_idx, ch_name in enumerate(overview.ch_names):
+                    base = n_ch - ch_idx - 1
+                    data[f'{ch_name}_lo'] = (overview.mins[:, ch_idx] - lo[ch_idx]) * scale[ch_idx] + base
+                    data[f'{ch_name}_hi'] = (overview.maxs[:, ch_idx] - lo[ch_idx]) * scale[ch_idx] + base
+                cds.data = data
+                for ch_name in overview.ch_names:
+                    bands.append(fig.varea(x = 't', y1 = f'{ch_name}_lo', y2 = f'{ch_name}_hi', source = cds))
+                fig.title.text = f'Overview: {overview.path.name}'
+                shown[0] = overview
+
+            status = self.STATE.replay_status
+            position.visible = isinstance(status, ReplayStatus) \
+                and overview is not None and status.filename == overview.path
+            if position.visible:
+                position.location = status.elapsed
+
+        panel.state.add_periodic_callback(_update, period = 200)
+
+        return panel.pane.Bokeh(fig)
+
     def panel(self) -> panel.viewable.Viewable:
         return panel.Row(
-            self.STATE.file_selector,
+            panel.Column(
+                self.STATE.browser.panel(),
+                self.STATE.refresh_button,
+                self.overview_plot(),
+            ),
             panel.Column( 
-                self.STATE.message_rate,
+                panel.Row(
+                    self.STATE.message_rate,
+                    self.STATE.buffer_fill,
+                ),
                 self.STATE.rate, 
+                self.STATE.speed,
                 self.STATE.rapid,
+                self.STATE.paced,
+                self.STATE.merge,
                 panel.Row(
                     self.STATE.enqueue_button,
                     self.STATE.pause_toggle,
@@ -134,10 +341,39 @@ class ReplayGUI( ez.Unit ):
             )
         )
 
+    @ez.task
+    async def refresh_catalog(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.STATE.browser.update()
+        while True:
+            try:
+                await asyncio.wait_for(self.STATE.refresh_queue.get(), self.SETTINGS.catalog_refresh)
+                self.STATE.refresh_button.loading = True
+                await loop.run_in_executor(None, self.STATE.catalog.refresh)
+                self.STATE.browser.update()
+                self.STATE.refresh_button.loading = False
+            except asyncio.TimeoutError:
+                # Periodic refresh; keep the user's page and selection unless something changed
+                if await loop.run_in_executor(None, self.STATE.catalog.refresh, self.SETTINGS.catalog_refresh):
+                    self.STATE.browser.update()
+
+    @ez.task
+    async def compute_overview(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            path = await self.STATE.overview_queue.get()
+            if path != self.STATE.overview_path:
+                continue # Superseded by a later request
+            try:
+                self.STATE.overview = await loop.run_in_executor(None, load_overview, path)
+            except Exception as e:
+                ez.logger.warning(f'Could not compute overview of {path}: {e}')
+
     @ez.publisher(OUTPUT_FILE_REPLAY)
     async def start_file(self) -> typing.AsyncGenerator:
         while True:
             file_replay_msg = await self.STATE.file_queue.get()
+            self.STATE.last_request = file_replay_msg
             yield self.OUTPUT_FILE_REPLAY, file_replay_msg
 
     @ez.publisher(OUTPUT_STOP)
@@ -151,52 +387,326 @@ class ReplayGUI( ez.Unit ):
         while True:
             val = await self.STATE.pause_queue.get()
             yield self.OUTPUT_PAUSE, val
+
+    @ez.publisher(OUTPUT_SEEK)
+    async def seek(self) -> typing.AsyncGenerator:
+        while True:
+            val = await self.STATE.seek_queue.get()
+            yield self.OUTPUT_SEEK, val
             
     @ez.subscriber(INPUT_REPLAY_STATUS)
     async def on_replay_status(self, msg: ReplayStatusMessage) -> None:
-        now = time.time()
-        self.STATE.msg_times.append(now)
+        self.STATE.rate_meter.update()
         self.STATE.replay_status = msg
+        self.show_overview(msg.filename)
 
     @ez.task
     async def update_display(self) -> None:
-        t_window = self.SETTINGS.msg_rate_window
         while True:
             await asyncio.sleep(0.2)
-            cur_time = time.time()
-            self.STATE.msg_times = [ 
-                t for t in self.STATE.msg_times 
-                if (cur_time - t) < t_window
-            ]
-            self.STATE.message_rate.value = len(self.STATE.msg_times) / t_window
+            self.STATE.message_rate.value = round(self.STATE.rate_meter.msg_rate(), 2)
+
+            status = self.STATE.replay_status
+            if status is not None:
+                self.STATE.playback_file.value = str(status.filename.name)
+                self.STATE.playback.end = max(status.total, 1)
+                self.STATE.playback.value = min(status.idx, self.STATE.playback.end)
+                self.STATE.playback.bar_color = BAR_COLOR_DONE if status.done else BAR_COLOR_PLAYING
+                if isinstance(status, ReplayStatus):
+                    self.STATE.buffer_fill.value = round(100 * status.buffer)
+                    self.STATE.playback.name = f'{_fmt_time(status.elapsed)} / {_fmt_time(status.duration)}'
+
+
+class RecordingReplayState(ez.State):
+    executor: typing.Optional[Executor] = None
+    replay_files: 'asyncio.Queue[FileReplayMessage]'
+    running: asyncio.Event
+    stop: asyncio.Event
+    seek: typing.Optional[int] = None
+
+    # Credit for paced replay; counts since startup, across files
+    n_sent: int = 0
+    n_acked: int = 0 # Never more than n_sent
+    acked: asyncio.Event
+    unpaced: bool = False # The consumer stopped acknowledging; don't wait on it until it acks again
+
+
+class RecordingReplay(ez.Unit):
+    """
+    MessageReplay work-alike that replays any RecordingFormat and can seek within a file.
+    Records of a multi-stream recording's streams named in STREAMS are published directly
+    to that stream's output, OUTPUT_<NAME>; see stream_replay.
+    """
+
+    STREAMS: typing.Tuple[typing.Tuple[str, typing.Any], ...] = () # (name, message type)
+
+    SETTINGS = ReplaySettings
+    STATE = RecordingReplayState
 
-            if self.STATE.replay_status is not None:
-                playback_pct = self.STATE.replay_status.idx / self.STATE.replay_status.total
-                self.STATE.playback_file.value = str(self.STATE.replay_status.filename.name)
-                self.STATE.playback.value = int(100 * playback_pct)
-                self.STATE.playback.bar_color = 'success' if self.STATE.replay_status.done else 'primary'
+    INPUT_FILE = ez.InputStream(FileReplayMessage)
+    INPUT_PAUSED = ez.InputStream(bool)
+    INPUT_STOP = ez.InputStream(bool) # True also clears the queue
+    INPUT_SEEK = ez.InputStream(int) # Record index within the current file
+    INPUT_ACK = ez.InputStream(int) # # of messages the paced consumer has finished with since its last ack
+
+    OUTPUT_MESSAGE = ez.OutputStream(typing.Any)
+    OUTPUT_TOTAL = ez.OutputStream(int)
+    OUTPUT_REPLAY_STATUS = ez.OutputStream(ReplayStatusMessage)
+
+    async def initialize(self) -> None:
+        self.STATE.replay_files = asyncio.Queue()
+        self.STATE.running = asyncio.Event()
+        self.STATE.running.set()
+        self.STATE.stop = asyncio.Event()
+        self.STATE.acked = asyncio.Event()
+        if self.SETTINGS.decode_workers > 0:
+            # Spawned, not forked; this process is running threads
+            self.STATE.executor = ProcessPoolExecutor(
+                self.SETTINGS.decode_workers,
+                mp_context = multiprocessing.get_context('spawn')
+            )
+
+    async def shutdown(self) -> None:
+        if self.STATE.executor is not None:
+            self.STATE.executor.shutdown(wait = False, cancel_futures = True)
+
+    def prefetch(self, reader: RecordingReader, start: int) -> typing.Union[Prefetcher, MergedPrefetcher]:
+        if isinstance(reader, MergedReader):
+            # One chunk per recording; reading them all ahead at once is plenty of lookahead
+            return MergedPrefetcher([
+                Prefetcher(r, s, self.STATE.executor, self.SETTINGS.prefetch_chunk, max_chunks = 1)
+                for r, s in zip(reader.readers, reader.starts(start))
+            ])
+        return Prefetcher(reader, start, self.STATE.executor, 
+            self.SETTINGS.prefetch_chunk, self.SETTINGS.prefetch_chunks)
+
+    @ez.subscriber(INPUT_FILE)
+    async def queue_file(self, msg: FileReplayMessage) -> None:
+        if msg.filename is not None:
+            self.STATE.replay_files.put_nowait(msg)
+
+    @ez.subscriber(INPUT_PAUSED)
+    async def set_paused(self, paused: bool) -> None:
+        if paused:
+            self.STATE.running.clear()
+        else:
+            self.STATE.running.set()
+
+    @ez.subscriber(INPUT_STOP)
+    async def stop(self, clear_queue: bool) -> None:
+        if clear_queue:
+            while not self.STATE.replay_files.empty():
+                self.STATE.replay_files.get_nowait()
+        self.STATE.stop.set()
+
+    @ez.subscriber(INPUT_SEEK)
+    async def on_seek(self, idx: int) -> None:
+        self.STATE.seek = idx
+
+    @ez.subscriber(INPUT_ACK)
+    async def on_ack(self, n: int) -> None:
+        # Acks for messages already written off may still arrive; they mustn't add credit
+        self.STATE.n_acked = min(self.STATE.n_acked + n, self.STATE.n_sent)
+        self.STATE.unpaced = False
+        self.STATE.acked.set()
+
+    async def wait_for_credit(self) -> None:
+        """ Wait until fewer than credit_window published messages are unacknowledged """
+        while not self.STATE.unpaced and self.STATE.n_sent - self.STATE.n_acked >= self.SETTINGS.credit_window:
+            self.STATE.acked.clear()
+            try:
+                await asyncio.wait_for(self.STATE.acked.wait(), self.SETTINGS.credit_timeout)
+            except asyncio.TimeoutError:
+                # Consumer is gone (or was never connected); don't stall replay on it every window
+                ez.logger.warning(f'{self.address}: {self.STATE.n_sent - self.STATE.n_acked} messages ' + \
+                    f'unacknowledged after {self.SETTINGS.credit_timeout} sec; writing them off ' + \
+                    'and replaying unpaced until the consumer acknowledges again')
+                self.STATE.n_acked = self.STATE.n_sent
+                self.STATE.unpaced = True
+
+    @ez.publisher(OUTPUT_MESSAGE)
+    @ez.publisher(OUTPUT_TOTAL)
+    @ez.publisher(OUTPUT_REPLAY_STATUS)
+    async def replay(self) -> typing.AsyncGenerator:
+        loop = asyncio.get_running_loop()
+        while True:
+            replay_file = await self.STATE.replay_files.get()
+            assert replay_file.filename is not None
+
+            paths = [replay_file.filename, *getattr(replay_file, 'merge', [])]
+            try:
+                # Building a text recording's offset index reads the whole file once
+                reader = await loop.run_in_executor(None, open_merged, paths)
+            except (OSError, ValueError) as e:
+                ez.logger.warning(f'Could not open {replay_file.filename}: {e}')
+                continue
+
+            # Recorded stream ID => its output; unrouted streams go to OUTPUT_MESSAGE, or are skipped
+            routes: typing.Dict[int, ez.OutputStream] = {}
+            outputs = [stream_name for stream_name, _ in self.STREAMS]
+            table = await loop.run_in_executor(None, read_stream_table, reader) if outputs else None
+            if table is not None:
+                routes = { 
+                    sid: self.streams[f'OUTPUT_{name.upper()}'] 
+                    for sid, name in enumerate(table.names) if name in outputs
+                }
+                if self.SETTINGS.skip_unrouted:
+                    select_streams(reader, frozenset(routes))
+
+            timestamps = reader.timestamps
+            known = timestamps[np.isfinite(timestamps)]
+            t_start = float(known[0]) if len(known) else 0.0
+            duration = float(known[-1]) - t_start if len(known) else 0.0
+
+            idx = min(max(getattr(replay_file, 'start', 0), 0), len(reader))
+            status = ReplayStatus(replay_file.filename, idx, len(reader), duration = duration)
+            yield self.OUTPUT_REPLAY_STATUS, status
+
+            self.STATE.stop.clear()
+            self.STATE.seek = None
+
+            speed = max(getattr(replay_file, 'speed', 1.0), 1e-6)
+            paced = getattr(replay_file, 'paced', False)
+            # Anything still unacknowledged from earlier (e.g. dropped by a leaky queue) won't be
+            self.STATE.n_acked = self.STATE.n_sent
+
+            pub_msgs = 0
+            records = self.prefetch(reader, idx)
+            # Timing origin: wall-clock time and recorded ts of the first paced message; reset by seeks
+            replay_t0: typing.Optional[float] = None
+            playback_t0 = 0.0
+            n_paced = 0
+            while True:
+
+                if not self.STATE.running.is_set():
+                    pause_t = time.time()
+                    await self.STATE.running.wait()
+                    if replay_t0 is not None:
+                        replay_t0 += time.time() - pause_t
+
+                if self.STATE.stop.is_set():
+                    self.STATE.stop.clear()
+                    break
+
+                if self.STATE.seek is not None:
+                    idx = min(max(self.STATE.seek, 0), len(reader))
+                    self.STATE.seek = None
+                    await records.close()
+                    records = self.prefetch(reader, idx)
+                    replay_t0 = None
+
+                record = await records.get()
+                if record is None:
+                    break
+                ts, obj = record
+                idx += 1
+
+                elapsed = (ts - t_start) if ts is not None else status.elapsed
+                status = replace(status, idx = idx, elapsed = elapsed, buffer = records.fill)
+                yield self.OUTPUT_REPLAY_STATUS, status
+
+                if isinstance(obj, HEADER_TYPES):
+                    continue
+
+                output = self.OUTPUT_MESSAGE
+                if isinstance(obj, TaggedMessage):
+                    if obj.sid in routes:
+                        output, obj = routes[obj.sid], obj.msg
+                    elif routes and self.SETTINGS.skip_unrouted:
+                        continue # Never decoded
+                    else:
+                        obj = obj.msg
+
+                # Sleep until this message's deadline, measured from a fixed origin so
+                # sleep overshoot doesn't accumulate; late messages go out immediately
+                due: typing.Optional[float] = None
+                if replay_file.rate is not None and (replay_file.rate > 0 or ts is not None):
+                    if replay_t0 is None:
+                        replay_t0, playback_t0, n_paced = time.time(), ts or 0.0, 0
+                    if replay_file.rate > 0:
+                        due = n_paced / replay_file.rate
+                    else:
+                        due = (ts - playback_t0) / speed
+                    n_paced += 1
+
+                if due is not None and replay_t0 is not None:
+                    lag = due - (time.time() - replay_t0)
+                    if lag > DEADLINE_SLACK:
+                        await asyncio.sleep(lag)
+
+                if paced:
+                    await self.wait_for_credit()
+
+                yield output, obj
+                pub_msgs += 1
+                self.STATE.n_sent += 1
+
+            await records.close()
+            reader.close()
+
+            yield self.OUTPUT_REPLAY_STATUS, replace(status, done = True, buffer = 0.0)
+            yield self.OUTPUT_TOTAL, pub_msgs
+
+
+def _new_stream_replay(streams: typing.Tuple[typing.Tuple[str, typing.Any], ...]) -> RecordingReplay:
+    cls = stream_replay(streams)
+    return cls.__new__(cls)
+
+
+def _reduce_stream_replay(self: RecordingReplay) -> typing.Tuple[typing.Any, ...]:
+    # The class can't be looked up by name when unpickled, e.g. in a spawned process; rebuild it
+    return _new_stream_replay, (self.STREAMS, ), self.__dict__
+
+
+@functools.lru_cache(maxsize = None)
+def stream_replay(streams: typing.Tuple[typing.Tuple[str, typing.Any], ...]) -> typing.Type[RecordingReplay]:
+    """ RecordingReplay with an output per recorded stream, OUTPUT_<NAME>, for the given (name, message type)s """
+    fields: typing.Dict[str, typing.Any] = dict(STREAMS = streams, __reduce__ = _reduce_stream_replay)
+    for stream_name, msg_type in streams:
+        if f'OUTPUT_{stream_name.upper()}' in RecordingReplay.__streams__:
+            raise ValueError(f'Stream name {stream_name!r} clashes with a RecordingReplay output')
+        fields[f'OUTPUT_{stream_name.upper()}'] = ez.OutputStream(msg_type)
+    return type('StreamReplay', (RecordingReplay, ), fields)
 
 
 class Replay(ez.Collection):
+    """
+    Replay GUI plus a RecordingReplay in its own process.
+    To demultiplex multi-stream recordings, build a Replay with an output per stream
+    using multi_replay.
+    """
+
     SETTINGS = ReplaySettings
 
     OUTPUT_MESSAGE = ez.InputStream(typing.Any)
     OUTPUT_REPLAY_STATUS = ez.OutputStream(ReplayStatusMessage)
+    INPUT_ACK = ez.InputStream(int) # From the consumer paced replays are throttled to, e.g. TimeSeriesPlot.OUTPUT_ACK
 
     GUI = ReplayGUI()
-    REPLAY = MessageReplay()
+    REPLAY = RecordingReplay()
+
+    @property
+    def stream_outputs(self) -> typing.List[str]:
+        return [
+            stream_name for stream_name, stream in self.streams.items()
+            if isinstance(stream, ez.OutputStream) and stream_name not in Replay.__streams__
+        ]
 
     def configure(self) -> None:
         self.GUI.apply_settings(self.SETTINGS)
+        self.REPLAY.apply_settings(self.SETTINGS)
 
     def network(self) -> ez.NetworkDefinition:
         return (
+            *[(self.REPLAY.streams[stream_name], self.streams[stream_name]) for stream_name in self.stream_outputs],
             (self.REPLAY.OUTPUT_MESSAGE, self.OUTPUT_MESSAGE),
             (self.REPLAY.OUTPUT_REPLAY_STATUS, self.OUTPUT_REPLAY_STATUS),
 
             (self.GUI.OUTPUT_FILE_REPLAY, self.REPLAY.INPUT_FILE),
             (self.GUI.OUTPUT_STOP, self.REPLAY.INPUT_STOP),
             (self.GUI.OUTPUT_PAUSE, self.REPLAY.INPUT_PAUSED),
+            (self.GUI.OUTPUT_SEEK, self.REPLAY.INPUT_SEEK),
+            (self.INPUT_ACK, self.REPLAY.INPUT_ACK),
             (self.REPLAY.OUTPUT_REPLAY_STATUS, self.GUI.INPUT_REPLAY_STATUS),
         )
     
@@ -206,3 +716,18 @@ class Replay(ez.Collection):
     def panel(self) -> panel.viewable.Viewable:
         return self.GUI.panel()
 
+
+def multi_replay(name: str, **streams: typing.Any) -> typing.Type[Replay]:
+    """
+    A Replay publishing each keyword's recorded stream of a multi-stream recording (see
+    recorder.multi_recorder) to its own output, carrying messages of the given type:
+
+        EEGReplay = multi_replay('EEGReplay', eeg = AxisArray, markers = str)
+
+    EEGReplay.OUTPUT_EEG publishes the recorded stream named 'eeg'.
+    The RecordingReplay publishes to that output directly; nothing downstream filters streams.
+    """
+    fields: typing.Dict[str, typing.Any] = dict(REPLAY = stream_replay(tuple(streams.items()))())
+    for stream_name, msg_type in streams.items():
+        fields[f'OUTPUT_{stream_name.upper()}'] = ez.OutputStream(msg_type)
+    return type(name, (Replay, ), fields)
@@ -0,0 +1,109 @@
+import weakref
+
+from dataclasses import dataclass
+
+import panel
+
+from bokeh.document import Document, without_document_lock
+from bokeh.model import Model
+
+from .profiling import instrument
+
+from typing import Any, Callable, List, Optional
+
+FRAME_PERIOD = 50 # ms; how often a session checks its plots for something to show
+
+
+@dataclass
+class ScheduledPlot:
+    pending: Callable[[], bool]
+    update: Callable[[], None]
+    model: Optional[Model] = None
+    release: Optional[Callable[[], None]] = None
+    attached: bool = False # model has been in the document
+
+    @property
+    def detached(self) -> bool:
+        if self.model is None:
+            return False
+        if self.model.document is not None:
+            self.attached = True
+        return self.attached and self.model.document is None
+
+
+class FrameScheduler:
+    """
+    Drives every plot in one session from a single periodic callback. The callback only asks
+    each plot whether it has anything new, without taking the document lock; if any do, one
+    locked callback applies all of their updates, sent to the browser as a single message.
+    """
+
+    _schedulers: 'weakref.WeakKeyDictionary[Document, FrameScheduler]' = weakref.WeakKeyDictionary()
+
+    plots: List[ScheduledPlot]
+    _doc: 'weakref.ref[Document]' # Weak, as the document is this scheduler's key in _schedulers
+    _scheduled: bool
+
+    def __init__(self, doc: Document, period: int = FRAME_PERIOD) -> None:
+        self.plots = []
+        self._doc = weakref.ref(doc)
+        self._scheduled = False
+        doc.add_periodic_callback(self._check, period)
+
+    @classmethod
+    def current(cls) -> 'FrameScheduler':
+        """ This session's scheduler, created on first use; call from a session """
+        doc = panel.state.curdoc
+        scheduler = cls._schedulers.get(doc)
+        if scheduler is None:
+            scheduler = cls._schedulers[doc] = cls(doc)
+            doc.on_session_destroyed(scheduler._destroyed)
+        return scheduler
+
+    @property
+    def doc(self) -> Optional[Document]:
+        return self._doc()
+
+    def _destroyed(self, session_context: Any) -> None:
+        doc = self.doc
+        if doc is not None:
+            self._schedulers.pop(doc, None)
+        # Plots free what they hold for the session in their own session_destroyed callbacks
+        self.plots.clear()
+
+    def register(
+        self, 
+        pending: Callable[[], bool], 
+        update: Callable[[], None],
+        model: Optional[Model] = None,
+        release: Optional[Callable[[], None]] = None
+    ) -> None:
+        """
+        pending() says whether a plot has changes to show; it's called every frame without the
+        document lock, so it must be cheap and must not touch the document. update() applies them.
+        Once model (e.g. the plot's figure) has left the document, as when switching tabs replaces
+        it, the plot is dropped and release() called so its owner can free what it held for it.
+        """
+        self.plots.append(ScheduledPlot(pending, update, model, release))
+
+    @without_document_lock
+    def _check(self) -> None:
+        detached = [plot for plot in self.plots if plot.detached]
+        for plot in detached:
+            self.plots.remove(plot)
+            if plot.release is not None:
+                plot.release()
+
+        doc = self.doc
+        if doc is not None and not self._scheduled and any(plot.pending() for plot in self.plots):
+            self._scheduled = True
+            doc.add_next_tick_callback(self._flush)
+
+    @instrument(name = 'FrameScheduler.flush')
+    def _flush(self) -> None:
+        self._scheduled = False
+        # Holds every change made inside, then writes them to each connection as one patch
+        with panel.io.unlocked():
+            for plot in self.plots:
+                if plot.pending():
+                    plot.update()
@@ -1,4 +1,7 @@
+import time
 import asyncio
+
+from collections import deque
 from functools import partial
 
 import panel
@@ -10,28 +13,100 @@ from ezmsg.util.messages.axisarray import AxisArray
 from bokeh.plotting import figure
 from bokeh.models import ColumnDataSource
 from bokeh.models.renderers import GlyphRenderer
-from bokeh.server.contexts import BokehSessionContext
 
-from typing import Dict, Set, Optional, List
+from param.parameterized import Event
+
+from typing import Any, AsyncGenerator, Deque, Dict, Iterable, Optional, List, Tuple
 
 from .tabbedapp import Tab
+from .profiling import instrument
+from .latency import LatencyMonitor, message_time, session_id
+from .autoscale import AutoScale, ChannelScaler
+from .scheduler import FrameScheduler, FRAME_PERIOD
+from .memory import MEMORY, MemoryUsage, nbytes, total
 
 CDS_TIME_DIM = '__time__'
+LOW_WATER = 0.9 # Fraction of memory_limit below which evicted history grows back
+
+Levels = Tuple[ np.ndarray, np.ndarray ] # Per-channel (gains, offsets) for display
+
+
+def format_updates( 
+    frames: List[ Tuple[ int, Dict[ str, np.ndarray ] ] ],
+    afters: Iterable[ int ],
+    levels: Dict[ int, Levels ]
+) -> Dict[ int, List[ Dict[ str, np.ndarray ] ] ]:
+    """
+    For each sequence number in afters, the frames newer than it, scaled for display and 
+    concatenated into one update per run of frames with the same channels. Each frame is 
+    scaled once however many positions it's needed for. levels is keyed on channel count. 
+    Pure NumPy on arrays nothing else modifies, so it can run on a worker thread.
+    """
+    scaled: Dict[ int, Dict[ str, np.ndarray ] ] = {}
+    def scale( seq: int, cds_data: Dict[ str, np.ndarray ] ) -> Dict[ str, np.ndarray ]:
+        if seq not in scaled:
+            gains, offsets = levels[ len( cds_data ) - 1 ]
+            frame = { CDS_TIME_DIM: cds_data[ CDS_TIME_DIM ] }
+            for ch_idx, ch in enumerate( ch for ch in cds_data.keys() if ch != CDS_TIME_DIM ):
+                frame[ ch ] = ( cds_data[ ch ] * gains[ ch_idx ] ) + offsets[ ch_idx ]
+            scaled[ seq ] = frame
+        return scaled[ seq ]
+
+    prepared = {}
+    for after in afters:
+        runs: List[ List[ Dict[ str, np.ndarray ] ] ] = []
+        for seq, cds_data in frames:
+            if seq <= after:
+                continue
+            if runs and runs[-1][0].keys() == cds_data.keys():
+                runs[-1].append( scale( seq, cds_data ) )
+            else:
+                runs.append( [ scale( seq, cds_data ) ] )
+
+        prepared[ after ] = [ 
+            run[0] if len( run ) == 1 else 
+            { key: np.concatenate( [ frame[ key ] for frame in run ] ) for key in run[0].keys() }
+            for run in runs 
+        ]
+    return prepared
+
 
 class ScrollingLinePlotSettings(ez.Settings):
     name: str = 'Scrolling Line Plot'
     time_axis: Optional[str] = None # If not specified, dim 0 is used.
     initial_gain: float = 1.0
+    autoscale: AutoScale = AutoScale.OFF # Normalize each channel to fit its lane
+    autoscale_tau: float = 2.0 # sec; time constant of the running channel statistics
+    memory_limit: Optional[int] = None # bytes; soft limit on history held, see ScrollingLinePlot.evict
+    render_latency: bool = False # Have browsers acknowledge each painted update; see LatencyMonitor
 
 
 class ScrollingLinePlotState(ez.State):
-    queues: Set["asyncio.Queue[Dict[str, np.ndarray]]"]
+    # Recent chunks shared by every session, oldest first, as (sequence number, cds_data, time queued)
+    frames: Deque[Tuple[int, Dict[str, np.ndarray], float]]
+    frame_seq: int = 0 # Sequence number of the newest frame
+    n_buffered: int = 0 # Samples in frames
+    frame_bytes: int = 0 # Bytes in frames
+    max_history: Optional[int] = None # Samples; set once over memory_limit, until the full duration fits again
+    # Display-ready updates, formatted off the event loop, keyed on the sequence number
+    # of the newest frame a session has streamed: (newest frame included, updates)
+    prepared: Dict[int, Tuple[int, List[Dict[str, np.ndarray]]]]
+    new_frames: asyncio.Event
     cur_t: float = 0.0
     cur_fs: float = 1.0
+    latency: LatencyMonitor
+    scaler: ChannelScaler
+    # Newest frame each open session has streamed, for OUTPUT_ACK
+    cursors: Dict[ int, List[ int ] ]
+    n_acked: int = 0
+    consumed: asyncio.Event # Set whenever the newest frame every session has streamed may have moved
+    # Session id and source of each open plot, keyed like cursors, for memory accounting
+    sources: Dict[ int, Tuple[ str, ColumnDataSource ] ]
 
     # Visualization controls
     channelize: panel.widgets.Checkbox
     gain: panel.widgets.FloatInput
+    autoscale: panel.widgets.Select
     duration: panel.widgets.FloatInput
 
     # Signal Properties
@@ -45,19 +120,72 @@ class ScrollingLinePlot(ez.Unit, Tab):
     STATE = ScrollingLinePlotState
 
     INPUT_SIGNAL = ez.InputStream(AxisArray)
+    OUTPUT_ACK = ez.OutputStream(int) # # of messages every open session has streamed since the last ack
 
     def initialize( self ) -> None:
-        self.STATE.queues = set()
+        self.STATE.frames = deque()
+        self.STATE.prepared = dict()
+        self.STATE.new_frames = asyncio.Event()
+        self.STATE.cursors = dict()
+        self.STATE.consumed = asyncio.Event()
+        self.STATE.sources = dict()
+        self.STATE.latency = LatencyMonitor( self.SETTINGS.render_latency )
         self.STATE.channelize = panel.widgets.Checkbox( name = 'Channelize', value = True )
         self.STATE.gain = panel.widgets.FloatInput( name = 'Gain', value = self.SETTINGS.initial_gain )
+        self.STATE.autoscale = panel.widgets.Select( 
+            name = 'Auto-Scale', 
+            options = { mode.name: mode for mode in AutoScale },
+            value = self.SETTINGS.autoscale
+        )
+        self.STATE.scaler = ChannelScaler( self.SETTINGS.autoscale, self.SETTINGS.autoscale_tau )
+        MEMORY.register( self )
+
+        def on_autoscale( *events: Event ) -> None:
+            self.STATE.scaler.mode = self.STATE.autoscale.value
+            self.STATE.scaler.reset()
+
+        self.STATE.autoscale.param.watch( on_autoscale, 'value' )
         self.STATE.duration = panel.widgets.FloatInput( name = 'Duration (sec)', value = 4.0, start = 0.0 )
 
         number_kwargs = dict( title_size = '12pt', font_size = '18pt' )
         self.STATE.fs = panel.widgets.Number( name = 'Sampling Rate', format='{value} Hz', **number_kwargs )
         self.STATE.n_time = panel.widgets.Number( name = "Samples per Message", **number_kwargs )
 
+    def levels( self, n_ch: int ) -> Levels:
+        """ Display gain and offset of each of n_ch channels, from the view controls """
+        offsets = np.arange( n_ch ) if self.STATE.channelize.value else np.zeros( n_ch )
+        gains = np.full( n_ch, self.STATE.gain.value )
+        scale = self.STATE.scaler.scale( n_ch )
+        if scale is not None and self.STATE.scaler.center is not None:
+            # Center each channel on its lane
+            gains = gains * scale
+            offsets = offsets - self.STATE.scaler.center * gains
+        return gains, offsets
+
+    @ez.task
+    async def format_frames( self ) -> None:
+        """ 
+        Scale and concatenate new frames for every open session on a worker thread, so the 
+        event loop (and the document lock) only sees the ready-to-stream buffers. Sessions 
+        that are caught up share the same position, so this work is done once per frame.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.STATE.new_frames.wait()
+            self.STATE.new_frames.clear()
+
+            upto = self.STATE.frame_seq
+            afters = { cursor[ 0 ] for cursor in self.STATE.cursors.values() if cursor[ 0 ] < upto }
+            if not afters:
+                continue
+
+            frames = [ ( seq, cds_data ) for seq, cds_data, _ in self.STATE.frames ]
+            n_chs = { len( cds_data ) - 1 for _, cds_data in frames }
+            levels = { n_ch: self.levels( n_ch ) for n_ch in n_chs }
+            prepared = await loop.run_in_executor( None, format_updates, frames, afters, levels )
+            self.STATE.prepared = { after: ( upto, updates ) for after, updates in prepared.items() }
+
     def plot( self ) -> panel.viewable.Viewable:
-        queue: "asyncio.Queue[Dict[str, np.ndarray]]" = asyncio.Queue()
         cds = ColumnDataSource( { CDS_TIME_DIM: [ self.STATE.cur_t ] } )
         fig = figure( 
             sizing_mode = 'stretch_width', 
@@ -67,26 +195,28 @@ class ScrollingLinePlot(ez.Unit, Tab):
         )
 
         lines = {}
+        cursor = [ self.STATE.frame_seq ] # Newest frame this session has streamed
+        sent = self.STATE.latency.track( cds )
+        self.STATE.cursors[ id( cursor ) ] = cursor
+        self.STATE.sources[ id( cursor ) ] = ( session_id(), cds )
+
+        def release() -> None:
+            self.STATE.cursors.pop( id( cursor ), None )
+            self.STATE.sources.pop( id( cursor ), None )
+            self.STATE.consumed.set()
+
+        panel.state.on_session_destroyed( lambda _: release() )
 
-        @panel.io.with_lock
-        async def _update( 
+        @instrument
+        def _update( 
             fig: figure,
             cds: ColumnDataSource, 
-            queue: "asyncio.Queue[ Dict[ str, np.ndarray ] ]",
+            cursor: List[ int ],
             lines: Dict[ str, GlyphRenderer ]
         ) -> None:
-            while not queue.empty():
-                cds_data: Dict[ str, np.ndarray ] = queue.get_nowait()
-
-                ch_names = [ ch for ch in cds_data.keys() if ch != CDS_TIME_DIM ]
-                offsets = np.arange( len( ch_names ) ) if self.STATE.channelize.value else np.zeros( len( ch_names ) )
-
-                cds_data = { 
-                    ch: ( arr * self.STATE.gain.value ) + offsets[ ch_names.index( ch ) ] 
-                    if ch != CDS_TIME_DIM else arr 
-                    for ch, arr in cds_data.items() 
-                }
+            upto, updates = self.STATE.prepared[ cursor[ 0 ] ]
 
+            for cds_data in updates:
                 # Add new lines to plot as necessary
                 # TODO: Remove lines from plot as necessary
                 for key, arr in cds_data.items():
@@ -98,20 +228,89 @@ class ScrollingLinePlot(ez.Unit, Tab):
                             source = cds 
                         )
 
-                cds.stream( cds_data, rollover = int( self.STATE.duration.value * self.STATE.cur_fs ) )
+                # Shallow copy; the arrays are shared with other sessions and never modified
+                cds.stream( dict( cds_data ), rollover = self.history( self.STATE.cur_fs ) )
+
+            sent( queued for seq, _, queued in self.STATE.frames if cursor[ 0 ] < seq <= upto )
+            cursor[ 0 ] = upto
+            self.STATE.consumed.set()
     
-        cb = panel.state.add_periodic_callback( 
-            partial(_update, fig, cds, queue, lines), 
-            period = 50 
+        FrameScheduler.current().register( 
+            lambda: cursor[ 0 ] in self.STATE.prepared,
+            partial( _update, fig, cds, cursor, lines ),
+            model = fig,
+            release = release
         )
 
-        def remove_queue(_: BokehSessionContext) -> None:
-            self.STATE.queues.remove(queue)
-        self.STATE.queues.add(queue)
-        panel.state.on_session_destroyed(remove_queue)
-
         return panel.pane.Bokeh(fig)
     
+    @ez.publisher( OUTPUT_ACK )
+    async def ack( self ) -> AsyncGenerator:
+        """ Acknowledge messages once the slowest open session has streamed them, e.g. to pace a Replay """
+        while True:
+            await self.STATE.consumed.wait()
+            self.STATE.consumed.clear()
+            cursors = [ cursor[ 0 ] for cursor in self.STATE.cursors.values() ]
+            consumed = min( cursors ) if cursors else self.STATE.frame_seq
+            if consumed > self.STATE.n_acked:
+                yield self.OUTPUT_ACK, consumed - self.STATE.n_acked
+                self.STATE.n_acked = consumed
+
+    def history( self, fs: float ) -> int:
+        """ Samples of history to keep: the plot's duration, or less while evicting """
+        samples = int( self.STATE.duration.value * fs )
+        if self.STATE.max_history is not None:
+            samples = min( samples, self.STATE.max_history )
+        return samples
+
+    def memory( self ) -> MemoryUsage:
+        """ Bytes held in shared buffers and by each session's sources; see ezmsg.panel.memory """
+        sessions: Dict[ str, int ] = {}
+        for sid, cds in self.STATE.sources.values():
+            sessions[ sid ] = sessions.get( sid, 0 ) + nbytes( cds.data )
+        return dict(
+            buffers = dict(
+                frames = self.STATE.frame_bytes,
+                prepared = nbytes( [ updates for _, updates in self.STATE.prepared.values() ] ),
+            ),
+            sessions = sessions,
+        )
+
+    def evict( self ) -> None:
+        """
+        Past memory_limit, shorten history in proportion to the excess; the oldest samples are
+        dropped from the shared frames on the next message and from each session's plot on its
+        next update. Below LOW_WATER of the limit, history grows back towards the plot's duration.
+        """
+        limit = self.SETTINGS.memory_limit
+        if limit is None:
+            return
+        held = total( self.memory() )
+        if held > limit:
+            if self.STATE.max_history is None:
+                ez.logger.warning( f'{self.address}: holding {held / 2 ** 20:.1f} MB, ' + \
+                    f'over memory_limit ({limit / 2 ** 20:.1f} MB); evicting the oldest history' )
+            self.STATE.max_history = max( int( self.STATE.n_buffered * limit / held ), 1 )
+        elif self.STATE.max_history is not None and held < LOW_WATER * limit:
+            grown = int( self.STATE.n_buffered * LOW_WATER * limit / held ) if held else None
+            if grown is None or grown >= int( self.STATE.duration.value * self.STATE.cur_fs ):
+                self.STATE.max_history = None
+            else:
+                self.STATE.max_history = max( grown, self.STATE.max_history )
+
+    @ez.task
+    async def limit_memory( self ) -> None:
+        """ Check memory_limit once per frame; accounting walks every session's sources """
+        if self.SETTINGS.memory_limit is None:
+            return
+        while True:
+            await asyncio.sleep( FRAME_PERIOD / 1000 )
+            self.evict()
+
+    def latency( self ) -> Dict[ str, Any ]:
+        """ Display latency percentiles; see LatencyMonitor.summary """
+        return self.STATE.latency.summary()
+
     @property
     def title(self) -> str:
         return self.SETTINGS.name
@@ -129,7 +328,10 @@ class ScrollingLinePlot(ez.Unit, Tab):
             self.STATE.n_time,
             self.STATE.channelize,
             self.STATE.gain,
+            self.STATE.autoscale,
             self.STATE.duration,
+            '__Display Latency__',
+            self.STATE.latency.view(),
             title = 'Scrolling Line Plot Controls',
             collapsed = True,
             sizing_mode = 'stretch_width'
@@ -143,6 +345,7 @@ class ScrollingLinePlot(ez.Unit, Tab):
         )
     
     @ez.subscriber( INPUT_SIGNAL )
+    @instrument
     async def on_signal( self, msg: AxisArray ) -> None:
         axis_name = self.SETTINGS.time_axis
         if axis_name is None:
@@ -150,6 +353,9 @@ class ScrollingLinePlot(ez.Unit, Tab):
         axis = msg.get_axis(axis_name)
         fs = 1.0 / axis.gain
 
+        now = time.time()
+        self.STATE.latency.ingested( message_time( msg, axis_name ), now )
+
         with msg.view2d(axis_name) as view:
             
             ch_names = getattr( msg, 'ch_names', None )
@@ -158,13 +364,30 @@ class ScrollingLinePlot(ez.Unit, Tab):
 
             t = ( np.arange(view.shape[0]) / fs ) + self.STATE.cur_t
             cds_data = { CDS_TIME_DIM: t }
+            # Contiguous copies per channel; view may be backed by shared memory
+            channels = np.ascontiguousarray( view.T )
             for ch_idx, ch_name in enumerate( ch_names ):
-                cds_data[ ch_name ] = view[ :, ch_idx ]
+                cds_data[ ch_name ] = channels[ ch_idx ]
+
+            self.STATE.scaler.update( view, view.shape[0] / fs )
 
             self.STATE.cur_fs = fs
             self.STATE.cur_t += view.shape[0] / fs
             self.STATE.fs.value = fs
             self.STATE.n_time.value = view.shape[0]
 
-            for queue in self.STATE.queues:
-                queue.put_nowait( cds_data )
+            self.STATE.frame_seq += 1
+            self.STATE.frames.append( ( self.STATE.frame_seq, cds_data, now ) )
+            self.STATE.n_buffered += view.shape[0]
+            self.STATE.frame_bytes += nbytes( cds_data )
+            self.STATE.new_frames.set()
+            if not self.STATE.cursors: # Nothing to wait for
+                self.STATE.consumed.set()
+
+            # Older samples would be rolled out of every session's plot anyway
+            rollover = self.history( fs )
+            while len( self.STATE.frames ) > 1 and \
+                self.STATE.n_buffered - len( self.STATE.frames[0][1][ CDS_TIME_DIM ] ) >= rollover:
+                _, dropped, _ = self.STATE.frames.popleft()
+                self.STATE.n_buffered -= len( dropped[ CDS_TIME_DIM ] )
+                self.STATE.frame_bytes -= nbytes( dropped )
@@ -0,0 +1,384 @@
+import time
+
+import panel
+import ezmsg.core as ez
+import numpy as np
+import numpy.typing as npt
+
+from ezmsg.util.messages.axisarray import AxisArray
+from ezmsg.sigproc.spectral import Spectrum, SpectrumSettings, SpectralTransform
+from ezmsg.sigproc.window import Window, WindowSettings
+
+from bokeh.plotting import figure
+from bokeh.models import ColumnDataSource, LinearColorMapper, Span
+
+from param.parameterized import Event
+
+from .tabbedapp import Tab
+from .spectrum import SpectrumControl, SpectrumControlSettings
+from .profiling import instrument
+from .latency import LatencyMonitor, message_time, session_id
+from .scheduler import FrameScheduler
+from .memory import MEMORY, MemoryUsage, nbytes
+
+from typing import Any, Dict, List, Optional, Tuple
+
+MEAN_CHANNEL = -1 # channel option averaging every channel
+LEVEL_PERCENTILES = (1.0, 99.0) # Automatic color range, from the first spectra after a reset
+TINY = 1e-20 # Floor before taking dB
+
+
+def quantize(values: npt.NDArray, levels: Tuple[float, float]) -> npt.NDArray:
+    """ uint8 color indices of values over the color range levels """
+    low, high = levels
+    return np.clip((values - low) * (255.0 / (high - low)), 0.0, 255.0).astype(np.uint8)
+
+
+class WaterfallPlotSettings(ez.Settings):
+    name: str = 'Spectrogram'
+    freq_axis: str = 'freq'
+    win_axis: str = 'win' # One column per window
+    n_columns: int = 240 # Spectra kept; the plot spans n_columns window shifts
+    db: bool = True # Plot 10 log10 of relative power input; REL_DB input already is
+    quantize: bool = False # Send uint8 color indices instead of float32 values
+    levels: Optional[Tuple[float, float]] = None # Color range (after dB); None => from the data
+    transform: SpectralTransform = SpectralTransform.REL_POWER # Of the input; follows INPUT_SPECTRUM_SETTINGS
+    palette: str = 'Viridis256'
+    render_latency: bool = False # Have browsers acknowledge each painted update; see LatencyMonitor
+
+
+class WaterfallPlotState(ez.State):
+    # Preallocated (n_freq, n_columns) ring of recent spectra; the display sweeps left to right
+    # over it, so each update only has to send the columns written since a session's last one
+    ring: npt.NDArray
+    # When quantizing, ring holds color indices; spectra holds the values they came from, so the
+    # whole ring can be requantized when the levels change. Otherwise spectra is ring.
+    spectra: npt.NDArray
+    ring_levels: Optional[Tuple[float, float]] = None # Levels ring was quantized with
+    n_written: int = 0 # Columns written since the ring was allocated
+    generation: int = 0 # Incremented whenever the ring is reallocated or cleared
+    data_time: float = 0.0 # When the newest column was written
+    freq: Tuple[float, float] = (0.0, 1.0) # (offset, gain) of the frequency axis
+    shift: float = 1.0 # sec between columns
+    levels: Optional[Tuple[float, float]] = None
+    transform: SpectralTransform = SpectralTransform.REL_POWER
+    latency: LatencyMonitor
+    # Session id and source of each open plot, for memory accounting
+    sources: Dict[int, Tuple[str, ColumnDataSource]]
+
+    # Visualization controls
+    channel: panel.widgets.Select
+    rescale: panel.widgets.Button
+
+
+class WaterfallPlot(ez.Unit):
+    """ Rolling spectrogram of a stream of spectra, e.g. from Window -> Spectrum, as one image """
+
+    SETTINGS = WaterfallPlotSettings
+    STATE = WaterfallPlotState
+
+    INPUT_SIGNAL = ez.InputStream(AxisArray)
+    INPUT_SPECTRUM_SETTINGS = ez.InputStream(SpectrumSettings)
+
+    def initialize(self) -> None:
+        self.STATE.transform = self.SETTINGS.transform
+        self.STATE.ring = self.allocate(0)
+        self.STATE.levels = self.SETTINGS.levels
+        self.STATE.latency = LatencyMonitor(self.SETTINGS.render_latency)
+        self.STATE.sources = dict()
+        MEMORY.register(self)
+
+        self.STATE.channel = panel.widgets.Select(name = 'Channel', options = { 'Mean': MEAN_CHANNEL })
+        self.STATE.rescale = panel.widgets.Button(name = 'Rescale Colors')
+
+        def on_channel(*events: Event) -> None:
+            self.STATE.ring = self.allocate(self.STATE.ring.shape[0])
+            self.STATE.levels = self.default_levels()
+
+        def on_rescale(_: Any) -> None:
+            self.STATE.levels = None
+
+        self.STATE.channel.param.watch(on_channel, 'value')
+        self.STATE.rescale.on_click(on_rescale)
+
+    def allocate(self, n_freq: int) -> npt.NDArray:
+        """ An empty ring for n_freq frequencies; sessions resend it whole """
+        self.STATE.n_written = 0
+        self.STATE.generation += 1
+        self.STATE.spectra = np.zeros((n_freq, self.SETTINGS.n_columns), dtype = np.float32)
+        if self.SETTINGS.quantize:
+            return np.zeros((n_freq, self.SETTINGS.n_columns), dtype = np.uint8)
+        return self.STATE.spectra
+
+    def units(self, transform: SpectralTransform) -> SpectralTransform:
+        """ What plotted values of this transform are: REL_DB if the plot takes dB itself """
+        if self.SETTINGS.db and transform == SpectralTransform.REL_POWER:
+            return SpectralTransform.REL_DB
+        return transform
+
+    def default_levels(self) -> Optional[Tuple[float, float]]:
+        """ SETTINGS.levels, if they're in the units now plotted """
+        if self.units(self.STATE.transform) != self.units(self.SETTINGS.transform):
+            return None
+        return self.SETTINGS.levels
+
+    def color_range(self) -> Tuple[float, float]:
+        """ Color mapper (low, high) for values in the ring """
+        if self.SETTINGS.quantize:
+            return (0.0, 255.0)
+        return self.STATE.levels if self.STATE.levels is not None else (0.0, 1.0)
+
+    def plot(self) -> panel.viewable.Viewable:
+        low, high = self.color_range()
+        mapper = LinearColorMapper(palette = self.SETTINGS.palette, low = low, high = high)
+        cds = ColumnDataSource(dict(image = [self.STATE.ring.copy()]))
+        fig = figure(
+            sizing_mode = 'stretch_width',
+            title = self.SETTINGS.name,
+            x_axis_label = 'Time (s, sweeping)',
+            y_axis_label = 'Frequency',
+            tooltips = [("t", "$x"), ("f", "$y"), ("value", "@image")]
+        )
+        image = fig.image(image = 'image', x = 0, y = 0, dw = 1, dh = 1, color_mapper = mapper, source = cds)
+        head = Span(location = 0, dimension = 'height', line_color = 'white', line_width = 1)
+        fig.add_layout(head)
+
+        shown = [-1, 0] # generation and n_written this session's source holds
+        sent = self.STATE.latency.track(cds)
+        self.STATE.sources[id(cds)] = (session_id(), cds)
+
+        def release() -> None:
+            self.STATE.sources.pop(id(cds), None)
+
+        panel.state.on_session_destroyed(lambda _: release())
+
+        @instrument
+        def _update() -> None:
+            ring, n_written = self.STATE.ring, self.STATE.n_written
+            n_freq, n_columns = ring.shape
+            new = n_written - shown[1]
+
+            if shown[0] != self.STATE.generation or new >= n_columns or new < 0:
+                # Reallocated (or this session is too far behind); resend the whole image
+                freq_offset, freq_gain = self.STATE.freq
+                image.glyph.update(
+                    y = freq_offset - freq_gain / 2,
+                    dh = max(n_freq, 1) * freq_gain,
+                    dw = n_columns * self.STATE.shift
+                )
+                cds.data = dict(image = [ring.copy()])
+            elif new > 0:
+                first = shown[1] % n_columns
+                last = first + new
+                # At most two runs of columns, as writing wraps around the ring
+                runs = [(first, min(last, n_columns))] + ([(0, last - n_columns)] if last > n_columns else [])
+                cds.patch(dict(image = [
+                    ((0, slice(0, n_freq), slice(start, stop)), ring[:, start:stop].ravel())
+                    for start, stop in runs
+                ]))
+
+            low, high = self.color_range()
+            if (mapper.low, mapper.high) != (low, high):
+                mapper.update(low = low, high = high)
+            head.location = (n_written % max(n_columns, 1)) * self.STATE.shift
+
+            # Data queued before this session opened doesn't count towards its send latency
+            sent([self.STATE.data_time] if shown[0] >= 0 else [])
+            shown[0], shown[1] = self.STATE.generation, n_written
+
+        FrameScheduler.current().register(
+            lambda: shown[0] != self.STATE.generation or shown[1] != self.STATE.n_written,
+            _update,
+            model = fig,
+            release = release
+        )
+
+        return panel.pane.Bokeh(fig)
+
+    def memory(self) -> MemoryUsage:
+        """ Bytes held in the ring and by each session's sources; see ezmsg.panel.memory """
+        sessions: Dict[str, int] = {}
+        for sid, cds in self.STATE.sources.values():
+            sessions[sid] = sessions.get(sid, 0) + nbytes(cds.data)
+        buffers = dict(ring = nbytes(self.STATE.ring))
+        if self.STATE.spectra is not self.STATE.ring:
+            buffers['spectra'] = nbytes(self.STATE.spectra)
+        return dict(buffers = buffers, sessions = sessions)
+
+    def latency(self) -> Dict[str, Any]:
+        """ Display latency percentiles; see LatencyMonitor.summary """
+        return self.STATE.latency.summary()
+
+    @property
+    def controls(self) -> List[panel.viewable.Viewable]:
+        return [
+            self.STATE.channel,
+            self.STATE.rescale,
+            '__Display Latency__',
+            self.STATE.latency.view(),
+        ]
+
+    def panel(self) -> panel.viewable.Viewable:
+        return panel.Row(
+            self.plot(),
+            panel.Column(
+                "__Spectrogram Controls__",
+                *self.controls
+            )
+        )
+
+    @ez.subscriber(INPUT_SPECTRUM_SETTINGS)
+    async def on_spectrum_settings(self, msg: SpectrumSettings) -> None:
+        if msg.transform == self.STATE.transform:
+            return
+        units = self.units(self.STATE.transform)
+        self.STATE.transform = msg.transform
+        if self.units(msg.transform) != units:
+            # Columns already in the ring can't be compared with the new ones
+            self.STATE.ring = self.allocate(self.STATE.ring.shape[0])
+            self.STATE.levels = self.default_levels()
+
+    @ez.subscriber(INPUT_SIGNAL)
+    @instrument
+    async def on_signal(self, msg: AxisArray) -> None:
+        win_axis, freq_axis = self.SETTINGS.win_axis, self.SETTINGS.freq_axis
+        if win_axis not in msg.dims or freq_axis not in msg.dims:
+            return
+        self.STATE.latency.ingested(message_time(msg, win_axis))
+
+        # (win, freq, ch...)
+        data = np.moveaxis(msg.data, [msg.get_axis_idx(win_axis), msg.get_axis_idx(freq_axis)], [0, 1])
+        data = data.reshape(data.shape[0], data.shape[1], -1)
+        if data.shape[0] == 0:
+            return
+
+        n_ch = data.shape[2]
+        if len(self.STATE.channel.options) != n_ch + 1:
+            ch_names = getattr(msg, 'ch_names', None)
+            if ch_names is None:
+                ch_names = [f'ch_{i}' for i in range(n_ch)]
+            self.STATE.channel.options = { 'Mean': MEAN_CHANNEL, **{ name: idx for idx, name in enumerate(ch_names) } }
+
+        ch_idx = self.STATE.channel.value
+        spectra = data.mean(axis = 2) if ch_idx == MEAN_CHANNEL else data[:, :, ch_idx]
+        spectra = spectra[-self.SETTINGS.n_columns:] # (win, freq)
+        if self.SETTINGS.db and self.STATE.transform == SpectralTransform.REL_POWER: # REL_DB already is
+            spectra = 10.0 * np.log10(np.maximum(spectra, TINY))
+        values = spectra.astype(np.float32)
+
+        if self.STATE.levels is None:
+            low, high = np.percentile(values, LEVEL_PERCENTILES)
+            self.STATE.levels = (float(low), float(high) if high > low else float(low) + 1.0)
+
+        freq = msg.get_axis(freq_axis)
+        self.STATE.freq = (freq.offset, freq.gain)
+        self.STATE.shift = msg.get_axis(win_axis).gain
+        if self.STATE.ring.shape[0] != values.shape[1]:
+            self.STATE.ring = self.allocate(values.shape[1])
+
+        columns = (self.STATE.n_written + np.arange(values.shape[0])) % self.SETTINGS.n_columns
+        self.STATE.spectra[:, columns] = values.T
+        if self.SETTINGS.quantize:
+            if self.STATE.ring_levels != self.STATE.levels:
+                # Requantize every column written, so the ring never mixes columns quantized with different levels
+                written = min(self.STATE.n_written + values.shape[0], self.SETTINGS.n_columns)
+                self.STATE.ring[:, :written] = quantize(self.STATE.spectra[:, :written], self.STATE.levels)
+                self.STATE.ring_levels = self.STATE.levels
+                self.STATE.generation += 1 # Sessions resend it whole
+            else:
+                self.STATE.ring[:, columns] = quantize(values.T, self.STATE.levels)
+        self.STATE.n_written += values.shape[0]
+        self.STATE.data_time = time.time()
+
+
+class SpectrogramPlotSettings(ez.Settings):
+    name: str = 'Spectrogram'
+    time_axis: Optional[str] = None # If none, use dim 0
+    freq_axis: str = 'freq'
+    window_dur: float = 1.0 # sec
+    window_shift: float = 0.25 # sec; one column per shift
+    n_columns: int = 240
+    db: bool = True
+    quantize: bool = False
+    levels: Optional[Tuple[float, float]] = None
+    render_latency: bool = False
+
+
+class SpectrogramPlot(ez.Collection, Tab):
+    """ SpectrumPlot's Window -> Spectrum chain into a WaterfallPlot """
+
+    SETTINGS = SpectrogramPlotSettings
+
+    INPUT_SIGNAL = ez.InputStream(AxisArray)
+
+    SPECTRUM_CONTROL = SpectrumControl()
+    WINDOW = Window()
+    SPECTRUM = Spectrum()
+    PLOT = WaterfallPlot()
+
+    def configure(self) -> None:
+        self.PLOT.apply_settings(
+            WaterfallPlotSettings(
+                name = self.SETTINGS.name,
+                freq_axis = self.SETTINGS.freq_axis,
+                n_columns = self.SETTINGS.n_columns,
+                db = self.SETTINGS.db,
+                quantize = self.SETTINGS.quantize,
+                levels = self.SETTINGS.levels,
+                render_latency = self.SETTINGS.render_latency,
+            )
+        )
+
+        spectrum_settings = SpectrumSettings(
+            axis = self.SETTINGS.time_axis,
+            out_axis = self.SETTINGS.freq_axis,
+            transform = SpectralTransform.REL_POWER # The plot takes dB itself, if asked to
+        )
+
+        self.SPECTRUM.apply_settings(spectrum_settings)
+
+        window_settings = WindowSettings(
+            axis = self.SETTINGS.time_axis,
+            window_dur = self.SETTINGS.window_dur,
+            window_shift = self.SETTINGS.window_shift
+        )
+
+        self.WINDOW.apply_settings(window_settings)
+
+        self.SPECTRUM_CONTROL.apply_settings(
+            SpectrumControlSettings(
+                spectrum_settings = spectrum_settings,
+                window_settings = window_settings
+            )
+        )
+
+    @property
+    def title(self) -> str:
+        return self.SETTINGS.name
+
+    def content(self) -> panel.viewable.Viewable:
+        return self.PLOT.plot()
+
+    def sidebar(self) -> panel.viewable.Viewable:
+        return panel.Column(
+            "__Spectrogram Controls__",
+            *self.PLOT.controls,
+            '__Spectrum Settings__',
+            *self.SPECTRUM_CONTROL.controls
+        )
+
+    def panel(self) -> panel.viewable.Viewable:
+        return panel.Row(
+            self.content(),
+            self.sidebar()
+        )
+
+    def network(self) -> ez.NetworkDefinition:
+        return (
+            (self.SPECTRUM_CONTROL.OUTPUT_SPECTRUM_SETTINGS, self.SPECTRUM.INPUT_SETTINGS),
+            (self.SPECTRUM_CONTROL.OUTPUT_SPECTRUM_SETTINGS, self.PLOT.INPUT_SPECTRUM_SETTINGS),
+            (self.SPECTRUM_CONTROL.OUTPUT_WINDOW_SETTINGS, self.WINDOW.INPUT_SETTINGS),
+            (self.INPUT_SIGNAL, self.WINDOW.INPUT_SIGNAL),
+            (self.WINDOW.OUTPUT_SIGNAL, self.SPECTRUM.INPUT_SIGNAL),
+            (self.SPECTRUM.OUTPUT_SIGNAL, self.PLOT.INPUT_SIGNAL)
+        )
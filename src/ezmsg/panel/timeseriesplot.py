@@ -93,6 +93,7 @@ class TimeSeriesPlot(ez.Collection, Tab):
     SETTINGS = TimeSeriesPlotSettings
 
     INPUT_SIGNAL = ez.InputStream(AxisArray)
+    OUTPUT_ACK = ez.OutputStream(int) # Connect to Replay.INPUT_ACK to pace replay to this plot
 
     BPFILT = ButterworthFilter()
     QUEUE = MessageQueue(MessageQueueSettings(maxsize = 10, leaky = True))
@@ -128,6 +129,7 @@ class TimeSeriesPlot(ez.Collection, Tab):
             (self.INPUT_SIGNAL, self.BPFILT.INPUT_SIGNAL),
             (self.BPFILT.OUTPUT_SIGNAL, self.QUEUE.INPUT),
             (self.QUEUE.OUTPUT, self.PLOT.INPUT_SIGNAL),
+            (self.PLOT.OUTPUT_ACK, self.OUTPUT_ACK),
         )
 
     def panel(self) -> panel.viewable.Viewable:
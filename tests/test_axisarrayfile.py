@@ -0,0 +1,33 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from ezmsg.util.messages.axisarray import AxisArray
+
+from ezmsg.panel.batchwriter import Compression
+from ezmsg.panel.recording import RecordingFormat, open_reader, open_writer, recording_suffix
+
+
+@pytest.mark.parametrize('compression', list(Compression))
+def test_round_trip(tmp_path: Path, compression: Compression):
+    path = tmp_path / f'rec{recording_suffix(RecordingFormat.AXISARRAY, compression)}'
+    writer = open_writer(path, RecordingFormat.AXISARRAY, compression = compression)
+
+    msgs = []
+    for i in range(4):
+        # Time on the second axis, so the reader must move it back
+        data = np.arange(3 * 5, dtype = np.float32).reshape(3, 5) + 100 * i
+        msg = AxisArray(data, dims = ['ch', 'time'], axes = dict(time = AxisArray.Axis.TimeAxis(fs = 50.0, offset = 0.1 * i)))
+        writer.write(msg, ts = 10.0 + i)
+        msgs.append(msg)
+    writer.close()
+
+    reader = open_reader(path)
+    assert len(reader) == len(msgs)
+    np.testing.assert_array_equal(reader.timestamps, [10.0, 11.0, 12.0, 13.0])
+    for (ts, msg), expected in zip(reader.iter_from(1), msgs[1:]):
+        assert msg.dims == ['ch', 'time']
+        np.testing.assert_array_equal(msg.data, expected.data)
+        assert msg.axes['time'].offset == pytest.approx(expected.axes['time'].offset)
+        assert msg.axes['time'].gain == pytest.approx(1 / 50.0)
@@ -0,0 +1,37 @@
+from pathlib import Path
+
+import pytest
+
+from ezmsg.panel.batchwriter import BatchWriter, Compression
+
+
+@pytest.mark.parametrize('compression', list(Compression))
+def test_close_drains_queued_writes(tmp_path: Path, compression: Compression):
+    path = tmp_path / f'data.bin{compression.suffix}'
+    # Batches are never big or old enough to go out on their own; only close() writes them
+    writer = BatchWriter(path, batch_bytes = 1 << 30, batch_interval = 60.0, compression = compression)
+
+    chunks = [bytes([i]) * 1000 for i in range(50)]
+    for chunk in chunks:
+        writer.write(chunk)
+        writer.flush()
+    assert writer.depth > 0
+    assert writer.bytes_queued == sum(len(chunk) for chunk in chunks)
+
+    writer.close()
+    assert writer.depth == 0
+    assert writer.lag == 0.0
+    with compression.open(path, 'rb') as f:
+        assert f.read() == b''.join(chunks)
+
+
+def test_batches_concatenate(tmp_path: Path):
+    path = tmp_path / 'data.bin.gz'
+    # Every write is its own compressed member
+    writer = BatchWriter(path, batch_bytes = 1, compression = Compression.GZIP)
+    for i in range(10):
+        writer.write(f'{i}\n'.encode())
+    writer.close()
+
+    with Compression.GZIP.open(path, 'rb') as f:
+        assert f.read().decode().split() == [str(i) for i in range(10)]
@@ -0,0 +1,25 @@
+from pathlib import Path
+
+from ezmsg.panel.catalog import RecordingCatalog, RecordingInfo
+
+
+def test_search_matches_wildcards_literally(tmp_path: Path):
+    catalog = RecordingCatalog(tmp_path)
+    for name in ['100%_done.txt', '100x_done.txt', 'a_b.txt', 'axb.txt']:
+        catalog.add(RecordingInfo(tmp_path / name))
+
+    infos, total = catalog.search('100%')
+    assert total == 1 and infos[0].path.name == '100%_done.txt'
+
+    infos, total = catalog.search('a_b')
+    assert total == 1 and infos[0].path.name == 'a_b.txt'
+
+
+def test_refresh_leaves_unsettled_files(tmp_path: Path):
+    catalog = RecordingCatalog(tmp_path)
+    (tmp_path / 'rec.txt').write_text('')
+
+    assert catalog.refresh(settle = 60.0) == 0
+    assert catalog.search()[1] == 0
+    assert catalog.refresh() == 1
+    assert catalog.search()[1] == 1
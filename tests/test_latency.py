@@ -0,0 +1,41 @@
+from bokeh.document import Document
+from bokeh.models import ColumnDataSource
+from panel.io.state import set_curdoc
+
+from ezmsg.panel.latency import LatencyMonitor
+from ezmsg.panel.scheduler import FrameScheduler
+
+
+def test_render_latency_is_opt_in():
+    doc = Document()
+    with set_curdoc(doc):
+        monitor = LatencyMonitor()
+        source = ColumnDataSource()
+        sent = monitor.track(source)
+        sent([0.0])
+        assert source.tags == []
+        assert not source.js_property_callbacks
+        assert list(monitor.summary()['sessions'].values())[0].keys() == {'send'}
+
+        monitor = LatencyMonitor(render = True)
+        source = ColumnDataSource()
+        sent = monitor.track(source)
+        sent([0.0])
+        assert source.tags == [1]
+        assert 'change:tags' in source.js_property_callbacks
+
+
+def test_view_refreshes_from_frame_scheduler():
+    doc = Document()
+    with set_curdoc(doc):
+        n_callbacks = len(doc.session_callbacks)
+        monitor = LatencyMonitor()
+        monitor.view(period = 0)
+        monitor.view(period = 0)
+        # Both views share the session's one periodic callback
+        assert len(doc.session_callbacks) == n_callbacks + 1
+        plots = FrameScheduler.current().plots
+        assert len(plots) == 2 and all(plot.pending() for plot in plots)
+
+    for callback in list(doc.session_destroyed_callbacks):
+        callback(None)
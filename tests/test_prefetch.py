@@ -0,0 +1,75 @@
+import asyncio
+
+from pathlib import Path
+
+from ezmsg.panel.prefetch import Prefetcher
+from ezmsg.panel.recording import RecordingFormat, open_reader, open_writer
+
+
+def write_text(path: Path, n: int) -> None:
+    writer = open_writer(path, RecordingFormat.TEXT)
+    for i in range(n):
+        writer.write(i, ts = float(i))
+    writer.close()
+
+
+async def drain(prefetcher: Prefetcher):
+    records = []
+    while (record := await prefetcher.get()) is not None:
+        records.append(record)
+    await prefetcher.close()
+    return records
+
+
+def test_order_across_chunks(tmp_path: Path):
+    path = tmp_path / 'rec.txt'
+    write_text(path, 50)
+    reader = open_reader(path)
+
+    async def run():
+        # Chunks of 7 from record 5 (message 4): boundaries fall mid-recording and the last chunk is short
+        prefetcher = Prefetcher(reader, 5, chunk_size = 7, max_chunks = 2)
+        records = await drain(prefetcher)
+        assert prefetcher.buffered == 0
+        return records
+
+    records = asyncio.run(run())
+    assert [obj for _, obj in records] == list(range(4, 50))
+    assert [ts for ts, _ in records] == [float(i) for i in range(4, 50)]
+
+
+def test_reader_reusable_after_close(tmp_path: Path):
+    path = tmp_path / 'rec.txt'
+    write_text(path, 50)
+    reader = open_reader(path)
+
+    async def run():
+        prefetcher = Prefetcher(reader, 0, chunk_size = 4, max_chunks = 2)
+        for _ in range(6):
+            await prefetcher.get()
+        await prefetcher.close()
+        # Seek elsewhere with the same reader, as scrubbing does
+        return await drain(Prefetcher(reader, 30, chunk_size = 4, max_chunks = 2))
+
+    assert [obj for _, obj in asyncio.run(run())] == list(range(29, 50))
+
+
+def test_merged_order(tmp_path: Path):
+    from ezmsg.panel.prefetch import MergedPrefetcher
+    from ezmsg.panel.recording import open_merged
+
+    paths = [tmp_path / 'a.txt', tmp_path / 'b.txt']
+    for path, offset in zip(paths, (0.0, 0.5)):
+        writer = open_writer(path, RecordingFormat.TEXT)
+        for i in range(20):
+            writer.write(i + offset, ts = i + offset)
+        writer.close()
+    reader = open_merged(paths)
+
+    async def run():
+        prefetchers = [Prefetcher(r, s, chunk_size = 3, max_chunks = 1) for r, s in zip(reader.readers, reader.starts(4))]
+        return await drain(MergedPrefetcher(prefetchers))
+
+    # A LogStart carries its recording's first timestamp,
+    # so merged records 0-3 are each recording's LogStart and first message
+    assert [obj for _, obj in asyncio.run(run())] == [i / 2 for i in range(2, 40)]
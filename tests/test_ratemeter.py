@@ -0,0 +1,21 @@
+from ezmsg.panel.ratemeter import RateMeter
+
+
+def test_steady_rate_includes_partial_bucket():
+    meter = RateMeter(window = 2.0, n_buckets = 20)
+    meter.reset(now = 0.0)
+    for i in range(1000):
+        meter.update(now = i * 0.01)
+
+    # Midway through a bucket, the current bucket's messages count over the time it has run
+    assert abs(meter.msg_rate(now = 9.995) - 100.0) < 1.0
+
+
+def test_rate_before_window_fills():
+    meter = RateMeter(window = 2.0, n_buckets = 20)
+    meter.reset(now = 0.0)
+    for i in range(50):
+        meter.update(n_samples = 10, now = i * 0.01)
+
+    assert abs(meter.msg_rate(now = 0.5) - 100.0) < 1.0
+    assert abs(meter.sample_rate(now = 0.5) - 1000.0) < 10.0
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+from pathlib import Path
+
+import numpy as np
+
+from ezmsg.util.messages.axisarray import AxisArray
+
+from ezmsg.panel.recorder import RecorderSettings, RecordingLogger
+from ezmsg.panel.recording import open_reader
+
+
+def test_pretriggered_timestamps_nondecreasing(tmp_path: Path):
+    logger = RecordingLogger(RecorderSettings(data_dir = tmp_path, pretrigger_dur = 10.0))
+    logger._instantiate_state()
+    logger.initialize()
+
+    for _ in range(5):
+        logger.write(AxisArray(np.zeros((10, 2)), dims = ['time', 'ch']))
+        time.sleep(0.01)
+
+    path = tmp_path / 'rec.txt'
+    logger.open_file(path)
+    logger.write(AxisArray(np.ones((10, 2)), dims = ['time', 'ch']))
+    asyncio.run(logger.close_file(path))
+
+    timestamps = [ts for ts, _ in open_reader(path)]
+    assert len(timestamps) == 7 # LogStart, 5 pre-trigger messages, 1 live message
+    assert all(np.diff(timestamps) >= 0)
+
+
+def test_multi_recorder_declares_taggers(tmp_path: Path):
+    from ezmsg.panel.recorder import MultiRecorderSettings, StreamTagger, multi_recorder
+
+    EEGRecorder = multi_recorder('EEGRecorder', eeg = AxisArray, markers = str)
+    recorder = EEGRecorder(MultiRecorderSettings(data_dir = tmp_path))
+
+    assert recorder.stream_names == ('eeg', 'markers')
+    assert [tagger.name for tagger in recorder.taggers] == ['TAG_EEG', 'TAG_MARKERS']
+    assert [tagger.SETTINGS.sid for tagger in recorder.taggers] == [0, 1]
+    assert all(isinstance(comp, StreamTagger) for name, comp in recorder.components.items() if name.startswith('TAG_'))
+
+    edges = list(recorder.network())
+    assert (recorder.INPUT_EEG, recorder.TAG_EEG.INPUT_MESSAGE) in edges
+    assert (recorder.TAG_MARKERS.OUTPUT_TAGGED, recorder.LOGGER.INPUT_TAGGED) in edges
@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import numpy as np
+
+from ezmsg.util.messagecodec import LogStart
+from ezmsg.util.messages.axisarray import AxisArray
+
+from ezmsg.panel.batchwriter import Compression
+from ezmsg.panel.recording import (
+    MANIFEST_SUFFIX, RecordingFormat, SegmentedReader, open_reader, open_writer, read_manifest, recording_paths
+)
+
+
+def test_rotation_manifest(tmp_path: Path):
+    path = tmp_path / f'rec{MANIFEST_SUFFIX}'
+    writer = open_writer(path, RecordingFormat.AXISARRAY, rotate_sec = 1.0)
+    for i in range(10):
+        writer.write(AxisArray(np.full((4, 2), i), dims = ['time', 'ch']), ts = 0.25 * i)
+    writer.close()
+
+    manifest = read_manifest(path)
+    assert manifest['format'] == RecordingFormat.AXISARRAY.name
+    segments = manifest['segments']
+    assert [seg['n_msgs'] for seg in segments] == [4, 4, 2]
+    assert [(seg['start'], seg['end']) for seg in segments] == [(0.0, 0.75), (1.0, 1.75), (2.0, 2.25)]
+    assert all(p.exists() for p in recording_paths(path))
+    assert sum(seg['nbytes'] for seg in segments) == writer.nbytes
+
+    reader = open_reader(path)
+    assert isinstance(reader, SegmentedReader)
+    assert len(reader) == 10
+    np.testing.assert_array_equal(reader.timestamps, 0.25 * np.arange(10))
+    # Start in the middle of the first segment and read across both boundaries
+    assert [int(msg.data[0, 0]) for _, msg in reader.iter_from(2)] == list(range(2, 10))
+    # Chunks stop at segment boundaries
+    _, chunk, n = reader.read_chunk(3, 4)
+    assert n == 1 and int(chunk[0][1].data[0, 0]) == 3
+
+
+def test_rotated_text_segments(tmp_path: Path):
+    path = tmp_path / f'rec{MANIFEST_SUFFIX}'
+    writer = open_writer(path, RecordingFormat.TEXT, compression = Compression.GZIP, rotate_sec = 1.0)
+    for i in range(6):
+        writer.write(i, ts = 0.5 * i)
+    writer.close()
+
+    assert all(p.name.endswith('.txt.gz') for p in recording_paths(path))
+    # Each segment is a self-contained recording that starts with its own LogStart
+    records = list(open_reader(path))
+    assert [obj for _, obj in records if not isinstance(obj, LogStart)] == list(range(6))
+    assert sum(isinstance(obj, LogStart) for _, obj in records) == 3
+
+
+def test_text_index_seek_and_cache(tmp_path: Path, monkeypatch):
+    from ezmsg.panel import recording
+    from ezmsg.panel.recording import TextLogReader, text_index_path
+
+    path = tmp_path / 'rec.txt'
+    writer = open_writer(path, RecordingFormat.TEXT)
+    for i in range(20):
+        writer.write(dict(i = i), ts = float(i))
+    writer.close()
+
+    reader = TextLogReader(path)
+    assert len(reader) == 21 # LogStart, then 20 messages
+    assert text_index_path(path).exists()
+    assert [obj['i'] for _, obj in reader.iter_from(15)] == list(range(14, 20))
+    assert [ts for ts, _ in reader.iter_from(20)] == [19.0]
+    assert list(reader.iter_from(21)) == []
+
+    def rebuilt(path: Path):
+        raise AssertionError('index should have come from the cache')
+
+    with monkeypatch.context() as m:
+        m.setattr(recording, 'build_text_index', rebuilt)
+        cached = TextLogReader(path)
+    np.testing.assert_array_equal(cached.offsets, reader.offsets)
+    np.testing.assert_array_equal(cached.timestamps, reader.timestamps)
+
+    # A stale cache is rebuilt
+    with open(path, 'ab') as f:
+        f.write(recording.encode_record(dict(i = 20), 20.0).encode() + b'\n')
+    assert len(TextLogReader(path)) == 22
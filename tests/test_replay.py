@@ -0,0 +1,90 @@
+import asyncio
+import pickle
+
+from pathlib import Path
+
+import pytest
+import ezmsg.core as ez
+
+from ezmsg.util.messagereplay import FileReplayMessage
+from ezmsg.util.messages.axisarray import AxisArray
+
+from ezmsg.panel.recording import RecordingFormat, open_writer
+from ezmsg.panel.replay import RecordingReplay, ReplaySettings, multi_replay, stream_replay
+
+
+def test_multi_replay_declares_stream_outputs(tmp_path: Path):
+    EEGReplay = multi_replay('EEGReplay', eeg = AxisArray, markers = str)
+    replay = EEGReplay(ReplaySettings(data_dir = tmp_path))
+    replay.configure()
+
+    assert replay.REPLAY.STREAMS == (('eeg', AxisArray), ('markers', str))
+    assert isinstance(replay.REPLAY.OUTPUT_EEG, ez.OutputStream)
+    assert 'OUTPUT_MARKERS' not in RecordingReplay.__streams__
+    assert not any(isinstance(comp, ez.Unit) for name, comp in replay.components.items() if name not in ('GUI', 'REPLAY'))
+
+    edges = list(replay.network())
+    assert (replay.REPLAY.OUTPUT_EEG, replay.OUTPUT_EEG) in edges
+    assert (replay.REPLAY.OUTPUT_MARKERS, replay.OUTPUT_MARKERS) in edges
+
+    # Units go to their processes pickled; the generated class has to survive that
+    clone = pickle.loads(pickle.dumps(replay.REPLAY))
+    assert type(clone) is type(replay.REPLAY)
+    assert clone.SETTINGS == replay.REPLAY.SETTINGS
+    assert list(clone.streams) == list(replay.REPLAY.streams)
+
+
+def test_replay_publishes_streams_directly(tmp_path: Path):
+    path = tmp_path / 'rec.txt'
+    writer = open_writer(path, RecordingFormat.TEXT, streams = ['eeg', 'markers', 'video'])
+    writer.write(1.0, ts = 1.0, sid = 0)
+    writer.write('start', ts = 1.5, sid = 1)
+    writer.write(b'frame', ts = 1.7, sid = 2)
+    writer.write(2.0, ts = 2.0, sid = 0)
+    writer.close()
+
+    replay = stream_replay((('eeg', float), ('markers', str)))(ReplaySettings(data_dir = tmp_path))
+    replay._set_name('REPLAY')
+    replay._set_location([])
+    replay._instantiate_state()
+
+    async def run():
+        await replay.initialize()
+        await replay.queue_file(FileReplayMessage(path, rate = None))
+        published = []
+        async for stream, obj in replay.replay():
+            if stream is replay.OUTPUT_TOTAL:
+                break
+            if stream is not replay.OUTPUT_REPLAY_STATUS:
+                published.append((stream.name, obj))
+        await replay.shutdown()
+        return published
+
+    # The video stream has no output, so it's skipped
+    assert asyncio.run(run()) == [('OUTPUT_EEG', 1.0), ('OUTPUT_MARKERS', 'start'), ('OUTPUT_EEG', 2.0)]
+
+
+def test_late_ack_after_write_off_adds_no_credit(tmp_path: Path):
+    replay = RecordingReplay(ReplaySettings(data_dir = tmp_path, decode_workers = 0, credit_window = 4, credit_timeout = 0.05))
+    replay._set_name('REPLAY')
+    replay._set_location([])
+    replay._instantiate_state()
+
+    async def run() -> None:
+        await replay.initialize()
+        replay.STATE.n_sent = 4
+        await replay.wait_for_credit() # Times out and writes off all 4
+        assert replay.STATE.n_acked == 4 and replay.STATE.unpaced
+
+        # The consumer acks them after all; that restores pacing, but no extra credit
+        await replay.on_ack(4)
+        assert replay.STATE.n_acked == replay.STATE.n_sent == 4
+        assert not replay.STATE.unpaced
+
+        replay.STATE.n_sent += 4
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(replay.wait_for_credit(), 0.01)
+        await replay.on_ack(4)
+        await asyncio.wait_for(replay.wait_for_credit(), 0.01)
+
+    asyncio.run(run())
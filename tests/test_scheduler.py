@@ -0,0 +1,28 @@
+import gc
+import weakref
+
+from bokeh.document import Document
+from panel.io.state import set_curdoc
+
+from ezmsg.panel.scheduler import FrameScheduler
+
+
+def test_destroyed_session_releases_scheduler():
+    doc = Document()
+    with set_curdoc(doc):
+        scheduler = FrameScheduler.current()
+        scheduler.register(lambda: False, lambda: None)
+        assert FrameScheduler.current() is scheduler
+    assert len(FrameScheduler._schedulers) == 1
+
+    for callback in list(doc.session_destroyed_callbacks):
+        callback(None)
+
+    assert len(FrameScheduler._schedulers) == 0
+    assert scheduler.plots == []
+
+    # Nothing the scheduler holds keeps its document alive
+    doc_ref = weakref.ref(doc)
+    del doc
+    gc.collect()
+    assert doc_ref() is None
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+
+import numpy as np
+
+from ezmsg.util.messages.axisarray import AxisArray
+
+from ezmsg.panel.scrollinglineplot import ScrollingLinePlot, ScrollingLinePlotSettings
+
+
+def test_eviction_holds_steady_at_memory_limit(caplog):
+    fs, block, n_ch = 1000.0, 100, 4
+    frame_bytes = (n_ch + 1) * block * 8
+    plot = ScrollingLinePlot(ScrollingLinePlotSettings(time_axis = 'time', memory_limit = 50 * frame_bytes))
+    plot._set_name('PLOT')
+    plot._set_location([])
+    plot._instantiate_state()
+    plot.initialize()
+    plot.STATE.duration.value = 1000.0 # Only the memory limit bounds history
+
+    history = []
+
+    async def run() -> None:
+        for idx in range(500):
+            msg = AxisArray(
+                np.zeros((block, n_ch)),
+                dims = ['time', 'ch'],
+                axes = { 'time': AxisArray.Axis.TimeAxis(fs = fs, offset = idx * block / fs) }
+            )
+            await plot.on_signal(msg)
+            plot.evict()
+            history.append(plot.STATE.max_history)
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(run())
+
+    assert plot.STATE.frame_bytes <= 51 * frame_bytes
+    # Once evicting, hovering just under the limit doesn't lift it (and warn again) every frame
+    first = next(idx for idx, max_history in enumerate(history) if max_history is not None)
+    assert all(max_history is not None for max_history in history[first:])
+    assert sum('evicting' in record.message for record in caplog.records) == 1
+
+
+def test_acks_follow_the_slowest_session():
+    plot = ScrollingLinePlot(ScrollingLinePlotSettings(time_axis = 'time'))
+    plot._set_name('PLOT')
+    plot._set_location([])
+    plot._instantiate_state()
+    plot.initialize()
+
+    def signal(idx: int) -> AxisArray:
+        return AxisArray(np.zeros((10, 2)), dims = ['time', 'ch'], 
+            axes = { 'time': AxisArray.Axis.TimeAxis(fs = 100.0, offset = idx / 10) })
+
+    async def run() -> None:
+        acks = plot.ack()
+        # With no session open, messages are acknowledged as they arrive
+        await plot.on_signal(signal(0))
+        assert await asyncio.wait_for(acks.__anext__(), 1.0) == (plot.OUTPUT_ACK, 1)
+
+        cursor = [plot.STATE.frame_seq]
+        plot.STATE.cursors[id(cursor)] = cursor
+        await plot.on_signal(signal(1))
+        await plot.on_signal(signal(2))
+        next_ack = asyncio.ensure_future(acks.__anext__())
+        await asyncio.sleep(0.1)
+        assert not next_ack.done() # Nothing polls; the session hasn't streamed anything
+
+        cursor[0] = plot.STATE.frame_seq
+        plot.STATE.consumed.set()
+        assert await asyncio.wait_for(next_ack, 1.0) == (plot.OUTPUT_ACK, 2)
+        await acks.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+import asyncio
+
+import numpy as np
+
+from ezmsg.util.messages.axisarray import AxisArray
+from ezmsg.sigproc.spectral import SpectrumSettings, SpectralTransform
+
+from ezmsg.panel.spectrogram import WaterfallPlot, WaterfallPlotSettings, quantize
+
+
+def waterfall(**kwargs) -> WaterfallPlot:
+    plot = WaterfallPlot(WaterfallPlotSettings(n_columns = 16, **kwargs))
+    plot._set_name('PLOT')
+    plot._set_location([])
+    plot._instantiate_state()
+    plot.initialize()
+    return plot
+
+
+def spectra(values: np.ndarray) -> AxisArray:
+    # (win, freq, ch)
+    return AxisArray(values[..., np.newaxis], dims = ['win', 'freq', 'ch'], axes = dict(
+        win = AxisArray.Axis(gain = 0.25), freq = AxisArray.Axis(unit = 'Hz', gain = 2.0)))
+
+
+def test_requantize_when_levels_change():
+    plot = waterfall(quantize = True)
+
+    async def run() -> None:
+        await plot.on_signal(spectra(np.full((4, 8), 1e-3)))
+        await plot.on_signal(spectra(np.geomspace(1e-4, 1e-2, 4 * 8).reshape(4, 8)))
+        first_levels = plot.STATE.levels
+        plot.STATE.rescale.clicks += 1 # New levels come from the next spectra
+        await plot.on_signal(spectra(np.geomspace(1e-2, 1e2, 4 * 8).reshape(4, 8)))
+        assert plot.STATE.levels != first_levels
+
+    asyncio.run(run())
+    written = plot.STATE.n_written
+    np.testing.assert_array_equal(plot.STATE.ring[:, :written], quantize(plot.STATE.spectra[:, :written], plot.STATE.levels))
+    assert not plot.STATE.ring[:, written:].any()
+
+
+def test_db_input_is_not_converted_again():
+    plot = waterfall()
+    power = np.geomspace(1e-6, 1.0, 2 * 8).reshape(2, 8)
+
+    async def run() -> None:
+        await plot.on_signal(spectra(power))
+        np.testing.assert_allclose(plot.STATE.spectra[:, :2], 10 * np.log10(power.T), rtol = 1e-5)
+
+        # Power plotted in dB and dB input are the same units, so the columns so far are kept
+        await plot.on_spectrum_settings(SpectrumSettings(transform = SpectralTransform.REL_DB))
+        await plot.on_signal(spectra(10 * np.log10(power)))
+        assert plot.STATE.n_written == 4
+        np.testing.assert_allclose(plot.STATE.spectra[:, 2:4], 10 * np.log10(power.T), rtol = 1e-5)
+
+        # Other units start over
+        await plot.on_spectrum_settings(SpectrumSettings(transform = SpectralTransform.REAL))
+        assert plot.STATE.n_written == 0 and plot.STATE.levels is None
+
+    asyncio.run(run())